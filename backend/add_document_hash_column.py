@@ -0,0 +1,54 @@
+"""
+Script to add the sha256 column to an existing documents table and fill it
+in for documents uploaded before uploads were hashed.
+"""
+
+import hashlib
+import os
+from models.database import SessionLocal
+from models.document import Document
+from models.project import Project
+from services.file_service import document_path
+from sqlalchemy import text
+
+def add_document_hash_column():
+    """Add documents.sha256 and backfill it from the uploaded files"""
+
+    print("🔄 Adding sha256 column to documents table...")
+
+    db = SessionLocal()
+
+    try:
+        columns = {col[1] for col in db.execute(text("PRAGMA table_info(documents)")).fetchall()}
+        if "sha256" in columns:
+            print("  ℹ️  Documents table already has sha256 column")
+        else:
+            db.execute(text("ALTER TABLE documents ADD COLUMN sha256 VARCHAR"))
+            db.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_sha256 ON documents (sha256)"))
+            db.commit()
+            print("  ✅ Added sha256 column to documents table")
+
+        documents = db.query(Document, Project.user_id).join(Project).filter(Document.sha256.is_(None)).all()
+        print(f"📄 Hashing {len(documents)} existing uploads...")
+        for doc, user_id in documents:
+            path = document_path(user_id, doc)
+            if not os.path.exists(path):
+                print(f"  ❌ Document {doc.id}: file missing")
+                continue
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            doc.sha256 = digest.hexdigest()
+        db.commit()
+        print("✅ Document hashes filled in!")
+
+    except Exception as e:
+        print(f"❌ Error adding sha256 column: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    add_document_hash_column()
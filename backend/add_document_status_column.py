@@ -0,0 +1,44 @@
+"""
+Script to add the ingestion status columns to an existing documents table.
+Existing documents start out pending and are ingested when the API next starts.
+"""
+
+from models.database import SessionLocal
+from sqlalchemy import text
+
+def add_document_status_column():
+    """Add documents.status, documents.error, documents.token_count and documents.raw_token_count"""
+
+    print("🔄 Adding ingestion status columns to documents table...")
+
+    db = SessionLocal()
+
+    try:
+        columns = {col[1] for col in db.execute(text("PRAGMA table_info(documents)")).fetchall()}
+        new_columns = {
+            "status": "VARCHAR NOT NULL DEFAULT 'pending'",
+            "error": "VARCHAR",
+            "token_count": "INTEGER",
+            "raw_token_count": "INTEGER",
+        }
+        for name, definition in new_columns.items():
+            if name in columns:
+                print(f"  ℹ️  Documents table already has {name} column")
+                continue
+            db.execute(text(f"ALTER TABLE documents ADD COLUMN {name} {definition}"))
+            print(f"  ✅ Added {name} column to documents table")
+        db.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_status ON documents (status)"))
+        db.commit()
+
+        pending = db.execute(text("SELECT COUNT(*) FROM documents WHERE status = 'pending'")).scalar()
+        print(f"✅ Ingestion status columns ready! {pending} documents will be ingested on next start")
+
+    except Exception as e:
+        print(f"❌ Error adding status columns: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    add_document_status_column()
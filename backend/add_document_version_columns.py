@@ -0,0 +1,39 @@
+"""
+Script to add the version columns to an existing documents table, for
+replacing a document's file with a new version (PUT /documents/{id}).
+"""
+
+from models.database import SessionLocal
+from sqlalchemy import text
+
+def add_document_version_columns():
+    """Add documents.version and documents.previous_text_sha256"""
+
+    print("🔄 Adding version columns to documents table...")
+
+    db = SessionLocal()
+
+    try:
+        columns = {col[1] for col in db.execute(text("PRAGMA table_info(documents)")).fetchall()}
+        new_columns = {
+            "version": "INTEGER NOT NULL DEFAULT 1",
+            "previous_text_sha256": "VARCHAR",
+        }
+        for name, definition in new_columns.items():
+            if name in columns:
+                print(f"  ℹ️  Documents table already has {name} column")
+                continue
+            db.execute(text(f"ALTER TABLE documents ADD COLUMN {name} {definition}"))
+            print(f"  ✅ Added {name} column to documents table")
+        db.commit()
+        print("✅ Version columns ready!")
+
+    except Exception as e:
+        print(f"❌ Error adding version columns: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    add_document_version_columns()
@@ -0,0 +1,36 @@
+"""
+Script to index documents.project_id and podcasts.project_id on an existing database.
+Project listings count documents and podcasts per project, which these indexes keep cheap.
+"""
+
+from models.database import SessionLocal
+from sqlalchemy import text
+
+def add_project_id_indexes():
+    """Create ix_documents_project_id and ix_podcasts_project_id if they are missing"""
+
+    print("🔄 Adding project_id indexes...")
+
+    db = SessionLocal()
+
+    try:
+        for table in ("documents", "podcasts"):
+            index_name = f"ix_{table}_project_id"
+            existing = {row[1] for row in db.execute(text(f"PRAGMA index_list({table})")).fetchall()}
+            if index_name in existing:
+                print(f"  ℹ️  {table} table already has {index_name}")
+                continue
+            db.execute(text(f"CREATE INDEX {index_name} ON {table} (project_id)"))
+            print(f"  ✅ Created {index_name}")
+        db.commit()
+        print("✅ Project id indexes ready!")
+
+    except Exception as e:
+        print(f"❌ Error adding project_id indexes: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    add_project_id_indexes()
@@ -1,6 +1,9 @@
-from fastapi import FastAPI
-from routers import auth, documents, generate as generate_router, projects, chat
+from fastapi import Depends, FastAPI
+from routers import auth, documents, generate as generate_router, projects, chat, admin
 from routers.tts import router as tts_router
+from models.database import get_db
+from services.extraction import start_extraction_pool
+from services.ingestion import resume_ingestion
 import uvicorn
 
 from fastapi.middleware.cors import CORSMiddleware
@@ -8,7 +11,9 @@ from fastapi.middleware.cors import CORSMiddleware
 app = FastAPI(
     title="Notecast API",
     description="Backend for the Notecast application",
-    version="1.0.0"
+    version="1.0.0",
+    # One database session per request, shared by every model helper the request calls
+    dependencies=[Depends(get_db)]
 )
 
 app.add_middleware(
@@ -23,6 +28,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def start_extraction_workers():
+    start_extraction_pool()
+
+@app.on_event("startup")
+def resume_document_ingestion():
+    # Documents uploaded just before a restart (or by older versions) still need processing
+    resume_ingestion()
+
 # Health check endpoints
 @app.get("/health", tags=["Health"])
 async def health_check():
@@ -39,6 +53,7 @@ app.include_router(documents.router)          # router already has prefix
 app.include_router(generate_router.router)
 app.include_router(chat.router)               # Add chat router
 app.include_router(tts_router)
+app.include_router(admin.router)
 
 if __name__ == "__main__":
     uvicorn.run(
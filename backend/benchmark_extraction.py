@@ -0,0 +1,96 @@
+"""
+Benchmark PDF text extraction: the original serial get_document_text loop
+against services.extraction.extract_pdf, on synthetic PDFs of increasing size.
+
+    python benchmark_extraction.py [page counts...]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append('.')
+
+from PyPDF2 import PdfReader
+from services.extraction import extract_pdf, _extract_workers
+
+WORDS = ("podcast document summary section analysis result method figure table value "
+         "chapter model data study evidence review context signal process system").split()
+
+
+def build_pdf(path: str, pages: int, lines_per_page: int = 45):
+    """Write a minimal text-only PDF with Helvetica text on every page"""
+    rng = random.Random(pages)
+    objects = []  # bodies of objects 1..n
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # filled in once the page tree exists
+    pages_id = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for _ in range(pages):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        text = " T* ".join(f"({line}) Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 40 800 Td {text} ET".encode()
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font, content)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+    kids = b" ".join(b"%d 0 R" % pid for pid in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def legacy_extract(path: str) -> str:
+    """The extraction loop get_document_text used before the extraction engine"""
+    reader = PdfReader(path)
+    text = ""
+    for page in reader.pages:
+        content = page.extract_text() or ""
+        text += content + "\n"
+    return text
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def run_benchmark(page_counts):
+    print(f"📊 PDF extraction benchmark ({_extract_workers()} workers)")
+    print(f"{'pages':>7} {'serial (s)':>12} {'engine (s)':>12} {'speedup':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in page_counts:
+            path = os.path.join(tmp, f"synthetic_{pages}.pdf")
+            build_pdf(path, pages)
+            extract_pdf(path)  # warm up the process pool outside the measurement
+            legacy_text, legacy_seconds = timed(legacy_extract, path)
+            (text, offsets), engine_seconds = timed(extract_pdf, path)
+            assert text == legacy_text, f"extracted text differs for {pages} pages"
+            assert len(offsets) == pages
+            print(f"{pages:>7} {legacy_seconds:>12.2f} {engine_seconds:>12.2f} {legacy_seconds / engine_seconds:>8.1f}x")
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or [50, 200, 800]
+    run_benchmark(counts)
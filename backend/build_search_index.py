@@ -0,0 +1,51 @@
+"""
+Script to (re)build the full-text search index for all existing documents and podcasts.
+New uploads, generations and deletions keep the index up to date on their own;
+run this once after upgrading, or to repair the index.
+"""
+
+import json
+from models.database import SessionLocal
+from models.document import Document
+from models.project import Project
+from sqlalchemy import text
+from services.file_service import get_document_text
+from services import search
+
+def build_search_index():
+    """Index every document's text and every podcast's script"""
+
+    print("🔄 Building search index...")
+
+    db = SessionLocal()
+
+    try:
+        documents = db.query(Document, Project.user_id).join(Project).all()
+        print(f"📄 Indexing {len(documents)} documents...")
+        for doc, user_id in documents:
+            try:
+                body = get_document_text(user_id, doc)
+                search.index_document_text(doc.project_id, doc.id, doc.orig_filename, body)
+            except Exception as e:
+                print(f"  ❌ Document {doc.id} ({doc.orig_filename}): {e}")
+
+        columns = {col[1] for col in db.execute(text("PRAGMA table_info(podcasts)")).fetchall()}
+        timings_column = ", segment_timings" if "segment_timings" in columns else ""
+        podcasts = db.execute(text(f"SELECT id, project_id, title, script_text{timings_column} FROM podcasts")).fetchall()
+        print(f"🎙️  Indexing {len(podcasts)} podcasts...")
+        for pod in podcasts:
+            timings = None
+            if timings_column and pod._mapping["segment_timings"]:
+                try:
+                    timings = json.loads(pod._mapping["segment_timings"])
+                except (json.JSONDecodeError, TypeError):
+                    timings = None
+            search.index_podcast_script(pod.project_id, pod.id, pod.title, pod.script_text, timings)
+
+        print("✅ Search index built!")
+
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    build_search_index()
@@ -9,6 +9,15 @@ try:
         # add all the vars you reference
         access_token_expire_minutes: int = 60
         algorithm: str = "HS256"
+        # database connection pool: connections kept open, extra ones allowed under load,
+        # seconds to wait for a free connection, and seconds before a connection is recycled
+        db_pool_size: int = 5
+        db_max_overflow: int = 10
+        db_pool_timeout: float = 30.0
+        db_pool_recycle: int = 1800
+        # SQLite: seconds a connection waits for another writer's lock
+        db_busy_timeout: float = 30.0
+
         upload_dir: str = "./data/uploads"
         text_dir: str = "./data/text"
         podcast_dir: str = "./data/podcasts"
@@ -18,6 +27,63 @@ try:
         tts_voice_male: str
         tts_sample_rate: int
 
+        # uploads larger than this are rejected mid-stream; batch uploads take at most max_batch_files files
+        max_upload_mb: int = 100
+        max_batch_files: int = 50
+        # resumable uploads: largest chunk, and how long an idle session is kept
+        upload_chunk_mb: int = 8
+        upload_session_ttl_hours: int = 24
+
+        # text extraction: PDFs with this many pages are split across a process pool (0 workers = CPU count)
+        extract_workers: int = 0
+        extract_parallel_min_pages: int = 16
+
+        # ingestion: documents processed at once after upload, and whether chunks are embedded up front
+        ingest_workers: int = 2
+        ingest_embed: bool = True
+        # ingestion cleanup: running headers/footers, page numbers, hyphenation; optionally the references section
+        text_cleanup: bool = True
+        text_cleanup_drop_references: bool = False
+
+        # batch generation: documents scripted by the LLM at the same time
+        batch_llm_concurrency: int = 2
+
+        # LLM client: read timeouts per stage, retries and connection pooling
+        llm_connect_timeout: float = 10.0
+        llm_summary_timeout: float = 120.0
+        llm_script_timeout: float = 240.0
+        llm_chat_timeout: float = 120.0
+        llm_max_retries: int = 2
+        llm_retry_backoff: float = 0.5
+        llm_max_concurrency: int = 4
+        llm_pool_size: int = 10
+
+        # LLM endpoints: JSON list of {"url", "model", "stages", "max_concurrency"}; empty = ollama_url only
+        llm_endpoints: str = ""
+        llm_health_interval: float = 15.0
+        llm_breaker_threshold: int = 3
+        llm_breaker_cooldown: float = 30.0
+
+        # documents above this many tokens are summarized map-reduce in chunks
+        summary_context_tokens: int = 6000
+        summary_min_chunk_tokens: int = 1024
+
+        # scripts: above 1, outline the episode and write this many sections concurrently
+        script_sections: int = 0
+
+        # retrieval for chat: chunk embeddings per project (empty embed model = local hashing embeddings)
+        index_dir: str = "./data/index"
+        ollama_embed_model: str = ""
+        rag_chunk_tokens: int = 400
+        rag_chunk_overlap_tokens: int = 50
+        rag_top_k: int = 6
+
+        # chat sessions: history above this many tokens is folded into a rolling summary
+        chat_history_token_budget: int = 3000
+
+        # comma-separated usernames allowed to call /admin endpoints
+        admin_usernames: str = ""
+
         model_config = SettingsConfigDict(
             env_file=".env",
             case_sensitive=False,
@@ -33,14 +99,52 @@ except ImportError:
         debug: bool       = Field(False, env="DEBUG")
         access_token_expire_minutes: int = Field(60, env="ACCESS_TOKEN_EXPIRE_MINUTES")
         algorithm: str    = Field("HS256", env="ALGORITHM")
+        db_pool_size: int = Field(5, env="DB_POOL_SIZE")
+        db_max_overflow: int = Field(10, env="DB_MAX_OVERFLOW")
+        db_pool_timeout: float = Field(30.0, env="DB_POOL_TIMEOUT")
+        db_pool_recycle: int = Field(1800, env="DB_POOL_RECYCLE")
+        db_busy_timeout: float = Field(30.0, env="DB_BUSY_TIMEOUT")
         upload_dir: str   = Field("./data/uploads", env="UPLOAD_DIR")
         text_dir: str     = Field("./data/text", env="TEXT_DIR")
         podcast_dir: str  = Field("./data/podcasts", env="PODCAST_DIR")
+        max_upload_mb: int = Field(100, env="MAX_UPLOAD_MB")
+        max_batch_files: int = Field(50, env="MAX_BATCH_FILES")
+        upload_chunk_mb: int = Field(8, env="UPLOAD_CHUNK_MB")
+        upload_session_ttl_hours: int = Field(24, env="UPLOAD_SESSION_TTL_HOURS")
+        extract_workers: int = Field(0, env="EXTRACT_WORKERS")
+        extract_parallel_min_pages: int = Field(16, env="EXTRACT_PARALLEL_MIN_PAGES")
+        ingest_workers: int = Field(2, env="INGEST_WORKERS")
+        ingest_embed: bool = Field(True, env="INGEST_EMBED")
+        text_cleanup: bool = Field(True, env="TEXT_CLEANUP")
+        text_cleanup_drop_references: bool = Field(False, env="TEXT_CLEANUP_DROP_REFERENCES")
         ollama_url: str   = Field(..., env="OLLAMA_URL")
         ollama_model: str = Field(..., env="OLLAMA_MODEL")
         tts_voice_female: str = Field(..., env="TTS_VOICE_FEMALE")
         tts_voice_male: str   = Field(..., env="TTS_VOICE_MALE")
         tts_sample_rate: int  = Field(..., env="TTS_SAMPLE_RATE")
+        batch_llm_concurrency: int = Field(2, env="BATCH_LLM_CONCURRENCY")
+        llm_connect_timeout: float = Field(10.0, env="LLM_CONNECT_TIMEOUT")
+        llm_summary_timeout: float = Field(120.0, env="LLM_SUMMARY_TIMEOUT")
+        llm_script_timeout: float  = Field(240.0, env="LLM_SCRIPT_TIMEOUT")
+        llm_chat_timeout: float    = Field(120.0, env="LLM_CHAT_TIMEOUT")
+        llm_max_retries: int       = Field(2, env="LLM_MAX_RETRIES")
+        llm_retry_backoff: float   = Field(0.5, env="LLM_RETRY_BACKOFF")
+        llm_max_concurrency: int   = Field(4, env="LLM_MAX_CONCURRENCY")
+        llm_pool_size: int         = Field(10, env="LLM_POOL_SIZE")
+        llm_endpoints: str           = Field("", env="LLM_ENDPOINTS")
+        llm_health_interval: float   = Field(15.0, env="LLM_HEALTH_INTERVAL")
+        llm_breaker_threshold: int   = Field(3, env="LLM_BREAKER_THRESHOLD")
+        llm_breaker_cooldown: float  = Field(30.0, env="LLM_BREAKER_COOLDOWN")
+        summary_context_tokens: int   = Field(6000, env="SUMMARY_CONTEXT_TOKENS")
+        summary_min_chunk_tokens: int = Field(1024, env="SUMMARY_MIN_CHUNK_TOKENS")
+        script_sections: int = Field(0, env="SCRIPT_SECTIONS")
+        index_dir: str = Field("./data/index", env="INDEX_DIR")
+        ollama_embed_model: str = Field("", env="OLLAMA_EMBED_MODEL")
+        rag_chunk_tokens: int = Field(400, env="RAG_CHUNK_TOKENS")
+        rag_chunk_overlap_tokens: int = Field(50, env="RAG_CHUNK_OVERLAP_TOKENS")
+        rag_top_k: int = Field(6, env="RAG_TOP_K")
+        chat_history_token_budget: int = Field(3000, env="CHAT_HISTORY_TOKEN_BUDGET")
+        admin_usernames: str = Field("", env="ADMIN_USERNAMES")
 
         class Config:
             env_file = ".env"
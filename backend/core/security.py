@@ -42,4 +42,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> DBUser:
     user = get_user_by_username(username)
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    return user
+
+
+async def get_current_admin(current_user: DBUser = Depends(get_current_user)) -> DBUser:
+    admins = {name.strip() for name in settings.admin_usernames.split(",") if name.strip()}
+    if current_user.username not in admins:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return current_user
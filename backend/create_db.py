@@ -4,6 +4,9 @@ from models.user import User
 from models.project import Project
 from models.document import Document
 from models.podcast import Podcast
+from models.llm_artifact import LLMArtifact
+from models.chat_session import ChatSession, ChatSessionMessage
+from models.podcast_usage import PodcastUsage
 # Add any other models here...
 
 def init_db():
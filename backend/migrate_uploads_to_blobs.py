@@ -0,0 +1,50 @@
+"""
+Script to move uploads stored per user (upload_dir/<user_id>/<stored_filename>)
+into the content-addressed blob store, where identical files are kept once.
+Run add_document_hash_column.py first so every document has its sha256.
+"""
+
+import os
+from models.database import SessionLocal
+from models.document import Document
+from models.project import Project
+from core.config import settings
+from services.file_service import blob_path, legacy_upload_path
+from services.blob_store import store_blob
+
+def migrate_uploads_to_blobs():
+    """Move every legacy upload to blobs/<aa>/<sha256><ext>, dropping duplicates"""
+
+    print("🔄 Moving uploads into the blob store...")
+
+    db = SessionLocal()
+
+    try:
+        documents = db.query(Document, Project.user_id).join(Project).all()
+        moved = shared = 0
+        for doc, user_id in documents:
+            path = legacy_upload_path(user_id, doc.stored_filename)
+            if not os.path.exists(path):
+                continue
+            if not doc.sha256:
+                print(f"  ❌ Document {doc.id}: no sha256, run add_document_hash_column.py first")
+                continue
+            ext = os.path.splitext(doc.stored_filename)[1].lower()
+            if os.path.exists(blob_path(doc.sha256, ext)):
+                shared += 1
+            else:
+                moved += 1
+            store_blob(path, doc.sha256, ext)
+            # Text extracted per document is re-extracted once per blob on next read
+            for suffix in (".txt", ".json"):
+                text_path = os.path.join(settings.text_dir, str(user_id), doc.stored_filename + suffix)
+                if os.path.exists(text_path):
+                    os.remove(text_path)
+
+        print(f"✅ Moved {moved} uploads, removed {shared} duplicate copies")
+
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate_uploads_to_blobs()
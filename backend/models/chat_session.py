@@ -0,0 +1,130 @@
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy.orm import relationship
+from datetime import datetime
+import json
+from models.database import Base, session_scope
+
+class ChatSession(Base):
+    __tablename__ = "chat_sessions"
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    title = Column(String, nullable=True)
+    # Rolling summary of the oldest turns, and how many messages it covers
+    summary = Column(Text, nullable=True)
+    summarized_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    messages = relationship("ChatSessionMessage", back_populates="session",
+                            cascade="all, delete-orphan", order_by="ChatSessionMessage.id")
+
+
+class ChatSessionMessage(Base):
+    __tablename__ = "chat_messages"
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=False, index=True)
+    role = Column(String, nullable=False)  # "user" or "assistant"
+    content = Column(Text, nullable=False)
+    sources = Column(Text, nullable=True)  # JSON list of retrieved chunks
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    session = relationship("ChatSession", back_populates="messages")
+
+    def sources_list(self):
+        return json.loads(self.sources) if self.sources else None
+
+
+def create_chat_session(project_id: int, user_id: int, title: str = None):
+    """Create a new chat session in a project"""
+    with session_scope() as db:
+        try:
+            session = ChatSession(project_id=project_id, user_id=user_id, title=title)
+            db.add(session)
+            db.commit()
+            db.refresh(session)
+            return session
+        except Exception as e:
+            db.rollback()
+            raise
+
+
+def get_chat_session(session_id: int):
+    """Get a chat session by ID"""
+    with session_scope() as db:
+        return db.query(ChatSession).filter(ChatSession.id == session_id).first()
+
+
+def get_chat_sessions_for_project(project_id: int):
+    """Get all chat sessions of a project, most recent first"""
+    with session_scope() as db:
+        return db.query(ChatSession).filter(ChatSession.project_id == project_id).order_by(ChatSession.updated_at.desc()).all()
+
+
+def get_chat_messages(session_id: int, offset: int = 0):
+    """Get a session's messages in order, skipping the first `offset`"""
+    with session_scope() as db:
+        return db.query(ChatSessionMessage).filter(ChatSessionMessage.session_id == session_id).order_by(ChatSessionMessage.id).offset(offset).all()
+
+
+def add_chat_message(session_id: int, role: str, content: str, sources: list = None):
+    """Append a message to a session"""
+    with session_scope() as db:
+        try:
+            message = ChatSessionMessage(
+                session_id=session_id,
+                role=role,
+                content=content,
+                sources=json.dumps(sources) if sources else None
+            )
+            db.add(message)
+            session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+            if session:
+                session.updated_at = datetime.utcnow()
+            db.commit()
+            db.refresh(message)
+            return message
+        except Exception as e:
+            db.rollback()
+            raise
+
+
+def update_chat_summary(session_id: int, summary: str, summarized_count: int):
+    """Store a new rolling summary covering the first `summarized_count` messages"""
+    with session_scope() as db:
+        try:
+            session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+            if session:
+                session.summary = summary
+                session.summarized_count = summarized_count
+                db.commit()
+            return session
+        except Exception as e:
+            db.rollback()
+            raise
+
+
+def delete_chat_session(session_id: int):
+    """Delete a chat session and its messages"""
+    with session_scope() as db:
+        try:
+            session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+            if session:
+                db.delete(session)
+                db.commit()
+            return session
+        except Exception as e:
+            db.rollback()
+            raise
+
+
+def delete_chat_sessions_for_project(project_id: int):
+    """Delete every chat session of a project"""
+    with session_scope() as db:
+        try:
+            for session in db.query(ChatSession).filter(ChatSession.project_id == project_id).all():
+                db.delete(session)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise
@@ -1,16 +1,110 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker, declarative_base, scoped_session
 from core.config import settings          # ← add this line
 
-engine = create_engine(
-    settings.database_url, connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+def _engine_options() -> dict:
+    url = make_url(settings.database_url)
+    options = {}
+    if url.get_backend_name() == "sqlite":
+        # busy timeout: how long a connection waits on another writer's lock
+        options["connect_args"] = {"check_same_thread": False, "timeout": settings.db_busy_timeout}
+        if url.database in (None, "", ":memory:"):
+            return options  # in-memory databases use a single-connection pool
+    options.update(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+    )
+    return options
+
+
+engine = create_engine(settings.database_url, **_engine_options())
+# Objects outlive the helper that loaded them (and are handed to worker threads),
+# so committing must not expire them
+SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
+# Background workers (ingestion, podcast generation) get one session per thread
+WorkerSession = scoped_session(SessionLocal)
 Base = declarative_base()
 
-def get_db():
+
+class _SessionSlot:
+    __slots__ = ("session", "depth")
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.depth = 0  # session_scope blocks currently open on this session
+
+
+# The session of the request or background job being run, shared by the model helpers it calls
+_current_session: ContextVar[Optional[_SessionSlot]] = ContextVar("current_db_session", default=None)
+
+
+async def get_db():
+    """
+    One session per request. The app depends on this for every route, and
+    the model helpers a request calls (directly or through run_in_threadpool)
+    all use this session. It is async so the session is set in the request's
+    own context rather than in a threadpool copy of it.
+    """
+    slot = _SessionSlot(SessionLocal())
+    _current_session.set(slot)
+    try:
+        yield slot.session
+    finally:
+        db, slot.session = slot.session, None
+        db.close()
+
+
+@contextmanager
+def worker_session():
+    """Share this thread's scoped session across the model helpers a background job calls"""
+    if WorkerSession.registry.has():
+        yield WorkerSession()  # nested job on the same thread
+        return
+    slot = _SessionSlot(WorkerSession())
+    token = _current_session.set(slot)
+    try:
+        yield slot.session
+    finally:
+        slot.session = None
+        _current_session.reset(token)
+        WorkerSession.remove()
+
+
+@contextmanager
+def session_scope():
+    """
+    Session for a model helper: the current request's or background job's
+    session, or, outside of both, a session of its own closed on exit. A
+    shared session's transaction ends when the outermost helper returns.
+    """
+    slot = _current_session.get()
+    if slot is not None and slot.session is not None:
+        db = slot.session
+        slot.depth += 1
+        try:
+            yield db
+        except BaseException:
+            slot.depth -= 1
+            if not slot.depth and db.in_transaction():
+                db.rollback()
+            raise
+        slot.depth -= 1
+        # End the helper's transaction so the pooled connection isn't held across
+        # LLM calls and streamed responses; with expire_on_commit=False, loaded
+        # objects stay usable
+        if not slot.depth and db.in_transaction():
+            db.commit()
+        return
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
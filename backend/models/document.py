@@ -1,81 +1,207 @@
 from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
 from sqlalchemy.orm import relationship
 from datetime import datetime
-from models.database import Base, SessionLocal
+from models.database import Base, session_scope
 
 class Document(Base):
     __tablename__ = "documents"
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=False, index=True)
     orig_filename = Column(String, nullable=False)
     stored_filename = Column(String, unique=True, nullable=False)
     file_type = Column(String, nullable=False)
     upload_date = Column(DateTime, default=datetime.utcnow)
+    sha256 = Column(String, nullable=True, index=True)  # of the uploaded file
+    # Ingestion: pending, processing, ready or failed; chat and generation only use ready documents
+    status = Column(String, nullable=False, default="pending", index=True)
+    error = Column(String, nullable=True)
+    token_count = Column(Integer, nullable=True)
+    raw_token_count = Column(Integer, nullable=True)  # before cleanup
+    # Replacing the file keeps the document (and its podcasts) and bumps the version
+    version = Column(Integer, nullable=False, default=1)
+    previous_text_sha256 = Column(String, nullable=True)  # extracted text of the version before
 
     # Relationships
     project = relationship("Project", back_populates="documents")
 
 
-def create_document(project_id: int, orig_filename: str, stored_filename: str, file_type: str):
+def create_document(project_id: int, orig_filename: str, stored_filename: str, file_type: str, sha256: str = None):
     """Create a new document for a project"""
-    db = SessionLocal()
-    try:
-        doc = Document(
-            project_id=project_id,
-            orig_filename=orig_filename,
-            stored_filename=stored_filename,
-            file_type=file_type
-        )
-        db.add(doc)
-        db.commit()
-        db.refresh(doc)
-        return doc
-    except Exception as e:
-        db.rollback()
-        raise
-    finally:
-        db.close()
+    with session_scope() as db:
+        try:
+            doc = Document(
+                project_id=project_id,
+                orig_filename=orig_filename,
+                stored_filename=stored_filename,
+                file_type=file_type,
+                sha256=sha256
+            )
+            db.add(doc)
+            db.commit()
+            db.refresh(doc)
+            return doc
+        except Exception as e:
+            db.rollback()
+            raise
+
+
+def create_documents(project_id: int, entries: list):
+    """
+    Create several documents for a project in one transaction. entries are
+    dicts of orig_filename, stored_filename, file_type and sha256.
+    """
+    with session_scope() as db:
+        try:
+            docs = [Document(project_id=project_id, **entry) for entry in entries]
+            db.add_all(docs)
+            db.commit()
+            for doc in docs:
+                db.refresh(doc)
+            return docs
+        except Exception as e:
+            db.rollback()
+            raise
 
 
 def get_documents_for_project(project_id: int):
     """Get all documents for a specific project"""
-    db = SessionLocal()
-    try:
+    with session_scope() as db:
         return db.query(Document).filter(Document.project_id == project_id).all()
-    finally:
-        db.close()
+
+
+def snapshot_document(doc: Document) -> Document:
+    """Detached copy of a document's columns, unaffected by later updates to the row in this session"""
+    return Document(**{attr.key: getattr(doc, attr.key) for attr in Document.__mapper__.column_attrs})
+
+
+def replace_document_file(doc_id: int, expected_version: int, orig_filename: str, stored_filename: str,
+                          file_type: str, sha256: str, previous_text_sha256: str = None):
+    """
+    Point a document at a new version of its file; it goes back to pending
+    until ingested. Applies only if the document is still at
+    expected_version, so of two concurrent replacements one gets None.
+    """
+    with session_scope() as db:
+        try:
+            updated = db.query(Document).filter(
+                Document.id == doc_id, Document.version == expected_version
+            ).update({
+                Document.orig_filename: orig_filename,
+                Document.stored_filename: stored_filename,
+                Document.file_type: file_type,
+                Document.sha256: sha256,
+                Document.previous_text_sha256: previous_text_sha256,
+                Document.version: expected_version + 1,
+                Document.upload_date: datetime.utcnow(),
+                Document.status: "pending",
+                Document.error: None,
+            }, synchronize_session=False)
+            db.commit()
+            if not updated:
+                return None
+            doc = db.query(Document).filter(Document.id == doc_id).first()
+            db.refresh(doc)
+            return doc
+        except Exception as e:
+            db.rollback()
+            raise
+
+
+# Columns that describe a document's file, put back when its replacement fails
+_FILE_COLUMNS = ("orig_filename", "stored_filename", "file_type", "sha256", "previous_text_sha256",
+                 "upload_date", "token_count", "raw_token_count")
+
+
+def restore_document_file(doc_id: int, version: int, previous: Document, error: str = None):
+    """
+    Point a document back at the file it had before a replacement that failed
+    to ingest. No-op (None) if the document was deleted or changed again since
+    it reached version.
+    """
+    with session_scope() as db:
+        try:
+            doc = db.query(Document).filter(Document.id == doc_id, Document.version == version).first()
+            if doc:
+                for key in _FILE_COLUMNS:
+                    setattr(doc, key, getattr(previous, key))
+                doc.version = version + 1
+                doc.status = previous.status
+                doc.error = error
+                db.commit()
+                db.refresh(doc)
+            return doc
+        except Exception as e:
+            db.rollback()
+            raise
+
+
+def update_document_status(doc_id: int, status: str, error: str = None, token_count: int = None,
+                           raw_token_count: int = None):
+    """Record a document's ingestion progress; no-op if it was deleted meanwhile"""
+    with session_scope() as db:
+        try:
+            doc = db.query(Document).filter(Document.id == doc_id).first()
+            if doc:
+                doc.status = status
+                doc.error = error
+                if token_count is not None:
+                    doc.token_count = token_count
+                if raw_token_count is not None:
+                    doc.raw_token_count = raw_token_count
+                db.commit()
+                db.refresh(doc)
+            return doc
+        except Exception as e:
+            db.rollback()
+            raise
+
+
+def get_unfinished_documents():
+    """(document, owner user_id) for every document whose ingestion has not finished"""
+    with session_scope() as db:
+        from models.project import Project
+        return db.query(Document, Project.user_id).join(Project).filter(
+            Document.status.in_(("pending", "processing"))
+        ).all()
+
+
+def get_ready_documents():
+    """(document, owner user_id) for every document whose ingestion finished"""
+    with session_scope() as db:
+        from models.project import Project
+        return db.query(Document, Project.user_id).join(Project).filter(Document.status == "ready").all()
 
 
 def get_documents_for_user(user_id: int):
     """Get all documents for a user across all their projects"""
-    db = SessionLocal()
-    try:
+    with session_scope() as db:
         from models.project import Project
         return db.query(Document).join(Project).filter(Project.user_id == user_id).all()
-    finally:
-        db.close()
 
 
 def get_document_by_id(doc_id: int):
     """Get a specific document by ID"""
-    db = SessionLocal()
-    try:
+    with session_scope() as db:
         return db.query(Document).filter(Document.id == doc_id).first()
-    finally:
-        db.close()
 
 
 def delete_document(doc_id: int):
     """Delete a document"""
-    db = SessionLocal()
-    try:
-        doc = db.query(Document).filter(Document.id == doc_id).first()
-        if doc:
-            db.delete(doc)
-            db.commit()
-        return doc
-    except Exception as e:
-        db.rollback()
-        raise
-    finally:
-        db.close()
\ No newline at end of file
+    with session_scope() as db:
+        try:
+            doc = db.query(Document).filter(Document.id == doc_id).first()
+            if doc:
+                db.delete(doc)
+                db.commit()
+            return doc
+        except Exception as e:
+            db.rollback()
+            raise
+
+def count_documents_with_hash(sha256: str, exclude_id: int = None) -> int:
+    """How many documents reference the upload with this sha256 (its blob's reference count)"""
+    with session_scope() as db:
+        query = db.query(Document).filter(Document.sha256 == sha256)
+        if exclude_id is not None:
+            query = query.filter(Document.id != exclude_id)
+        return query.count()
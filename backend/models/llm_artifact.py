@@ -0,0 +1,89 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, UniqueConstraint
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from models.database import Base, session_scope
+
+class LLMArtifact(Base):
+    """Cached LLM output (summary, script, ...) for a given input text and prompt version"""
+    __tablename__ = "llm_artifacts"
+    id = Column(Integer, primary_key=True, index=True)
+    text_hash = Column(String(64), nullable=False, index=True)  # sha256 of the input text
+    model = Column(String, nullable=False)
+    prompt_hash = Column(String(64), nullable=False)  # sha256 of the prompt template(s)
+    stage = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("text_hash", "model", "prompt_hash", "stage", name="uq_llm_artifacts_key"),
+    )
+
+
+def get_artifact(text_hash: str, model: str, prompt_hash: str, stage: str):
+    """Return the cached content for a key, or None"""
+    with session_scope() as db:
+        artifact = db.query(LLMArtifact).filter(
+            LLMArtifact.text_hash == text_hash,
+            LLMArtifact.model == model,
+            LLMArtifact.prompt_hash == prompt_hash,
+            LLMArtifact.stage == stage
+        ).first()
+        return artifact.content if artifact else None
+
+
+def store_artifact(text_hash: str, model: str, prompt_hash: str, stage: str, content: str):
+    """
+    Insert or replace the cached content for a key. Concurrent writers of the
+    same key are expected (parallel chunk summaries, batch generation): the
+    one that loses the insert updates the winner's row instead.
+    """
+    key = (
+        LLMArtifact.text_hash == text_hash,
+        LLMArtifact.model == model,
+        LLMArtifact.prompt_hash == prompt_hash,
+        LLMArtifact.stage == stage,
+    )
+    with session_scope() as db:
+        try:
+            updated = db.query(LLMArtifact).filter(*key).update(
+                {LLMArtifact.content: content, LLMArtifact.created_at: datetime.utcnow()},
+                synchronize_session=False,
+            )
+            if not updated:
+                db.add(LLMArtifact(
+                    text_hash=text_hash,
+                    model=model,
+                    prompt_hash=prompt_hash,
+                    stage=stage,
+                    content=content
+                ))
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            db.query(LLMArtifact).filter(*key).update(
+                {LLMArtifact.content: content, LLMArtifact.created_at: datetime.utcnow()},
+                synchronize_session=False,
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise
+
+
+def purge_artifacts(stage: str = None, model: str = None, text_hash: str = None) -> int:
+    """Delete cached artifacts matching the given filters (all of them if none given)"""
+    with session_scope() as db:
+        try:
+            query = db.query(LLMArtifact)
+            if stage is not None:
+                query = query.filter(LLMArtifact.stage == stage)
+            if model is not None:
+                query = query.filter(LLMArtifact.model == model)
+            if text_hash is not None:
+                query = query.filter(LLMArtifact.text_hash == text_hash)
+            deleted = query.delete(synchronize_session=False)
+            db.commit()
+            return deleted
+        except Exception as e:
+            db.rollback()
+            raise
@@ -0,0 +1,69 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime
+from datetime import datetime
+from models.database import Base, session_scope
+
+
+class PodcastUsage(Base):
+    """Where a podcast's generation time went: LLM tokens and timings per stage, TTS wall time"""
+    __tablename__ = "podcast_usage"
+    id = Column(Integer, primary_key=True, index=True)
+    podcast_id = Column(Integer, nullable=False, index=True)
+    project_id = Column(Integer, nullable=False, index=True)
+    stage = Column(String, nullable=False)
+    model = Column(String, nullable=True)
+    calls = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    eval_tokens = Column(Integer, nullable=False, default=0)
+    load_seconds = Column(Float, nullable=False, default=0.0)
+    prompt_eval_seconds = Column(Float, nullable=False, default=0.0)
+    eval_seconds = Column(Float, nullable=False, default=0.0)
+    wall_seconds = Column(Float, nullable=False, default=0.0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def to_dict(self) -> dict:
+        return {
+            "stage": self.stage,
+            "model": self.model,
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "eval_tokens": self.eval_tokens,
+            "load_seconds": self.load_seconds,
+            "prompt_eval_seconds": self.prompt_eval_seconds,
+            "eval_seconds": self.eval_seconds,
+            "wall_seconds": self.wall_seconds,
+        }
+
+
+def store_podcast_usage(podcast_id: int, project_id: int, usage: dict):
+    """Persist per-stage totals (UsageTotals.to_dict()) for a podcast"""
+    with session_scope() as db:
+        try:
+            for stage, totals in usage.items():
+                db.add(PodcastUsage(podcast_id=podcast_id, project_id=project_id, stage=stage, **totals))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise
+
+
+def get_podcast_usage(podcast_id: int):
+    with session_scope() as db:
+        return db.query(PodcastUsage).filter(PodcastUsage.podcast_id == podcast_id).order_by(PodcastUsage.id).all()
+
+
+def delete_podcast_usage(podcast_id: int = None, project_id: int = None):
+    """Delete the usage rows of a podcast, or of every podcast in a project"""
+    if podcast_id is None and project_id is None:
+        raise ValueError("podcast_id or project_id is required")
+    with session_scope() as db:
+        try:
+            query = db.query(PodcastUsage)
+            if podcast_id is not None:
+                query = query.filter(PodcastUsage.podcast_id == podcast_id)
+            if project_id is not None:
+                query = query.filter(PodcastUsage.project_id == project_id)
+            query.delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise
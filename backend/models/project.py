@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, func, select
 from sqlalchemy.orm import relationship
 from datetime import datetime
-from models.database import Base, SessionLocal
+from models.database import Base, session_scope
+from models.document import Document
+from models.podcast import Podcast
 
 class Project(Base):
     __tablename__ = "projects"
@@ -20,74 +22,98 @@ class Project(Base):
 
 def create_project(user_id: int, name: str, description: str = None):
     """Create a new project for a user"""
-    db = SessionLocal()
-    try:
-        project = Project(
-            user_id=user_id,
-            name=name,
-            description=description
-        )
-        db.add(project)
-        db.commit()
-        db.refresh(project)
-        return project
-    except Exception as e:
-        db.rollback()
-        raise
-    finally:
-        db.close()
+    with session_scope() as db:
+        try:
+            project = Project(
+                user_id=user_id,
+                name=name,
+                description=description
+            )
+            db.add(project)
+            db.commit()
+            db.refresh(project)
+            return project
+        except Exception as e:
+            db.rollback()
+            raise
 
 
 def get_projects_for_user(user_id: int):
     """Get all projects for a specific user"""
-    db = SessionLocal()
-    try:
+    with session_scope() as db:
         return db.query(Project).filter(Project.user_id == user_id).order_by(Project.updated_at.desc()).all()
-    finally:
-        db.close()
+
+
+def _query_with_counts(db):
+    """Projects alongside their document and podcast counts, counted in the database"""
+    document_count = (
+        select(func.count(Document.id))
+        .where(Document.project_id == Project.id)
+        .correlate(Project)
+        .scalar_subquery()
+    )
+    podcast_count = (
+        select(func.count(Podcast.id))
+        .where(Podcast.project_id == Project.id)
+        .correlate(Project)
+        .scalar_subquery()
+    )
+    return db.query(Project, document_count, podcast_count)
+
+
+def get_projects_with_counts_for_user(user_id: int):
+    """Get (project, document_count, podcast_count) for all of a user's projects"""
+    with session_scope() as db:
+        rows = (
+            _query_with_counts(db)
+            .filter(Project.user_id == user_id)
+            .order_by(Project.updated_at.desc())
+            .all()
+        )
+        return [tuple(row) for row in rows]
+
+
+def get_project_with_counts(project_id: int):
+    """Get (project, document_count, podcast_count) for one project, or None"""
+    with session_scope() as db:
+        row = _query_with_counts(db).filter(Project.id == project_id).first()
+        return tuple(row) if row else None
 
 
 def get_project_by_id(project_id: int):
     """Get a specific project by ID"""
-    db = SessionLocal()
-    try:
+    with session_scope() as db:
         return db.query(Project).filter(Project.id == project_id).first()
-    finally:
-        db.close()
 
 
 def update_project(project_id: int, name: str = None, description: str = None):
     """Update a project's details"""
-    db = SessionLocal()
-    try:
-        project = db.query(Project).filter(Project.id == project_id).first()
-        if project:
-            if name is not None:
-                project.name = name
-            if description is not None:
-                project.description = description
-            project.updated_at = datetime.utcnow()
-            db.commit()
-            db.refresh(project)
-        return project
-    except Exception as e:
-        db.rollback()
-        raise
-    finally:
-        db.close()
+    with session_scope() as db:
+        try:
+            project = db.query(Project).filter(Project.id == project_id).first()
+            if project:
+                if name is not None:
+                    project.name = name
+                if description is not None:
+                    project.description = description
+                project.updated_at = datetime.utcnow()
+                db.commit()
+                db.refresh(project)
+            return project
+        except Exception as e:
+            db.rollback()
+            raise
 
 
 def delete_project(project_id: int):
     """Delete a project and all its associated documents and podcasts"""
-    db = SessionLocal()
-    try:
-        project = db.query(Project).filter(Project.id == project_id).first()
-        if project:
-            db.delete(project)
-            db.commit()
-        return project
-    except Exception as e:
-        db.rollback()
-        raise
-    finally:
-        db.close() 
\ No newline at end of file
+    with session_scope() as db:
+        try:
+            project = db.query(Project).filter(Project.id == project_id).first()
+            if project:
+                db.delete(project)
+                db.commit()
+            return project
+        except Exception as e:
+            db.rollback()
+            raise
\ No newline at end of file
@@ -21,6 +21,12 @@ class DocumentBase(BaseModel):
     orig_filename: str
     file_type: str
     upload_date: datetime
+    sha256: Optional[str] = None
+    status: Optional[str] = None
+    error: Optional[str] = None
+    token_count: Optional[int] = None
+    raw_token_count: Optional[int] = None
+    version: Optional[int] = None
 
     class Config:
         orm_mode = True
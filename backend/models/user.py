@@ -1,7 +1,7 @@
 from sqlalchemy import Column, Integer, String, DateTime
 from datetime import datetime
 from sqlalchemy.orm import relationship
-from models.database import Base, SessionLocal
+from models.database import Base, session_scope
 from models.schemas import UserCreate
 
 class User(Base):
@@ -17,18 +17,22 @@ class User(Base):
 
 
 def get_user_by_username(username: str):
-    db = SessionLocal()
-    return db.query(User).filter(User.username == username).first()
+    with session_scope() as db:
+        return db.query(User).filter(User.username == username).first()
 
 
 def create_user(user: UserCreate, hashed_password: str):
-    db = SessionLocal()
-    db_user = User(
-        username=user.username,
-        email=user.email,
-        password_hash=hashed_password
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
\ No newline at end of file
+    with session_scope() as db:
+        try:
+            db_user = User(
+                username=user.username,
+                email=user.email,
+                password_hash=hashed_password
+            )
+            db.add(db_user)
+            db.commit()
+            db.refresh(db_user)
+            return db_user
+        except Exception as e:
+            db.rollback()
+            raise
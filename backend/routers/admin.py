@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends
+from typing import Optional
+from core.security import get_current_admin
+from models.user import User
+from models.llm_artifact import purge_artifacts
+from services.llm_client import get_llm_client
+from services.telemetry import usage_snapshot
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+@router.delete("/llm-artifacts")
+def purge_llm_artifacts(
+    stage: Optional[str] = None,
+    model: Optional[str] = None,
+    text_hash: Optional[str] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Purge cached summaries/scripts; filters narrow the purge, no filters clears everything"""
+    deleted = purge_artifacts(stage=stage, model=model, text_hash=text_hash)
+    print(f"[ADMIN] {current_user.username} purged {deleted} LLM artifacts (stage={stage}, model={model}, text_hash={text_hash})")
+    return {"deleted": deleted}
+
+@router.get("/llm-endpoints")
+def get_llm_endpoints(current_user: User = Depends(get_current_admin)):
+    """Routing state of every LLM endpoint: load, stages served and circuit breaker"""
+    return get_llm_client().endpoint_status()
+
+@router.get("/llm-usage")
+def get_llm_usage(current_user: User = Depends(get_current_admin)):
+    """Token counts, tokens/sec and time-to-first-token histograms by stage and model, tokens by user"""
+    return usage_snapshot()
@@ -1,5 +1,9 @@
-import requests
-from fastapi import APIRouter, Depends, HTTPException
+import json
+import threading
+from fastapi import APIRouter, Depends, HTTPException, Request, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from typing import List, Optional
 from sqlalchemy.orm import Session
@@ -8,13 +12,20 @@ from core.config import settings
 from models.user import User
 from models.database import get_db
 from models.project import get_project_by_id
-from services.file_service import get_document_text
+from services.file_service import DocumentTextUnavailable, open_document_text, stored_text_meta
+from services.ingestion import reingest_document
 from models.document import get_documents_for_project
+from models.chat_session import (
+    create_chat_session, get_chat_session, get_chat_sessions_for_project,
+    get_chat_messages, add_chat_message, update_chat_summary, delete_chat_session
+)
+from services.llm_client import get_llm_client, LLMError
+from services.embeddings import index_document, indexed_text_hashes, search
+from services.tokens import estimate_tokens
+from services.telemetry import UsageTotals
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
-OLLAMA_CHAT_URL = f"{settings.ollama_url.rstrip('/')}/api/chat"
-
 class ChatMessage(BaseModel):
     role: str  # "user" or "assistant" 
     content: str
@@ -29,107 +40,415 @@ class ChatResponse(BaseModel):
     message: str
     sources: List[dict] = []
 
-def get_project_context(project_id: int, user_id: int) -> str:
-    """Get the text content of all documents in a project for context"""
+def _sync_document_index(project_id: int, user_id: int, documents) -> dict:
+    """
+    Re-index ready documents whose chunks are missing from the retrieval index
+    (ingest_embed off, or the index was rebuilt) or were cut from another
+    version of their stored text (a replaced file with ingest_embed off).
+    Documents whose stored text is out of date go back to ingestion rather
+    than being extracted here.
+    Returns document id -> sha256 of the text its indexed offsets point into.
+    """
+    indexed = indexed_text_hashes(project_id)
+    current = {}
+    for doc in documents:
+        try:
+            meta = stored_text_meta(user_id, doc)
+            if meta is None:
+                reingest_document(user_id, doc)
+                continue
+            if indexed.get(doc.id) == meta["sha256"]:
+                current[doc.id] = meta["sha256"]
+                continue
+            with open_document_text(user_id, doc) as doc_text:
+                index_document(project_id, doc.id, doc.orig_filename, doc_text, content_hash=doc.sha256,
+                               page_offsets=doc_text.page_offsets)
+                current[doc.id] = doc_text.meta["sha256"]
+        except Exception as e:
+            print(f"Error indexing document {doc.id}: {e}")
+    return current
+
+def get_project_context(project_id: int, user_id: int, query: str):
+    """
+    Retrieve the document chunks most relevant to the query as chat context.
+    Returns (context, sources, documents).
+    """
     # Verify project ownership
     project = get_project_by_id(project_id)
     if not project or project.user_id != user_id:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Get all documents in the project
-    documents = get_documents_for_project(project_id)
+    # Only documents whose ingestion finished; files are never parsed during a chat request
+    all_documents = get_documents_for_project(project_id)
+    documents = [doc for doc in all_documents if doc.status == "ready"]
     
     if not documents:
-        return ""
+        if any(doc.status in ("pending", "processing") for doc in all_documents):
+            raise HTTPException(status_code=409, detail="Documents are still being processed")
+        return "", [], documents
     
-    # Combine all document texts
+    text_hashes = _sync_document_index(project_id, user_id, documents)
+    if not text_hashes and any(doc.status in ("pending", "processing") for doc in get_documents_for_project(project_id)):
+        # every ready document had out-of-date text and went back to ingestion
+        raise HTTPException(status_code=409, detail="Documents are still being processed")
+    hits = [hit for hit in search(project_id, query)
+            if hit.get("text_sha256") is not None and text_hashes.get(hit["document_id"]) == hit["text_sha256"]]
+    
+    # Combine the retrieved chunks, reading each passage from the text store by its offsets
     context_parts = []
     source_info = []
+    docs_by_id = {doc.id: doc for doc in documents}
+    opened = {}
+    try:
+        for hit in hits:
+            doc_id = hit["document_id"]
+            if doc_id not in opened:
+                try:
+                    opened[doc_id] = open_document_text(user_id, docs_by_id[doc_id])
+                except DocumentTextUnavailable:
+                    opened[doc_id] = None
+            if opened[doc_id] is None or opened[doc_id].meta["sha256"] != hit["text_sha256"]:
+                continue  # the text was re-extracted since this turn's index check
+            hit["text"] = opened[doc_id][hit["start"]:hit["end"]]
+    finally:
+        for doc_text in opened.values():
+            if doc_text is not None:
+                doc_text.close()
+    hits = [hit for hit in hits if "text" in hit]
     
-    for doc in documents:
-        try:
-            doc_text = get_document_text(user_id, doc.stored_filename)
-            context_parts.append(f"Document: {doc.orig_filename}\n{doc_text}")
-            source_info.append({
-                "id": doc.id,
-                "filename": doc.orig_filename,
-                "excerpt": doc_text[:200] + "..." if len(doc_text) > 200 else doc_text
-            })
-        except Exception as e:
-            print(f"Error reading document {doc.id}: {e}")
-            continue
+    for hit in hits:
+        chunk_text = hit["text"]
+        context_parts.append(f"Document: {hit['filename']} (characters {hit['start']}-{hit['end']})\n{chunk_text}")
+        source_info.append({
+            "id": hit["document_id"],
+            "document_id": hit["document_id"],
+            "filename": hit["filename"],
+            "start": hit["start"],
+            "end": hit["end"],
+            "score": round(hit["score"], 4),
+            "excerpt": chunk_text[:200] + "..." if len(chunk_text) > 200 else chunk_text
+        })
     
     context = "\n\n---\n\n".join(context_parts)
-    return context, source_info
+    return context, source_info, documents
 
-@router.post("/", response_model=ChatResponse)
-async def chat_with_documents(
-    request: ChatRequest,
-    current_user: User = Depends(get_current_user)
-):
-    """Chat with the documents in a project using the LLM"""
-    
-    # Get project context
+async def _load_context(project_id: int, message: str, user_id: int):
+    """Retrieved context, sources and system prompt for a chat turn, with the request's HTTP errors"""
     try:
-        context, source_info = get_project_context(request.project_id, current_user.id)
+        context, source_info, documents = await run_in_threadpool(get_project_context, project_id, user_id, message)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading project context: {str(e)}")
     
-    if not context:
+    if not documents:
         raise HTTPException(status_code=400, detail="No documents found in this project")
-    
-    # Build the conversation for the LLM
-    system_prompt = (
+    return context, source_info, _system_prompt(documents)
+
+def _system_prompt(documents) -> str:
+    """
+    The prompt prefix shared by every turn. It depends only on the project's
+    document list, so it stays byte-identical across turns and the model
+    server can reuse its cached evaluation; per-turn passages go in the
+    latest user message instead.
+    """
+    names = "\n".join(f"- {doc.orig_filename}" for doc in sorted(documents, key=lambda d: d.id))
+    return (
         "You are an AI assistant that helps users understand and discuss their documents. "
-        "You have access to the full content of the user's uploaded documents. "
+        "With each question you are given the passages of the user's uploaded documents that are most relevant to it. "
         "Answer questions about the documents, explain concepts, and provide insights based on the document content. "
         "Be helpful, accurate, and cite specific information from the documents when relevant. "
         "If a question cannot be answered from the document content, say so clearly. "
         "Keep your responses conversational and engaging, similar to how you would explain things in a podcast. "
         "When referencing specific information, try to mention which document it comes from. "
-        f"Here are the documents you have access to:\n\n{context}"
+        f"The project contains these documents:\n{names}"
     )
-    
+
+def _build_messages(system_prompt: str, history: List[dict], message: str, context: str, summary: str = None) -> List[dict]:
+    """Build the conversation for the LLM: stable prefix, history, then the new turn with its passages"""
     messages = [{"role": "system", "content": system_prompt}]
     
+    # Older turns folded into a rolling summary; changes only when history is compacted
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    
     # Add conversation history
-    for msg in request.conversation_history[-10:]:  # Keep last 10 messages for context
-        messages.append({
-            "role": msg.role,
-            "content": msg.content
-        })
+    messages.extend(history)
     
-    # Add the current user message
+    # Add the current user message with the passages retrieved for it
     messages.append({
         "role": "user",
-        "content": request.message
+        "content": f"Relevant document passages:\n\n{context}\n\n---\n\n{message}"
     })
+    return messages
+
+def _usage_stats(final_chunk: dict) -> dict:
+    """Token counts and timings Ollama reports on its last chunk"""
+    keys = ("prompt_eval_count", "eval_count", "total_duration", "load_duration",
+            "prompt_eval_duration", "eval_duration")
+    return {key: final_chunk.get(key) for key in keys if key in final_chunk}
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _event_stream_response(http_request: Request, messages: List[dict], source_info: List[dict], user_id: int,
+                           on_complete=None, background=None) -> StreamingResponse:
+    """
+    Relay an LLM answer as Server-Sent Events: `sources` first, then one
+    `token` per chunk, then `done` with usage stats (or `error`). A client
+    disconnect aborts the upstream LLM request. on_complete(answer) runs once
+    the full answer has been streamed.
+    """
+    async def event_stream():
+        yield _sse("sources", {"sources": source_info})
+        upstream = get_llm_client().astream_chat(messages, stage="chat", usage=UsageTotals(user_id))
+        parts = []
+        try:
+            async for chunk in upstream:
+                if await http_request.is_disconnected():
+                    print("[CHAT] Client disconnected, aborting LLM stream")
+                    return
+                token = chunk.get("message", {}).get("content", "")
+                if token:
+                    parts.append(token)
+                    yield _sse("token", {"content": token})
+                if chunk.get("done"):
+                    if on_complete is not None:
+                        await run_in_threadpool(on_complete, "".join(parts))
+                    yield _sse("done", {"usage": _usage_stats(chunk)})
+        except LLMError as e:
+            yield _sse("error", {"detail": f"Error communicating with LLM: {str(e)}"})
+        finally:
+            # Closing the generator closes the upstream connection, so Ollama stops decoding
+            await upstream.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background,
+    )
+
+def _request_history(request: ChatRequest) -> List[dict]:
+    return [
+        {"role": msg.role, "content": msg.content}
+        for msg in request.conversation_history[-10:]  # Keep last 10 messages for context
+    ]
+
+@router.post("/", response_model=ChatResponse)
+async def chat_with_documents(
+    request: ChatRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Chat with the documents in a project using the LLM"""
+    
+    context, source_info, system_prompt = await _load_context(request.project_id, request.message, current_user.id)
+    messages = _build_messages(system_prompt, _request_history(request), request.message, context)
     
     # Make the LLM request
     try:
-        payload = {
-            "model": settings.ollama_model,
-            "messages": messages,
-            "stream": False
-        }
-        
-        response = requests.post(OLLAMA_CHAT_URL, json=payload, timeout=120)
-        response.raise_for_status()
+        response = await get_llm_client().achat(messages, stage="chat", usage=UsageTotals(current_user.id))
         
-        llm_response = response.json()["message"]["content"]
+        llm_response = response["message"]["content"]
         
         return ChatResponse(
             message=llm_response,
             sources=source_info
         )
         
-    except requests.RequestException as e:
+    except LLMError as e:
         raise HTTPException(status_code=500, detail=f"Error communicating with LLM: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@router.post("/stream")
+async def chat_with_documents_stream(
+    request: ChatRequest,
+    http_request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Chat with the documents in a project, relaying tokens as Server-Sent Events"""
+    context, source_info, system_prompt = await _load_context(request.project_id, request.message, current_user.id)
+    messages = _build_messages(system_prompt, _request_history(request), request.message, context)
+    return _event_stream_response(http_request, messages, source_info, current_user.id)
+
+# ---------------------------------------------------------------------------
+# Server-side chat sessions
+# ---------------------------------------------------------------------------
+
+class ChatSessionCreate(BaseModel):
+    project_id: int
+    title: Optional[str] = None
+
+class ChatSessionMessageRequest(BaseModel):
+    message: str
+
+COMPACTION_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant about the user's documents. "
+    "Merge the existing summary and the new conversation turns into one concise summary. "
+    "Keep the questions asked, the key facts and conclusions given, and anything the user said they care about."
+)
+
+_compacting_sessions = set()
+_compacting_lock = threading.Lock()
+
+def _session_to_dict(session) -> dict:
+    return {
+        "id": session.id,
+        "project_id": session.project_id,
+        "title": session.title,
+        "created_at": session.created_at.isoformat() if session.created_at else None,
+        "updated_at": session.updated_at.isoformat() if session.updated_at else None,
+    }
+
+def _get_owned_session(session_id: int, user_id: int):
+    session = get_chat_session(session_id)
+    if not session or session.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return session
+
+def _compact_session_history(session_id: int):
+    """
+    Fold the oldest turns into the session's rolling summary once the
+    uncompacted history exceeds chat_history_token_budget, leaving about half
+    the budget of recent turns verbatim.
+    """
+    with _compacting_lock:
+        if session_id in _compacting_sessions:
+            return
+        _compacting_sessions.add(session_id)
+    try:
+        session = get_chat_session(session_id)
+        if not session:
+            return
+        history = get_chat_messages(session_id, offset=session.summarized_count)
+        budget = settings.chat_history_token_budget
+        remaining = sum(estimate_tokens(msg.content) for msg in history)
+        if remaining <= budget:
+            return
+
+        fold = 0
+        while fold < len(history) - 2 and remaining > budget // 2:
+            remaining -= estimate_tokens(history[fold].content)
+            fold += 1
+        fold -= fold % 2  # fold whole user/assistant exchanges
+        if fold == 0:
+            return
+
+        transcript = "\n\n".join(f"{msg.role}: {msg.content}" for msg in history[:fold])
+        response = get_llm_client().chat([
+            {"role": "system", "content": COMPACTION_PROMPT},
+            {"role": "user", "content": f"Existing summary:\n{session.summary or '(none)'}\n\nNew conversation turns:\n{transcript}"},
+        ], stage="chat", usage=UsageTotals(session.user_id))
+        update_chat_summary(session_id, response["message"]["content"], session.summarized_count + fold)
+        print(f"[CHAT] Compacted {fold} messages of session {session_id} into its summary")
+    except Exception as e:
+        print(f"[CHAT] Error compacting session {session_id}: {e}")
+    finally:
+        with _compacting_lock:
+            _compacting_sessions.discard(session_id)
+
+async def _prepare_session_turn(session, message: str, user_id: int):
+    context, source_info, system_prompt = await _load_context(session.project_id, message, user_id)
+    history = await run_in_threadpool(get_chat_messages, session.id, session.summarized_count)
+    messages = _build_messages(
+        system_prompt,
+        [{"role": msg.role, "content": msg.content} for msg in history],
+        message,
+        context,
+        session.summary,
+    )
+    return messages, source_info
+
+def _record_exchange(session_id: int, message: str, answer: str, source_info: List[dict]):
+    # History keeps the bare question so earlier turns stay byte-identical in later prompts
+    add_chat_message(session_id, "user", message)
+    add_chat_message(session_id, "assistant", answer, source_info)
+
+@router.post("/sessions")
+def create_session(
+    request: ChatSessionCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Start a server-side chat session in a project"""
+    project = get_project_by_id(request.project_id)
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return _session_to_dict(create_chat_session(request.project_id, current_user.id, request.title))
+
+@router.get("/sessions")
+def list_sessions(
+    project_id: int,
+    current_user: User = Depends(get_current_user)
+):
+    """List the chat sessions of a project"""
+    project = get_project_by_id(project_id)
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return [_session_to_dict(session) for session in get_chat_sessions_for_project(project_id)]
+
+@router.get("/sessions/{session_id}")
+def get_session(
+    session_id: int,
+    current_user: User = Depends(get_current_user)
+):
+    """Get a chat session with its full message history"""
+    session = _get_owned_session(session_id, current_user.id)
+    return {
+        **_session_to_dict(session),
+        "messages": [
+            ChatMessage(role=msg.role, content=msg.content, sources=msg.sources_list())
+            for msg in get_chat_messages(session_id)
+        ],
+    }
+
+@router.delete("/sessions/{session_id}")
+def delete_session(
+    session_id: int,
+    current_user: User = Depends(get_current_user)
+):
+    """Delete a chat session"""
+    _get_owned_session(session_id, current_user.id)
+    delete_chat_session(session_id)
+    return {"detail": "Chat session deleted"}
+
+@router.post("/sessions/{session_id}/messages", response_model=ChatResponse)
+async def send_session_message(
+    session_id: int,
+    request: ChatSessionMessageRequest,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user)
+):
+    """Send a message in a chat session; the server supplies the history"""
+    session = await run_in_threadpool(_get_owned_session, session_id, current_user.id)
+    messages, source_info = await _prepare_session_turn(session, request.message, current_user.id)
+    
+    try:
+        response = await get_llm_client().achat(messages, stage="chat", usage=UsageTotals(current_user.id))
+    except LLMError as e:
+        raise HTTPException(status_code=500, detail=f"Error communicating with LLM: {str(e)}")
+    
+    answer = response["message"]["content"]
+    await run_in_threadpool(_record_exchange, session_id, request.message, answer, source_info)
+    background_tasks.add_task(_compact_session_history, session_id)
+    return ChatResponse(message=answer, sources=source_info)
+
+@router.post("/sessions/{session_id}/messages/stream")
+async def send_session_message_stream(
+    session_id: int,
+    request: ChatSessionMessageRequest,
+    http_request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Send a message in a chat session, relaying the answer as Server-Sent Events"""
+    session = await run_in_threadpool(_get_owned_session, session_id, current_user.id)
+    messages, source_info = await _prepare_session_turn(session, request.message, current_user.id)
+    return _event_stream_response(
+        http_request, messages, source_info, current_user.id,
+        on_complete=lambda answer: _record_exchange(session_id, request.message, answer, source_info),
+        background=BackgroundTask(_compact_session_history, session_id),
+    )
+
 @router.get("/project/{project_id}/info")
 async def get_project_info(
     project_id: int,
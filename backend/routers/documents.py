@@ -1,16 +1,43 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Request, Query
 from fastapi.responses import FileResponse
-from typing import List
-import os, uuid
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile as StarletteUploadFile
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+import os
+import uuid
 from core.config import settings
 from core.security import get_current_user
 from models.schemas import DocumentBase
-from models.document import create_document, get_documents_for_project, get_document_by_id, delete_document
+from models.document import (
+    create_document, create_documents, get_documents_for_project, get_document_by_id, delete_document,
+    update_document_status, replace_document_file, restore_document_file, snapshot_document
+)
 from models.project import get_project_by_id
 from models.user import User
+from services.jobs import cancel_jobs_for_document
+from services.file_service import DocumentTextUnavailable, open_document_text, save_upload, max_upload_bytes, document_path, UploadTooLarge
+from services.blob_store import store_blob, release_blob
+from services.embeddings import remove_document as remove_document_from_index
+from services.ingestion import enqueue_ingestion, reingest_document
+from services import search
+from services import chunked_upload
+from services.chunked_upload import UploadSessionError, UploadSessionNotFound
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
+class BatchUploadResult(BaseModel):
+    filename: str
+    document: Optional[DocumentBase] = None
+    error: Optional[str] = None
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+    sha256: str
+    chunk_size: Optional[int] = None
+
 @router.post("/upload/{project_id}", response_model=DocumentBase)
 def upload_document(
     project_id: int,
@@ -27,24 +54,230 @@ def upload_document(
     if ext not in [".pdf", ".docx"]:
         raise HTTPException(status_code=400, detail="Invalid file type")
     
-    # Create user directory if it doesn't exist
-    user_dir = os.path.join(settings.upload_dir, str(current_user.id))
-    os.makedirs(user_dir, exist_ok=True)
+    # Reject early when the client declared the size
+    if file.size is not None and file.size > max_upload_bytes():
+        raise HTTPException(status_code=413, detail=f"File exceeds the {settings.max_upload_mb} MB upload limit")
+    
+    try:
+        staged_path, sha256, size = save_upload(file.file, ext)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
-    unique_name = f"{uuid.uuid4()}{ext}"
-    path = os.path.join(user_dir, unique_name)
+    doc = _create_uploaded_document(project_id, file.filename, ext, staged_path, sha256)
+    enqueue_ingestion(current_user.id, doc)
+    return doc
+
+_BATCH_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["files"],
+            "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+        }}},
+    }
+}
+
+@router.post("/upload/{project_id}/batch", response_model=List[BatchUploadResult], openapi_extra=_BATCH_UPLOAD_BODY)
+async def upload_documents(
+    project_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Upload many documents to a project in one request (multipart field
+    "files"). Each file is streamed to storage, all documents are created in
+    one transaction and ingested concurrently. Files that are rejected are
+    reported per file; the rest are still created. The form is parsed here
+    rather than by FastAPI so a request with more than max_batch_files files
+    is cut off at the first extra file instead of being spooled whole.
+    """
+    project = await run_in_threadpool(get_project_by_id, project_id)
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Project not found")
     
-    with open(path, "wb") as f:
-        f.write(file.file.read())
+    try:
+        form = await request.form(max_files=settings.max_batch_files)
+    except StarletteHTTPException as e:
+        if "Too many files" in str(e.detail):
+            raise HTTPException(status_code=413, detail=f"At most {settings.max_batch_files} files per batch upload")
+        raise
+    try:
+        files = [item for item in form.getlist("files") if isinstance(item, StarletteUploadFile)]
+        if not files:
+            raise HTTPException(status_code=422, detail="No files uploaded")
+        return await run_in_threadpool(_store_batch, project_id, files, current_user.id)
+    finally:
+        await form.close()
+
+def _store_batch(project_id: int, files: list, user_id: int) -> list:
+    """Stage, create and queue a batch's files; one result per file, in order"""
+    results = [{"filename": file.filename} for file in files]
+    staged = []  # (result index, ext, staged_path, sha256)
+    try:
+        for index, file in enumerate(files):
+            ext = os.path.splitext(file.filename or "")[1].lower()
+            if ext not in [".pdf", ".docx"]:
+                results[index]["error"] = "Invalid file type"
+                continue
+            if file.size is not None and file.size > max_upload_bytes():
+                results[index]["error"] = f"File exceeds the {settings.max_upload_mb} MB upload limit"
+                continue
+            try:
+                staged_path, sha256, _ = save_upload(file.file, ext)
+            except UploadTooLarge as e:
+                results[index]["error"] = str(e)
+                continue
+            except Exception as e:
+                print(f"Batch upload to project {project_id}: could not store {file.filename}: {e}")
+                results[index]["error"] = "Could not store the file"
+                continue
+            staged.append((index, ext, staged_path, sha256))
+        
+        docs = []
+        if staged:
+            entries = [
+                {"orig_filename": files[index].filename, "stored_filename": f"{uuid.uuid4()}{ext}",
+                 "file_type": ext[1:], "sha256": sha256}
+                for index, ext, _, sha256 in staged
+            ]
+            docs = create_documents(project_id, entries)
+    except BaseException:
+        # Nothing references the staged files until their rows exist
+        for _, _, staged_path, _ in staged:
+            os.remove(staged_path)
+        raise
     
-    doc = create_document(
-        project_id=project_id,
-        orig_filename=file.filename,
-        stored_filename=unique_name,
-        file_type=ext[1:]
-    )
+    accepted = 0
+    for (index, ext, staged_path, sha256), doc in zip(staged, docs):
+        if not _move_into_blob_store(staged_path, sha256, ext, lambda doc=doc: delete_document(doc.id)):
+            results[index]["error"] = "Could not store the file"
+            continue
+        enqueue_ingestion(user_id, doc)
+        results[index]["document"] = doc
+        accepted += 1
+    print(f"Batch upload to project {project_id}: {accepted} of {len(files)} files accepted")
+    return results
+
+def _create_uploaded_document(project_id: int, filename: str, ext: str, staged_path: str, sha256: str):
+    """Create the document row, then move its file into the blob store (shared with identical uploads)"""
+    try:
+        doc = create_document(
+            project_id=project_id,
+            orig_filename=filename,
+            stored_filename=f"{uuid.uuid4()}{ext}",
+            file_type=ext[1:],
+            sha256=sha256
+        )
+    except Exception:
+        os.remove(staged_path)
+        raise
+    if not _move_into_blob_store(staged_path, sha256, ext, lambda: delete_document(doc.id)):
+        raise HTTPException(status_code=500, detail="Could not store the uploaded file")
     return doc
 
+def _move_into_blob_store(staged_path: str, sha256: str, ext: str, undo) -> bool:
+    """
+    store_blob for a file whose document row is already committed. If the
+    move fails (disk full, permissions), undo() reverts the row so it never
+    points at a missing file, and the staged file is removed.
+    """
+    try:
+        store_blob(staged_path, sha256, ext)
+        return True
+    except Exception as e:
+        print(f"Could not store upload {sha256[:12]}: {e}")
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+        undo()
+        return False
+
+# ---------------------------------------------------------------------------
+# Resumable uploads: create a session, PUT numbered chunks in any order, finalize
+# ---------------------------------------------------------------------------
+
+def _get_upload_session(upload_id: str, user_id: int) -> dict:
+    try:
+        return chunked_upload.load_upload_session(user_id, upload_id)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+
+@router.post("/uploads/{project_id}")
+def create_upload_session(
+    project_id: int,
+    request: UploadSessionCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Start a resumable upload; the response says how to split the file into chunks"""
+    project = get_project_by_id(project_id)
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Project not found")
+    try:
+        session = chunked_upload.create_upload_session(
+            current_user.id, project_id, request.filename, request.size, request.sha256, request.chunk_size
+        )
+    except UploadSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return chunked_upload.session_status(session)
+
+@router.get("/uploads/{upload_id}")
+def get_upload_session(upload_id: str, current_user: User = Depends(get_current_user)):
+    """Which chunks have arrived, so an interrupted client can resume with the missing ones"""
+    return chunked_upload.session_status(_get_upload_session(upload_id, current_user.id))
+
+@router.put("/uploads/{upload_id}/chunks/{index}")
+async def put_upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Store one chunk (raw request body); chunks may be sent in parallel and resent"""
+    session = await run_in_threadpool(_get_upload_session, upload_id, current_user.id)
+    try:
+        expected = chunked_upload.expected_chunk_length(session, index)
+    except UploadSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    data = bytearray()
+    async for piece in request.stream():
+        data.extend(piece)
+        if len(data) > expected:
+            raise HTTPException(status_code=413, detail=f"Chunk {index} must be {expected} bytes")
+    try:
+        await run_in_threadpool(chunked_upload.write_chunk, session, index, bytes(data))
+    except UploadSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"upload_id": upload_id, "index": index, "size": len(data)}
+
+@router.post("/uploads/{upload_id}/complete", response_model=DocumentBase)
+def complete_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Verify the assembled file against its sha256 and create the document"""
+    session = _get_upload_session(upload_id, current_user.id)
+    project = get_project_by_id(session["project_id"])
+    if not project or project.user_id != current_user.id:
+        chunked_upload.abort_upload(current_user.id, upload_id)
+        raise HTTPException(status_code=404, detail="Project not found")
+    try:
+        data_path, sha256 = chunked_upload.finalize_upload(session)
+    except UploadSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    doc = _create_uploaded_document(session["project_id"], session["filename"], session["ext"], data_path, sha256)
+    chunked_upload.abort_upload(current_user.id, upload_id)
+    enqueue_ingestion(current_user.id, doc)
+    return doc
+
+@router.delete("/uploads/{upload_id}")
+def abort_upload_session(upload_id: str, current_user: User = Depends(get_current_user)):
+    """Abandon a resumable upload and free its space"""
+    _get_upload_session(upload_id, current_user.id)
+    chunked_upload.abort_upload(current_user.id, upload_id)
+    return {"detail": "Upload session deleted"}
+
 @router.get("/project/{project_id}", response_model=List[DocumentBase])
 def list_documents_for_project(
     project_id: int,
@@ -76,9 +309,131 @@ def download_document(doc_id: int, current_user: User = Depends(get_current_user
     if not project or project.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    path = os.path.join(settings.upload_dir, str(current_user.id), doc.stored_filename)
+    path = document_path(current_user.id, doc)
     return FileResponse(path, media_type="application/octet-stream", filename=doc.orig_filename)
 
+@router.post("/{doc_id}/ingest", response_model=DocumentBase)
+def retry_document_ingestion(doc_id: int, current_user: User = Depends(get_current_user)):
+    """Queue a document whose ingestion failed for another attempt"""
+    doc = get_document_by_id(doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    # Verify the document belongs to a project owned by the user
+    project = get_project_by_id(doc.project_id)
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    if doc.status != "failed":
+        raise HTTPException(status_code=409, detail=f"Document is {doc.status}")
+    doc = update_document_status(doc_id, "pending")
+    enqueue_ingestion(current_user.id, doc)
+    return doc
+
+@router.get("/{doc_id}/text")
+def read_document_text(
+    doc_id: int,
+    start_page: Optional[int] = Query(None, ge=1, description="First page (1-based); PDFs only"),
+    end_page: Optional[int] = Query(None, ge=1, description="Last page, inclusive"),
+    start: int = Query(0, ge=0, description="First character, when no page range is given"),
+    end: Optional[int] = Query(None, ge=0, description="End character (exclusive)"),
+    current_user: User = Depends(get_current_user)
+):
+    """A page range or character slice of a document's extracted text, read without loading the whole document"""
+    doc = get_document_by_id(doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    # Verify the document belongs to a project owned by the user
+    project = get_project_by_id(doc.project_id)
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if doc.status != "ready":
+        raise HTTPException(status_code=409, detail=f"Document is {doc.status}")
+    
+    try:
+        doc_text = open_document_text(current_user.id, doc)
+    except DocumentTextUnavailable:
+        reingest_document(current_user.id, doc)
+        raise HTTPException(status_code=409, detail="Document is being processed again")
+    with doc_text:
+        if start_page is not None or end_page is not None:
+            first = (start_page or 1) - 1
+            start, end = doc_text.page_bounds(first, end_page or first + 1)
+        else:
+            end = len(doc_text) if end is None else min(end, len(doc_text))
+        return {
+            "document_id": doc_id,
+            "start": start,
+            "end": max(start, end),
+            "chars": len(doc_text),
+            "page_count": doc_text.page_count,
+            "text": doc_text[start:end],
+        }
+
+@router.put("/{doc_id}", response_model=DocumentBase)
+def replace_document(
+    doc_id: int,
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Upload a new version of a document. The document keeps its id and
+    podcasts; re-ingestion reuses the embeddings of unchanged chunks, and
+    the next generation re-summarizes only the chunks whose pages changed.
+    """
+    doc = get_document_by_id(doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    # Verify the document belongs to a project owned by the user
+    project = get_project_by_id(doc.project_id)
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if doc.status in ("pending", "processing"):
+        raise HTTPException(status_code=409, detail="Document is still being processed")
+    
+    ext = os.path.splitext(file.filename)[1].lower()
+    if ext not in [".pdf", ".docx"]:
+        raise HTTPException(status_code=400, detail="Invalid file type")
+    if file.size is not None and file.size > max_upload_bytes():
+        raise HTTPException(status_code=413, detail=f"File exceeds the {settings.max_upload_mb} MB upload limit")
+    
+    try:
+        staged_path, sha256, size = save_upload(file.file, ext)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if sha256 == doc.sha256:
+        os.remove(staged_path)
+        return doc
+    
+    # The old version's text hash keys its chunk layout and chunk summaries
+    previous_text_sha256 = None
+    if doc.status == "ready":
+        try:
+            with open_document_text(current_user.id, doc) as doc_text:
+                previous_text_sha256 = doc_text.meta["sha256"]
+        except Exception as e:
+            print(f"Could not read the current text of document {doc_id}: {e}")
+    
+    # The request's session hands back this same object once it is updated
+    previous = snapshot_document(doc)
+    cancel_jobs_for_document(doc_id)
+    try:
+        updated = replace_document_file(doc_id, previous.version, file.filename, f"{uuid.uuid4()}{ext}", ext[1:],
+                                        sha256, previous_text_sha256)
+    except Exception:
+        os.remove(staged_path)
+        raise
+    if updated is None:
+        os.remove(staged_path)
+        raise HTTPException(status_code=409, detail="Document was changed by another request")
+    if not _move_into_blob_store(staged_path, sha256, ext,
+                                 lambda: restore_document_file(doc_id, updated.version, previous)):
+        raise HTTPException(status_code=500, detail="Could not store the uploaded file")
+    enqueue_ingestion(current_user.id, updated, previous=previous)
+    return updated
+
 @router.delete("/{doc_id}")
 def delete_document_route(doc_id: int, current_user: User = Depends(get_current_user)):
     """Delete a document"""
@@ -91,10 +446,13 @@ def delete_document_route(doc_id: int, current_user: User = Depends(get_current_
     if not project or project.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Document not found")
     
+    # Stop any generation still running off this document
+    cancel_jobs_for_document(doc_id)
     delete_document(doc_id)
-    path = os.path.join(settings.upload_dir, str(current_user.id), doc.stored_filename)
-    if os.path.exists(path):
-        os.remove(path)
+    remove_document_from_index(doc.project_id, doc_id)
+    search.remove_document(doc_id)
+    # The file itself goes only when no other document shares it
+    release_blob(current_user.id, doc)
     return {"detail": "Document deleted"}
 
 @router.delete("/{doc_id}/file")
@@ -109,7 +467,6 @@ def delete_document_file(doc_id: int, current_user: User = Depends(get_current_u
     if not project or project.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    path = os.path.join(settings.upload_dir, str(current_user.id), doc.stored_filename)
-    if os.path.exists(path):
-        os.remove(path)
+    # Other documents made from the same upload keep their copy
+    release_blob(current_user.id, doc)
     return {"detail": "Document file deleted"}
\ No newline at end of file
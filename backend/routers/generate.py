@@ -1,27 +1,44 @@
 import os
+import time
 
-from pytest import Session
-from models.database import get_db
+from sqlalchemy.orm import Session
+from models.database import get_db, session_scope, worker_session
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from fastapi.responses import FileResponse
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pydantic import BaseModel
+from typing import List, Optional
 from sqlalchemy import text
 from core.security import get_current_user
 from models.user import User
-from models.document import get_document_by_id
-from models.podcast import Podcast, create_podcast, get_podcasts_for_user, get_podcast_by_id
+from models.document import get_document_by_id, get_documents_for_project
+from models.podcast import Podcast, create_podcast, get_podcasts_for_user, get_podcast_by_id, update_podcast_audio
+from models.podcast_usage import store_podcast_usage, get_podcast_usage, delete_podcast_usage
 from models.schemas import PodcastBase
-from services.file_service import get_document_text
-from services.summarization import generate_podcast_script, generate_summary
-from services.tts import synthesize_podcast_audio
+from services.file_service import load_stored_text, remove_podcast_audio, stored_text_meta
+from services.ingestion import reingest_document
+from services.summarization import generate_podcast_script, generate_summary, summary_prompt_hash, script_prompt_hash
+from services.llm_cache import get_or_generate, lookup, text_sha256
+from services.tts import synthesize_podcast_audio, resynthesize_podcast_audio, BatchSynthesizer
+from services import search
+from services.jobs import JobCancelled, create_job, get_job, get_jobs_for_user, cancel_job
 from models.project import get_project_by_id
+from core.config import settings
 
 router = APIRouter(prefix="/generate", tags=["generate"])
 
+class BatchGenerationRequest(BaseModel):
+    document_ids: Optional[List[int]] = None  # None means every document in the project
+    force_fresh_script: bool = False
+
+class ScriptUpdateRequest(BaseModel):
+    script: str
+
 @router.post("/{doc_id}")
 def start_podcast_generation(
     doc_id: int,
     background_tasks: BackgroundTasks,
+    force_fresh_script: bool = False,
     current_user: User = Depends(get_current_user)
 ):
     doc = get_document_by_id(doc_id)
@@ -32,9 +49,76 @@ def start_podcast_generation(
     project = get_project_by_id(doc.project_id)
     if not project or project.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Document not found")
+    if doc.status != "ready":
+        raise HTTPException(status_code=409, detail=f"Document is {doc.status}")
+    if stored_text_meta(current_user.id, doc) is None:
+        reingest_document(current_user.id, doc)
+        raise HTTPException(status_code=409, detail="Document is being processed again")
     
-    background_tasks.add_task(_process_generation, current_user.id, doc)
-    return {"detail": "Podcast generation started"}
+    job = create_job(current_user.id, doc_id=doc.id, project_id=doc.project_id)
+    background_tasks.add_task(_process_generation, current_user.id, doc, job, force_fresh_script)
+    return {"detail": "Podcast generation started", "job_id": job.id}
+
+@router.post("/project/{project_id}")
+def start_project_generation(
+    project_id: int,
+    background_tasks: BackgroundTasks,
+    request: Optional[BatchGenerationRequest] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Generate podcasts for every document in a project, or a selected subset, as one batch"""
+    project = get_project_by_id(project_id)
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    docs = get_documents_for_project(project_id)
+    if request and request.document_ids is not None:
+        wanted = set(request.document_ids)
+        missing = wanted - {doc.id for doc in docs}
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Documents not found in project: {sorted(missing)}")
+        docs = [doc for doc in docs if doc.id in wanted]
+    if not docs:
+        raise HTTPException(status_code=400, detail="No documents to generate from")
+    not_ready = sorted(doc.id for doc in docs if doc.status != "ready")
+    if not_ready:
+        raise HTTPException(status_code=409, detail=f"Documents not ready yet: {not_ready}")
+    stale = [doc for doc in docs if stored_text_meta(current_user.id, doc) is None]
+    for doc in stale:
+        reingest_document(current_user.id, doc)
+    if stale:
+        raise HTTPException(status_code=409, detail=f"Documents being processed again: {sorted(doc.id for doc in stale)}")
+
+    batch = create_job(current_user.id, project_id=project_id)
+    for doc in docs:
+        create_job(current_user.id, doc_id=doc.id, project_id=project_id, parent=batch)
+    force_fresh_script = bool(request and request.force_fresh_script)
+    background_tasks.add_task(_process_batch_generation, current_user.id, docs, batch, force_fresh_script)
+    return {"detail": "Batch podcast generation started", "job_id": batch.id, "documents": [child.to_dict() for child in batch.children]}
+
+@router.get("/jobs")
+def list_generation_jobs(current_user: User = Depends(get_current_user)):
+    """List the current user's generation jobs"""
+    return [job.to_dict() for job in get_jobs_for_user(current_user.id)]
+
+@router.get("/jobs/{job_id}")
+def get_generation_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Get the status of a generation job"""
+    job = get_job(job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@router.delete("/jobs/{job_id}")
+def cancel_generation_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Cancel an in-flight generation job; it stops at the next stage or segment boundary"""
+    job = get_job(job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status not in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    cancel_job(job_id)
+    return {"detail": "Cancellation requested", "job_id": job_id}
 
 @router.delete("/{podcast_id}")
 def delete_podcast(
@@ -70,10 +154,10 @@ def delete_podcast(
     if not project or project.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Podcast not found")
     
-    # Delete the audio file from disk
-    if audio_filename and os.path.exists(audio_filename):
+    # Delete the audio file (and its master) from disk
+    if audio_filename:
         try:
-            os.remove(audio_filename)
+            remove_podcast_audio(audio_filename)
             print(f"[DEBUG] Deleted audio file: {audio_filename}")
         except Exception as e:
             print(f"[DEBUG] Error deleting audio file {audio_filename}: {e}")
@@ -85,6 +169,8 @@ def delete_podcast(
             {"podcast_id": podcast_id}
         )
         db.commit()
+        search.remove_podcast(podcast_id)
+        delete_podcast_usage(podcast_id=podcast_id)
         print(f"[DEBUG] Deleted podcast database record: {podcast_id}")
     except Exception as e:
         db.rollback()
@@ -126,10 +212,10 @@ def delete_podcast_audio(
     if not project or project.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Podcast not found")
     
-    # Delete the audio file from disk
+    # Delete the audio file (and its master) from disk
     if audio_filename and os.path.exists(audio_filename):
         try:
-            os.remove(audio_filename)
+            remove_podcast_audio(audio_filename)
             print(f"[DEBUG] Deleted audio file: {audio_filename}")
         except Exception as e:
             print(f"[DEBUG] Error deleting audio file {audio_filename}: {e}")
@@ -231,21 +317,18 @@ def fetch_podcast_audio(podcast_id: int, current_user: User = Depends(get_curren
                     print(f"[DEBUG] Using replacement file: {replacement_file}")
                     
                     # Update the database record with the new filename
-                    from models.database import SessionLocal
-                    db = SessionLocal()
-                    try:
-                        db.execute(
-                            text("UPDATE podcasts SET audio_filename = :new_filename WHERE id = :podcast_id"),
-                            {"new_filename": replacement_file, "podcast_id": podcast_id}
-                        )
-                        db.commit()
-                        print(f"[DEBUG] Updated podcast {podcast_id} audio_filename to {replacement_file}")
-                        audio_filename = replacement_file
-                    except Exception as e:
-                        print(f"[DEBUG] Failed to update database: {e}")
-                        db.rollback()
-                    finally:
-                        db.close()
+                    with session_scope() as db:
+                        try:
+                            db.execute(
+                                text("UPDATE podcasts SET audio_filename = :new_filename WHERE id = :podcast_id"),
+                                {"new_filename": replacement_file, "podcast_id": podcast_id}
+                            )
+                            db.commit()
+                            print(f"[DEBUG] Updated podcast {podcast_id} audio_filename to {replacement_file}")
+                            audio_filename = replacement_file
+                        except Exception as e:
+                            print(f"[DEBUG] Failed to update database: {e}")
+                            db.rollback()
                 else:
                     print(f"[DEBUG] No MP3 files found in directory {dir_path}")
             else:
@@ -324,24 +407,165 @@ def fetch_podcast_script(podcast_id: int, current_user: User = Depends(get_curre
         "segment_timings": parsed_timings
     }
 
-def _process_generation(user_id: int, doc):
+@router.get("/{podcast_id}/usage")
+def fetch_podcast_usage(podcast_id: int, current_user: User = Depends(get_current_user)):
+    """LLM tokens and timings per stage, and TTS time, spent generating a podcast"""
+    pod = get_podcast_by_id(podcast_id)
+    if not pod:
+        raise HTTPException(status_code=404, detail="Podcast not found")
+
+    project_id = pod._mapping["project_id"] if hasattr(pod, '_mapping') else pod.project_id
+    project = get_project_by_id(project_id)
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Podcast not found")
+
+    stages = [row.to_dict() for row in get_podcast_usage(podcast_id)]
+    return {
+        "podcast_id": podcast_id,
+        "stages": stages,
+        "total_prompt_tokens": sum(stage["prompt_tokens"] for stage in stages),
+        "total_eval_tokens": sum(stage["eval_tokens"] for stage in stages),
+        "total_wall_seconds": sum(stage["wall_seconds"] for stage in stages),
+    }
+
+@router.put("/{podcast_id}/script")
+def update_podcast_script(
+    podcast_id: int,
+    request: ScriptUpdateRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Replace a podcast's script, re-synthesizing only the lines that changed"""
+    pod = get_podcast_by_id(podcast_id)
+    if not pod:
+        raise HTTPException(status_code=404, detail="Podcast not found")
+
+    # Handle both SQLAlchemy model objects and Row objects
+    fields = pod._mapping if hasattr(pod, '_mapping') else {
+        "project_id": pod.project_id,
+        "document_id": pod.document_id,
+        "audio_filename": pod.audio_filename,
+        "segment_timings": getattr(pod, 'segment_timings', None),
+    }
+
+    project = get_project_by_id(fields["project_id"])
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Podcast not found")
+
+    if not request.script.strip():
+        raise HTTPException(status_code=400, detail="Script is empty")
+
+    old_audio = fields["audio_filename"]
+    old_timings = None
+    if fields.get("segment_timings"):
+        try:
+            import json
+            old_timings = json.loads(fields["segment_timings"])
+        except (json.JSONDecodeError, TypeError) as e:
+            print(f"[DEBUG] Failed to parse segment timings: {e}")
+
+    doc_id = fields["document_id"] or 0
+    try:
+        if old_timings and old_audio and os.path.exists(old_audio):
+            audio_path, duration, segment_timings, resynthesized = resynthesize_podcast_audio(
+                current_user.id, doc_id, old_audio, old_timings, request.script
+            )
+        else:
+            # Nothing to splice into; render the whole script
+            print(f"[DEBUG] No timings or audio for podcast {podcast_id}, synthesizing full script")
+            audio_path, duration, segment_timings = synthesize_podcast_audio(current_user.id, doc_id, request.script)
+            resynthesized = len([t for t in segment_timings if t["speaker"] != "narrative"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    update_podcast_audio(podcast_id, request.script, audio_path, duration, segment_timings)
+    try:
+        search.index_podcast_script(fields["project_id"], podcast_id, pod.title, request.script, segment_timings)
+    except Exception as e:
+        print(f"[DEBUG] Error updating search index for podcast {podcast_id}: {e}")
+
+    if old_audio and old_audio != audio_path and os.path.exists(old_audio):
+        try:
+            remove_podcast_audio(old_audio)
+        except Exception as e:
+            print(f"[DEBUG] Error deleting old audio file {old_audio}: {e}")
+
+    return {
+        "script": request.script,
+        "segment_timings": segment_timings,
+        "duration": duration,
+        "resynthesized_segments": resynthesized
+    }
+
+def _process_generation(user_id: int, doc, job, force_fresh_script: bool = False):
+    with worker_session():
+        try:
+            _run_generation(user_id, doc, job, force_fresh_script)
+            job.finish("completed")
+        except JobCancelled:
+            print(f"Podcast generation cancelled for document ID: {doc.id} (job {job.id})")
+            job.finish("cancelled")
+        except Exception as e:
+            print(f"Podcast generation failed for document ID: {doc.id} (job {job.id}): {e}")
+            job.finish("failed", str(e))
+
+def _write_script(text: str, job, force_fresh_script: bool = False, page_offsets: list = None,
+                  previous_text_hash: str = None) -> str:
+    """
+    Summary and script for a document text, reusing cached LLM artifacts for
+    the same text, model and prompt version. A cached script makes the
+    summary unnecessary, so it is checked first. For a replaced document,
+    previous_text_hash lets the summary reuse the old version's chunk summaries.
+    """
+    text_hash = text_sha256(text)
+    if not force_fresh_script:
+        script = lookup("script", text_hash, script_prompt_hash())
+        if script is not None:
+            print(f"[CACHE] script hit for text {text_hash[:12]}")
+            return script
+
+    job.set_stage("summarizing")
+    summary = get_or_generate(
+        "summary", text_hash, summary_prompt_hash(),
+        lambda: generate_summary(text, cancel_event=job.cancel_event, page_offsets=page_offsets, usage=job.usage,
+                                 previous_text_hash=previous_text_hash)
+    )
+    job.set_stage("scripting")
+    return get_or_generate(
+        "script", text_hash, script_prompt_hash(),
+        lambda: generate_podcast_script(summary, cancel_event=job.cancel_event, usage=job.usage),
+        force=force_fresh_script
+    )
+
+def _run_generation(user_id: int, doc, job, force_fresh_script: bool = False):
     print(f"Starting podcast generation for document ID: {doc.id}, user ID: {user_id}")
     
     # 1. Extract text
-    text = get_document_text(user_id, doc.stored_filename)
+    job.set_stage("extracting")
+    text, text_meta = load_stored_text(user_id, doc)
     print(f"Extracted text length: {len(text)} characters")
     
-    # 2. Generate script
-    summary = generate_summary(text)
-    script  = generate_podcast_script(summary)
+    # 2. Generate script (or reuse a cached one)
+    script = _write_script(text, job, force_fresh_script, text_meta.get("page_offsets"), doc.previous_text_sha256)
     print(f"Generated script length: {len(script)} characters")
     
     # 3. Produce audio with timing data
-    audio_path, duration, segment_timings = synthesize_podcast_audio(user_id, doc.id, script)
+    job.set_stage("synthesizing")
+    started = time.monotonic()
+    audio_path, duration, segment_timings = synthesize_podcast_audio(user_id, doc.id, script, cancel_event=job.cancel_event)
+    job.usage.add_wall_time("tts", time.monotonic() - started)
     print(f"Generated audio at: {audio_path}, duration: {duration}s")
     print(f"Generated {len(segment_timings)} timing segments")
     
     # 4. Store record with timing data
+    _save_podcast(doc, job, script, audio_path, duration, segment_timings)
+
+def _save_podcast(doc, job, script: str, audio_path: str, duration: float, segment_timings: list):
+    try:
+        job.set_stage("saving")
+    except JobCancelled:
+        # The audio is already on disk; don't leave it orphaned
+        remove_podcast_audio(audio_path)
+        raise
     title = f"Podcast of {doc.orig_filename}"
     print(f"Creating podcast record with title: {title}, document_id: {doc.id}, project_id: {doc.project_id}")
     
@@ -359,5 +583,104 @@ def _process_generation(user_id: int, doc):
         segment_timings=segment_timings
     )
     
+    job.podcast_id = podcast.id if hasattr(podcast, 'id') else None
+    if job.podcast_id is not None:
+        try:
+            search.index_podcast_script(project_id, job.podcast_id, title, script, segment_timings)
+        except Exception as e:
+            print(f"Error adding podcast {job.podcast_id} to search index: {e}")
+        try:
+            store_podcast_usage(job.podcast_id, project_id, job.usage.to_dict())
+        except Exception as e:
+            print(f"Error storing usage for podcast {job.podcast_id}: {e}")
     print(f"Podcast created successfully with ID: {podcast.id if hasattr(podcast, 'id') else 'Unknown'}")
-    print(f"Stored timing data for {len(segment_timings)} segments")
\ No newline at end of file
+    print(f"Stored timing data for {len(segment_timings)} segments")
+
+def _process_batch_generation(user_id: int, docs: list, batch, force_fresh_script: bool = False):
+    """
+    Generate podcasts for several documents as one pipeline:
+    all extractions run in parallel, each finished text is handed to the LLM
+    pool (bounded by batch_llm_concurrency), and each finished script is
+    queued on one shared TTS stream.
+    """
+    with worker_session():
+        print(f"Starting batch podcast generation for {len(docs)} documents, user ID: {user_id}")
+        if batch.cancelled:
+            for child in batch.children:
+                child.finish("cancelled")
+            batch.finish("cancelled")
+            return
+        batch.status = "running"
+        jobs = {child.doc_id: child for child in batch.children}
+        docs_by_id = {doc.id: doc for doc in docs}
+
+        def fail(doc_id: int, exc: Exception):
+            job = jobs[doc_id]
+            if isinstance(exc, JobCancelled) or job.cancelled:
+                print(f"Batch generation cancelled for document ID: {doc_id}")
+                job.finish("cancelled")
+            else:
+                print(f"Batch generation failed for document ID: {doc_id}: {exc}")
+                job.finish("failed", str(exc))
+
+        def extract(doc):
+            jobs[doc.id].set_stage("extracting")
+            return load_stored_text(user_id, doc)
+
+        def write_script(doc, text: str, text_meta: dict) -> str:
+            return _write_script(text, jobs[doc.id], force_fresh_script, text_meta.get("page_offsets"),
+                                 doc.previous_text_sha256)
+
+        synthesizer = BatchSynthesizer()
+        try:
+            with ThreadPoolExecutor(max_workers=min(len(docs), 8)) as extract_pool, \
+                 ThreadPoolExecutor(max_workers=max(1, settings.batch_llm_concurrency)) as llm_pool:
+                # 1. Extraction for every document at once; LLM work starts as each text lands
+                extract_futures = {extract_pool.submit(extract, doc): doc for doc in docs}
+                script_futures = {}
+                for fut in as_completed(extract_futures):
+                    doc = extract_futures[fut]
+                    try:
+                        text, text_meta = fut.result()
+                        print(f"Extracted text length for document {doc.id}: {len(text)} characters")
+                        jobs[doc.id].set_stage("queued_for_llm")
+                        script_futures[llm_pool.submit(write_script, doc, text, text_meta)] = doc
+                    except Exception as e:
+                        fail(doc.id, e)
+
+                # 2. Feed each script into the shared synthesis stream as soon as it is written
+                scripted = []
+                for fut in as_completed(script_futures):
+                    doc = script_futures[fut]
+                    try:
+                        script = fut.result()
+                        print(f"Generated script length for document {doc.id}: {len(script)} characters")
+                        jobs[doc.id].set_stage("synthesizing")
+                        synthesizer.submit(doc.id, script)
+                        scripted.append((doc.id, script))
+                    except Exception as e:
+                        fail(doc.id, e)
+
+            # 3. Assemble and store podcasts in the order their scripts were queued
+            for doc_id, script in scripted:
+                job = jobs[doc_id]
+                try:
+                    audio_path, duration, segment_timings = synthesizer.finish(user_id, doc_id, cancel_event=job.cancel_event)
+                    _save_podcast(docs_by_id[doc_id], job, script, audio_path, duration, segment_timings)
+                    job.finish("completed")
+                except Exception as e:
+                    synthesizer.discard(doc_id)
+                    fail(doc_id, e)
+        finally:
+            synthesizer.close()
+
+        statuses = [child.status for child in batch.children]
+        if batch.cancelled:
+            batch.finish("cancelled")
+        elif all(status == "completed" for status in statuses):
+            batch.finish("completed")
+        elif any(status == "completed" for status in statuses):
+            batch.finish("partial")
+        else:
+            batch.finish("failed", "No podcasts were generated")
+        print(f"Batch generation finished: {statuses.count('completed')}/{len(statuses)} podcasts created")
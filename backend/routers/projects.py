@@ -1,13 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List
 from core.security import get_current_user
 from models.user import User
 from models.project import (
-    Project, create_project, get_projects_for_user, 
+    Project, create_project, get_projects_with_counts_for_user, get_project_with_counts,
     get_project_by_id, update_project, delete_project
 )
 from models.document import get_documents_for_project
 from models.podcast import get_podcasts_for_project
+from services.embeddings import remove_project as remove_project_index
+from models.chat_session import delete_chat_sessions_for_project
+from models.podcast_usage import delete_podcast_usage
+from services.search import search_project, remove_project as remove_project_from_search
+from services.blob_store import release_blob
+from services.file_service import remove_podcast_audio
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/projects", tags=["projects"])
@@ -32,6 +38,17 @@ class ProjectResponse(BaseModel):
     class Config:
         from_attributes = True
 
+def _project_response(project: Project, document_count: int = 0, podcast_count: int = 0) -> ProjectResponse:
+    return ProjectResponse(
+        id=project.id,
+        name=project.name,
+        description=project.description,
+        created_at=project.created_at.isoformat(),
+        updated_at=project.updated_at.isoformat(),
+        document_count=document_count,
+        podcast_count=podcast_count
+    )
+
 @router.post("", response_model=ProjectResponse)
 def create_new_project(
     project_data: ProjectCreate,
@@ -44,41 +61,17 @@ def create_new_project(
         description=project_data.description
     )
     
-    # Add counts
-    documents = get_documents_for_project(project.id)
-    podcasts = get_podcasts_for_project(project.id)
-    
-    return ProjectResponse(
-        id=project.id,
-        name=project.name,
-        description=project.description,
-        created_at=project.created_at.isoformat(),
-        updated_at=project.updated_at.isoformat(),
-        document_count=len(documents),
-        podcast_count=len(podcasts)
-    )
+    # A new project has no documents or podcasts yet
+    return _project_response(project)
 
 @router.get("", response_model=List[ProjectResponse])
 def list_projects(current_user: User = Depends(get_current_user)):
     """Get all projects for the current user"""
-    projects = get_projects_for_user(current_user.id)
-    
-    result = []
-    for project in projects:
-        documents = get_documents_for_project(project.id)
-        podcasts = get_podcasts_for_project(project.id)
-        
-        result.append(ProjectResponse(
-            id=project.id,
-            name=project.name,
-            description=project.description,
-            created_at=project.created_at.isoformat(),
-            updated_at=project.updated_at.isoformat(),
-            document_count=len(documents),
-            podcast_count=len(podcasts)
-        ))
-    
-    return result
+    # Counts come back with the projects in a single query
+    return [
+        _project_response(project, document_count, podcast_count)
+        for project, document_count, podcast_count in get_projects_with_counts_for_user(current_user.id)
+    ]
 
 @router.get("/{project_id}", response_model=ProjectResponse)
 def get_project(
@@ -86,23 +79,27 @@ def get_project(
     current_user: User = Depends(get_current_user)
 ):
     """Get a specific project by ID"""
+    row = get_project_with_counts(project_id)
+    
+    if not row or row[0].user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    return _project_response(*row)
+
+@router.get("/{project_id}/search")
+def search_project_content(
+    project_id: int,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user)
+):
+    """Full-text search over a project's document text and podcast scripts"""
     project = get_project_by_id(project_id)
     
     if not project or project.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    documents = get_documents_for_project(project.id)
-    podcasts = get_podcasts_for_project(project.id)
-    
-    return ProjectResponse(
-        id=project.id,
-        name=project.name,
-        description=project.description,
-        created_at=project.created_at.isoformat(),
-        updated_at=project.updated_at.isoformat(),
-        document_count=len(documents),
-        podcast_count=len(podcasts)
-    )
+    return {"query": q, "results": search_project(project_id, q, limit)}
 
 @router.put("/{project_id}", response_model=ProjectResponse)
 def update_project_route(
@@ -122,18 +119,7 @@ def update_project_route(
         description=project_data.description
     )
     
-    documents = get_documents_for_project(updated_project.id)
-    podcasts = get_podcasts_for_project(updated_project.id)
-    
-    return ProjectResponse(
-        id=updated_project.id,
-        name=updated_project.name,
-        description=updated_project.description,
-        created_at=updated_project.created_at.isoformat(),
-        updated_at=updated_project.updated_at.isoformat(),
-        document_count=len(documents),
-        podcast_count=len(podcasts)
-    )
+    return _project_response(*get_project_with_counts(updated_project.id))
 
 @router.delete("/{project_id}")
 def delete_project_route(
@@ -150,13 +136,7 @@ def delete_project_route(
     documents = get_documents_for_project(project_id)
     podcasts = get_podcasts_for_project(project_id)
     
-    # Delete document files
     import os
-    from core.config import settings
-    for doc in documents:
-        file_path = os.path.join(settings.upload_dir, str(current_user.id), doc.stored_filename)
-        if os.path.exists(file_path):
-            os.remove(file_path)
     
     # Delete podcast audio files
     for podcast in podcasts:
@@ -165,10 +145,17 @@ def delete_project_route(
         else:
             audio_filename = podcast.get('audio_filename')
         
-        if audio_filename and os.path.exists(audio_filename):
-            os.remove(audio_filename)
+        if audio_filename:
+            remove_podcast_audio(audio_filename)
     
     # Delete the project (cascade will handle documents and podcasts)
+    delete_chat_sessions_for_project(project_id)
+    delete_podcast_usage(project_id=project_id)
     delete_project(project_id)
+    # Document files go once the rows are gone, unless another project shares the same upload
+    for doc in documents:
+        release_blob(current_user.id, doc)
+    remove_project_index(project_id)
+    remove_project_from_search(project_id)
     
     return {"detail": "Project deleted successfully"} 
\ No newline at end of file
@@ -0,0 +1,52 @@
+import os
+import threading
+
+from models.document import count_documents_with_hash
+from services.embeddings import remove_blob_vectors
+from services.file_service import blob_path, delete_document_text, legacy_upload_path
+
+# Guards the check-then-act steps below: a blob is never removed while another upload is moving it in
+_blob_lock = threading.Lock()
+
+
+def store_blob(staged_path: str, sha256: str, ext: str) -> str:
+    """
+    Move a staged upload into the blob store, or drop it when an identical
+    upload is already there. Create the Document row first: release_blob
+    counts rows, so a blob with a row is never collected out from under it.
+    """
+    path = blob_path(sha256, ext)
+    with _blob_lock:
+        if os.path.exists(path):
+            os.remove(staged_path)
+            print(f"[BLOB] Reusing stored upload {sha256[:12]}")
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(staged_path, path)
+    return path
+
+
+def release_blob(user_id: int, doc) -> bool:
+    """
+    Drop one document's claim on its upload. The blob and everything derived
+    from it (extracted text, cached embeddings) is deleted only when no other
+    document references the same sha256. Returns True if the blob was deleted.
+    """
+    # Pre-blob uploads have a private copy named after the document
+    legacy_path = legacy_upload_path(user_id, doc.stored_filename)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+    if not doc.sha256:
+        delete_document_text(user_id, doc)
+        return False
+
+    with _blob_lock:
+        if count_documents_with_hash(doc.sha256, exclude_id=doc.id):
+            return False
+        path = blob_path(doc.sha256, os.path.splitext(doc.stored_filename)[1].lower())
+        if os.path.exists(path):
+            os.remove(path)
+        delete_document_text(user_id, doc)
+        remove_blob_vectors(doc.sha256)
+    print(f"[BLOB] Deleted upload {doc.sha256[:12]}, no documents reference it")
+    return True
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import List, Tuple
+
+from core.config import settings
+from services.file_service import UPLOAD_CHUNK_BYTES, max_upload_bytes
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UploadSessionError(ValueError):
+    """Raised when a resumable upload request is invalid for its session."""
+
+
+class UploadSessionNotFound(LookupError):
+    """Raised when an upload session does not exist (or belongs to another user)."""
+
+
+def _sessions_dir(user_id: int) -> str:
+    return os.path.join(settings.upload_dir, str(user_id), ".uploads")
+
+
+def _session_dir(user_id: int, upload_id: str) -> str:
+    if not _UPLOAD_ID.match(upload_id or ""):
+        raise UploadSessionNotFound(upload_id)
+    return os.path.join(_sessions_dir(user_id), upload_id)
+
+
+def _chunk_length(session: dict, index: int) -> int:
+    start = index * session["chunk_size"]
+    return min(session["chunk_size"], session["size"] - start)
+
+
+def prune_stale_sessions(user_id: int):
+    """Drop sessions untouched for longer than upload_session_ttl_hours"""
+    root = _sessions_dir(user_id)
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - settings.upload_session_ttl_hours * 3600
+    for upload_id in os.listdir(root):
+        path = os.path.join(root, upload_id)
+        if os.path.getmtime(path) < cutoff:
+            print(f"[UPLOAD] Removing stale upload session {upload_id}")
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def create_upload_session(user_id: int, project_id: int, filename: str, size: int, sha256: str,
+                          chunk_size: int = None) -> dict:
+    """
+    Start a resumable upload: preallocate the target file and record what
+    the client promised to send. Chunks can then arrive in any order.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in (".pdf", ".docx"):
+        raise UploadSessionError("Invalid file type")
+    if size <= 0:
+        raise UploadSessionError("File is empty")
+    if size > max_upload_bytes():
+        raise UploadSessionError(f"File exceeds the {settings.max_upload_mb} MB upload limit")
+    sha256 = (sha256 or "").lower()
+    if not _SHA256.match(sha256):
+        raise UploadSessionError("sha256 must be 64 hex characters")
+    chunk_size = chunk_size or settings.upload_chunk_mb * 1024 * 1024
+    if not UPLOAD_CHUNK_BYTES // 16 <= chunk_size <= settings.upload_chunk_mb * 1024 * 1024:
+        raise UploadSessionError(f"chunk_size must be between {UPLOAD_CHUNK_BYTES // 16} and "
+                                 f"{settings.upload_chunk_mb * 1024 * 1024} bytes")
+
+    prune_stale_sessions(user_id)
+    upload_id = uuid.uuid4().hex
+    path = _session_dir(user_id, upload_id)
+    os.makedirs(os.path.join(path, "received"))
+    session = {
+        "upload_id": upload_id,
+        "user_id": user_id,
+        "project_id": project_id,
+        "filename": filename,
+        "ext": ext,
+        "size": size,
+        "sha256": sha256,
+        "chunk_size": chunk_size,
+        "chunk_count": -(-size // chunk_size),
+        "created_at": time.time(),
+    }
+    fd = os.open(os.path.join(path, "data.part"), os.O_WRONLY | os.O_CREAT, 0o600)
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+    with open(os.path.join(path, "session.json"), "w", encoding="utf-8") as f:
+        json.dump(session, f)
+    return session
+
+
+def load_upload_session(user_id: int, upload_id: str) -> dict:
+    path = _session_dir(user_id, upload_id)
+    try:
+        with open(os.path.join(path, "session.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        raise UploadSessionNotFound(upload_id)
+
+
+def received_chunks(session: dict) -> List[int]:
+    received_dir = os.path.join(_session_dir(session["user_id"], session["upload_id"]), "received")
+    return sorted(int(name) for name in os.listdir(received_dir) if name.isdigit())
+
+
+def session_status(session: dict) -> dict:
+    received = set(received_chunks(session))
+    return {
+        "upload_id": session["upload_id"],
+        "filename": session["filename"],
+        "size": session["size"],
+        "chunk_size": session["chunk_size"],
+        "chunk_count": session["chunk_count"],
+        "received": sorted(received),
+        "missing": [i for i in range(session["chunk_count"]) if i not in received],
+    }
+
+
+def expected_chunk_length(session: dict, index: int) -> int:
+    if not 0 <= index < session["chunk_count"]:
+        raise UploadSessionError(f"Chunk index must be between 0 and {session['chunk_count'] - 1}")
+    return _chunk_length(session, index)
+
+
+def write_chunk(session: dict, index: int, data: bytes):
+    """
+    Write one chunk at its offset with pwrite, then mark it received.
+    Chunks are independent, so parallel PUTs need no locking; resending a
+    chunk simply overwrites it.
+    """
+    expected = expected_chunk_length(session, index)
+    if len(data) != expected:
+        raise UploadSessionError(f"Chunk {index} must be {expected} bytes, got {len(data)}")
+    path = _session_dir(session["user_id"], session["upload_id"])
+    fd = os.open(os.path.join(path, "data.part"), os.O_WRONLY)
+    try:
+        view, offset = memoryview(data), index * session["chunk_size"]
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view, offset = view[written:], offset + written
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    # Marker last: a chunk only counts once its bytes are on disk
+    open(os.path.join(path, "received", str(index)), "wb").close()
+    os.utime(path)
+
+
+def finalize_upload(session: dict) -> Tuple[str, str]:
+    """
+    Check every chunk arrived and the assembled file matches the promised
+    sha256. Returns (assembled_path, sha256), ready for blob_store.store_blob;
+    abort_upload cleans up the session afterwards. A hash mismatch discards
+    the session.
+    """
+    status = session_status(session)
+    if status["missing"]:
+        raise UploadSessionError(f"{len(status['missing'])} chunks still missing")
+    path = _session_dir(session["user_id"], session["upload_id"])
+    data_path = os.path.join(path, "data.part")
+    digest = hashlib.sha256()
+    with open(data_path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b""):
+            digest.update(block)
+    if digest.hexdigest() != session["sha256"]:
+        abort_upload(session["user_id"], session["upload_id"])
+        raise UploadSessionError("Assembled file does not match the declared sha256; upload discarded")
+    return data_path, session["sha256"]
+
+
+def abort_upload(user_id: int, upload_id: str):
+    shutil.rmtree(_session_dir(user_id, upload_id), ignore_errors=True)
@@ -0,0 +1,98 @@
+import mmap
+from typing import Iterator, List, Optional, Tuple
+
+# Characters between byte-offset checkpoints in the char index
+TEXT_INDEX_STEP = 4096
+
+
+def build_char_index(text: str, step: int = TEXT_INDEX_STEP) -> List[int]:
+    """
+    Byte offset of every step-th character of text encoded as UTF-8, plus
+    the total byte length. Stored next to the text so a character range can
+    be read without decoding everything before it.
+    """
+    offsets, position = [], 0
+    for start in range(0, len(text), step):
+        offsets.append(position)
+        position += len(text[start:start + step].encode("utf-8"))
+    offsets.append(position)
+    return offsets
+
+
+class DocumentText:
+    """
+    Read-only, random-access view of a document in the text store. The text
+    file is memory-mapped; slicing decodes only the checkpoint segments that
+    cover the requested characters, so callers that need an excerpt or a
+    page range never load the whole document. Supports len() and text[a:b],
+    so code written for str slices (e.g. chunkers) works on it unchanged.
+    """
+
+    def __init__(self, text_path: str, meta: dict):
+        self.meta = meta
+        self.chars: int = meta["chars"]
+        self.page_offsets: Optional[List[int]] = meta.get("page_offsets")
+        self._step: int = meta.get("char_index_step", TEXT_INDEX_STEP)
+        self._byte_offsets: List[int] = meta["byte_offsets"]
+        self._file = open(text_path, "rb")
+        # mmap rejects empty files
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._byte_offsets[-1] else None
+
+    def __len__(self) -> int:
+        return self.chars
+
+    def __getitem__(self, key) -> str:
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("DocumentText supports contiguous slices only")
+        start, stop, _ = key.indices(self.chars)
+        return self.slice(start, stop)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def slice(self, start: int, end: int) -> str:
+        """Characters [start, end) of the document"""
+        start, end = max(0, start), min(end, self.chars)
+        if start >= end:
+            return ""
+        first, last = start // self._step, (end - 1) // self._step
+        segment = self._map[self._byte_offsets[first]:self._byte_offsets[last + 1]].decode("utf-8")
+        base = first * self._step
+        return segment[start - base:end - base]
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_offsets) if self.page_offsets else 1
+
+    def page_bounds(self, start_page: int, end_page: int) -> Tuple[int, int]:
+        """Character range covering pages [start_page, end_page), 0-based"""
+        if not self.page_offsets:
+            return (0, self.chars) if start_page < 1 <= end_page else (0, 0)
+        bounds = self.page_offsets + [self.chars]
+        start_page = max(0, min(start_page, len(self.page_offsets)))
+        end_page = max(start_page, min(end_page, len(self.page_offsets)))
+        return bounds[start_page], bounds[end_page]
+
+    def pages(self, start_page: int, end_page: int) -> str:
+        return self.slice(*self.page_bounds(start_page, end_page))
+
+    def iter_lines(self) -> Iterator[str]:
+        """Lines without their newline, decoded one at a time"""
+        if self._map is None:
+            return
+        position, size = 0, len(self._map)
+        while position < size:
+            newline = self._map.find(b"\n", position)
+            if newline == -1:
+                newline = size
+            yield self._map[position:newline].decode("utf-8")
+            position = newline + 1
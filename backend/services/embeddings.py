@@ -0,0 +1,316 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import settings
+from services.llm_client import get_llm_client
+from services.tokens import tokens_to_chars
+
+# Dimension of the local hashing embeddings used when no embedding model is configured
+HASH_EMBED_DIM = 512
+
+_WORD = re.compile(r"\w+")
+
+_project_locks: Dict[int, threading.Lock] = {}
+_project_locks_guard = threading.Lock()
+# project_id -> (vectors mtime, matrix, meta)
+_index_cache: Dict[int, Tuple[float, np.ndarray, dict]] = {}
+
+
+# ---------------------------------------------------------------------------
+# Chunking
+# ---------------------------------------------------------------------------
+
+def chunk_text(text, page_offsets: Optional[List[int]] = None) -> List[Tuple[int, int]]:
+    """
+    Split text into overlapping windows of about rag_chunk_tokens.
+    Windows end on a paragraph, sentence or word boundary where possible,
+    and never cross a page when page_offsets are given, so an edit to one
+    page leaves the other pages' chunks unchanged.
+    Returns (start, end) character offsets. text may be a str or a
+    DocumentText; each window is read once.
+    """
+    if not page_offsets:
+        return _chunk_range(text, 0, len(text))
+    bounds = list(page_offsets) + [len(text)]
+    return [span for i in range(len(page_offsets)) for span in _chunk_range(text, bounds[i], bounds[i + 1])]
+
+
+def _chunk_range(text, start: int, length: int) -> List[Tuple[int, int]]:
+    size = tokens_to_chars(settings.rag_chunk_tokens)
+    overlap = tokens_to_chars(settings.rag_chunk_overlap_tokens)
+    spans = []
+    while start < length:
+        end = min(start + size, length)
+        window = text[start:end]
+        if end < length:
+            for boundary in ("\n\n", ". ", "\n", " "):
+                cut = window.rfind(boundary, len(window) // 2)
+                if cut != -1:
+                    end = start + cut + len(boundary)
+                    window = window[:cut + len(boundary)]
+                    break
+        if window.strip():
+            spans.append((start, end))
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return spans
+
+
+# ---------------------------------------------------------------------------
+# Embedding
+# ---------------------------------------------------------------------------
+
+def _hash_embed(texts: List[str]) -> np.ndarray:
+    """Local stand-in: feature-hashed unigrams and bigrams with sublinear weights"""
+    matrix = np.zeros((len(texts), HASH_EMBED_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _WORD.findall(text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        if not features:
+            continue
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(matrix[row], hashes % HASH_EMBED_DIM, signs)
+    return np.sign(matrix) * np.log1p(np.abs(matrix))
+
+
+def embedding_model_name() -> str:
+    return settings.ollama_embed_model or f"local-hash-{HASH_EMBED_DIM}"
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """L2-normalized float32 embeddings, one row per text"""
+    if not texts:
+        return np.zeros((0, HASH_EMBED_DIM), dtype=np.float32)
+    if settings.ollama_embed_model:
+        matrix = np.asarray(get_llm_client().embed(texts, settings.ollama_embed_model), dtype=np.float32)
+    else:
+        matrix = _hash_embed(texts)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+# ---------------------------------------------------------------------------
+# Per-project index: vectors.npy (float32 matrix) + chunks.json (row metadata)
+# ---------------------------------------------------------------------------
+
+def _project_lock(project_id: int) -> threading.Lock:
+    with _project_locks_guard:
+        return _project_locks.setdefault(project_id, threading.Lock())
+
+
+def _index_paths(project_id: int) -> Tuple[str, str]:
+    project_dir = os.path.join(settings.index_dir, str(project_id))
+    return os.path.join(project_dir, "vectors.npy"), os.path.join(project_dir, "chunks.json")
+
+
+def _load_index(project_id: int) -> Tuple[np.ndarray, dict]:
+    vectors_path, meta_path = _index_paths(project_id)
+    if not os.path.exists(vectors_path) or not os.path.exists(meta_path):
+        return np.zeros((0, 0), dtype=np.float32), {"model": embedding_model_name(), "chunks": []}
+    mtime = os.path.getmtime(vectors_path)
+    cached = _index_cache.get(project_id)
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
+    matrix = np.load(vectors_path)
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("model") != embedding_model_name():
+        # Embedding model changed: vectors are not comparable, start over
+        print(f"[RAG] Index for project {project_id} built with {meta.get('model')}, discarding")
+        return np.zeros((0, 0), dtype=np.float32), {"model": embedding_model_name(), "chunks": []}
+    _index_cache[project_id] = (mtime, matrix, meta)
+    return matrix, meta
+
+
+def _save_index(project_id: int, matrix: np.ndarray, meta: dict):
+    vectors_path, meta_path = _index_paths(project_id)
+    os.makedirs(os.path.dirname(vectors_path), exist_ok=True)
+    # Write both files next to their targets and swap them in atomically
+    with open(vectors_path + ".tmp", "wb") as f:
+        np.save(f, matrix.astype(np.float32, copy=False))
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+    os.replace(vectors_path + ".tmp", vectors_path)
+    _index_cache.pop(project_id, None)
+
+
+def _without_document(matrix: np.ndarray, meta: dict, doc_id: int) -> Tuple[np.ndarray, dict]:
+    keep = [i for i, chunk in enumerate(meta["chunks"]) if chunk["document_id"] != doc_id]
+    documents = {key: sha for key, sha in meta.get("documents", {}).items() if key != str(doc_id)}
+    if len(keep) == len(meta["chunks"]) and len(documents) == len(meta.get("documents", {})):
+        return matrix, meta
+    return matrix[keep] if matrix.size else matrix, {**meta, "chunks": [meta["chunks"][i] for i in keep],
+                                                     "documents": documents}
+
+
+# ---------------------------------------------------------------------------
+# Per-blob cache: documents with identical uploads share chunk spans and vectors
+# ---------------------------------------------------------------------------
+
+def _blob_vector_paths(content_hash: str) -> Tuple[str, str]:
+    base = os.path.join(settings.index_dir, "blobs", content_hash[:2], content_hash)
+    return base + ".npy", base + ".json"
+
+
+def text_sha256(text) -> str:
+    """sha256 of a document's text, as recorded in its text store metadata"""
+    meta = getattr(text, "meta", None)
+    if meta and meta.get("sha256"):
+        return meta["sha256"]
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _chunk_settings(text) -> dict:
+    # Spans are offsets into one exact text: a re-extraction (other cleanup settings) invalidates them
+    return {
+        "model": embedding_model_name(),
+        "chunk_tokens": settings.rag_chunk_tokens,
+        "overlap_tokens": settings.rag_chunk_overlap_tokens,
+        "text_sha256": text_sha256(text),
+    }
+
+
+def _chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:32]
+
+
+def _load_blob_vectors(content_hash: str) -> Tuple[dict, np.ndarray]:
+    vectors_path, meta_path = _blob_vector_paths(content_hash)
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return meta, np.load(vectors_path)
+
+
+def _previous_vectors(previous_hash: str) -> Dict[str, np.ndarray]:
+    """Vectors of an earlier version's chunks by chunk hash, if they were made with the current settings"""
+    try:
+        meta, matrix = _load_blob_vectors(previous_hash)
+    except (OSError, ValueError):
+        return {}
+    old = meta.get("settings", {})
+    if (old.get("model"), old.get("chunk_tokens"), old.get("overlap_tokens")) != \
+            (embedding_model_name(), settings.rag_chunk_tokens, settings.rag_chunk_overlap_tokens):
+        return {}
+    return dict(zip(meta.get("hashes", []), matrix))
+
+
+def _embed_document(text, content_hash: str = None, page_offsets: Optional[List[int]] = None,
+                    previous_hash: str = None) -> Tuple[List[Tuple[int, int]], np.ndarray]:
+    """
+    Chunk spans and their vectors, reused from the blob cache when the same
+    upload was embedded before. With previous_hash (an earlier version of
+    the document), chunks whose text is unchanged take that version's vectors.
+    """
+    if content_hash:
+        vectors_path, meta_path = _blob_vector_paths(content_hash)
+        try:
+            meta, matrix = _load_blob_vectors(content_hash)
+            if meta["settings"] == _chunk_settings(text):
+                return [tuple(span) for span in meta["spans"]], matrix
+        except (OSError, ValueError, KeyError):
+            pass
+    spans = chunk_text(text, page_offsets)
+    pieces = [text[start:end] for start, end in spans]
+    hashes = [_chunk_hash(piece) for piece in pieces]
+    reusable = _previous_vectors(previous_hash) if previous_hash else {}
+    missing = [i for i, h in enumerate(hashes) if h not in reusable]
+    fresh = embed_texts([pieces[i] for i in missing])
+    if len(missing) == len(spans):
+        vectors = fresh
+    else:
+        rows = [reusable.get(h) for h in hashes]
+        for row, i in enumerate(missing):
+            rows[i] = fresh[row]
+        vectors = np.vstack(rows).astype(np.float32, copy=False)
+        print(f"[RAG] Reused {len(spans) - len(missing)} of {len(spans)} chunk embeddings from the previous version")
+    if content_hash:
+        os.makedirs(os.path.dirname(vectors_path), exist_ok=True)
+        tmp_suffix = f".{threading.get_ident()}.tmp"
+        with open(vectors_path + tmp_suffix, "wb") as f:
+            np.save(f, vectors)
+        with open(meta_path + tmp_suffix, "w", encoding="utf-8") as f:
+            json.dump({"settings": _chunk_settings(text), "spans": spans, "hashes": hashes}, f)
+        os.replace(vectors_path + tmp_suffix, vectors_path)
+        os.replace(meta_path + tmp_suffix, meta_path)
+    return spans, vectors
+
+
+def remove_blob_vectors(content_hash: str):
+    for path in _blob_vector_paths(content_hash):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def index_document(project_id: int, doc_id: int, filename: str, text, content_hash: str = None,
+                   page_offsets: Optional[List[int]] = None, previous_hash: str = None) -> int:
+    """
+    (Re)index one document's chunks in its project's index; returns the
+    chunk count. text is a str or a DocumentText. Pass the upload's sha256
+    as content_hash to share the embeddings with other documents made from
+    the same file, and the previous version's sha256 as previous_hash to
+    reuse the embeddings of unchanged chunks. Chunk text is not copied into
+    the index; read it back from the text store by its offsets, after checking
+    the chunk's text_sha256 against the stored text's.
+    """
+    spans, vectors = _embed_document(text, content_hash, page_offsets, previous_hash)
+    sha256 = text_sha256(text)
+    with _project_lock(project_id):
+        matrix, meta = _without_document(*_load_index(project_id), doc_id)
+        chunks = meta["chunks"] + [
+            {"document_id": doc_id, "filename": filename, "start": start, "end": end, "text_sha256": sha256}
+            for start, end in spans
+        ]
+        if len(vectors):  # a document without text (a scan) has no rows, but is still recorded as indexed
+            matrix = np.vstack([matrix, vectors]) if matrix.size else vectors
+        # document id -> text sha256 for every indexed document, including those with no chunks
+        documents = {**meta.get("documents", {}), str(doc_id): sha256}
+        _save_index(project_id, matrix, {"model": embedding_model_name(), "chunks": chunks, "documents": documents})
+    print(f"[RAG] Indexed document {doc_id} in project {project_id}: {len(spans)} chunks")
+    return len(spans)
+
+
+def remove_document(project_id: int, doc_id: int):
+    with _project_lock(project_id):
+        matrix, meta = _load_index(project_id)
+        new_matrix, new_meta = _without_document(matrix, meta, doc_id)
+        if new_meta is not meta:
+            _save_index(project_id, new_matrix, new_meta)
+
+
+def remove_project(project_id: int):
+    with _project_lock(project_id):
+        for path in _index_paths(project_id):
+            if os.path.exists(path):
+                os.remove(path)
+        _index_cache.pop(project_id, None)
+
+
+def indexed_text_hashes(project_id: int) -> Dict[int, Optional[str]]:
+    """document id -> sha256 of the text its chunks were cut from (None for older entries)"""
+    _, meta = _load_index(project_id)
+    hashes = {chunk["document_id"]: chunk.get("text_sha256") for chunk in meta["chunks"]}
+    hashes.update({int(key): sha for key, sha in meta.get("documents", {}).items()})
+    return hashes
+
+
+def search(project_id: int, query: str, k: int = None) -> List[dict]:
+    """Top-k chunks by cosine similarity to the query"""
+    k = k or settings.rag_top_k
+    matrix, meta = _load_index(project_id)
+    if not matrix.size:
+        return []
+    scores = matrix @ embed_texts([query])[0]
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [{**meta["chunks"][i], "score": float(scores[i])} for i in top]
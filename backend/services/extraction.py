@@ -0,0 +1,286 @@
+import multiprocessing
+import os
+import re
+from collections import Counter
+import threading
+import unicodedata
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+from xml.etree.ElementTree import iterparse
+
+from PyPDF2 import PdfReader
+
+from core.config import settings
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# Control characters other than tab, newline and form feed (page breaks)
+_CONTROL = re.compile(r"[\x00-\x08\x0b\x0e-\x1f\x7f]")
+_TRAILING_SPACE = re.compile(r"[ \t]+(?=\n)")
+_BLANK_RUNS = re.compile(r"\n{3,}")
+
+# Cleanup: lines this close to a page edge are header/footer candidates
+_EDGE_LINES = 3
+_PAGE_NUMBER = re.compile(r"^(page\s*)?[-–]?\s*\d{1,4}\s*[-–]?(\s*(of|/)\s*\d{1,4})?$", re.IGNORECASE)
+_HYPHEN_BREAK = re.compile(r"\b([^\W\d_]+)-\n([a-z]+)")
+_WORD_FORMS = re.compile(r"[^\W\d_]+(?:-[^\W\d_]+)*")
+# First parts of compounds that keep their hyphen when broken at the end of a line
+_COMPOUND_HEADS = frozenset({
+    "all", "cross", "end", "far", "first", "five", "four", "half", "high", "ill", "long", "low", "near",
+    "old", "one", "open", "real", "second", "self", "short", "so", "state", "third", "three", "two",
+    "well", "world",
+})
+_SPACE_RUNS = re.compile(r"[ \t]{2,}")
+_REFERENCES_HEADING = re.compile(r"^[ \t]*(\d+\.?[ \t]*)?(references|bibliography|works cited|literature cited)[ \t]*:?[ \t]*$",
+                                 re.IGNORECASE | re.MULTILINE)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _extract_workers() -> int:
+    return settings.extract_workers or os.cpu_count() or 1
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Workers are spawned, not forked: the server is multi-threaded (request
+                # threadpool, ingestion, health probes, torch) and a forked child can
+                # deadlock on a lock some other thread held at fork time
+                _pool = ProcessPoolExecutor(max_workers=_extract_workers(),
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def start_extraction_pool():
+    """Create the PDF extraction pool up front (app startup) rather than from an ingestion thread"""
+    if _extract_workers() >= 2:
+        _get_pool()
+
+
+# ---------------------------------------------------------------------------
+# PDF
+# ---------------------------------------------------------------------------
+
+def _extract_pdf_pages(path: str, start: int, stop: int) -> List[str]:
+    """Worker: text of pages [start, stop). Each worker opens the file itself; page objects don't pickle."""
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _join_pages(pages: List[str]) -> Tuple[str, List[int]]:
+    """One "\\n"-terminated block per page, joined once, with each page's start offset"""
+    offsets, position = [], 0
+    for page in pages:
+        offsets.append(position)
+        position += len(page) + 1
+    return "".join(page + "\n" for page in pages), offsets
+
+
+def extract_pdf(path: str) -> Tuple[str, List[int]]:
+    """
+    Text of a PDF and the offset where each page starts. PDFs with at least
+    extract_parallel_min_pages pages are split into contiguous page ranges
+    that are extracted in a process pool.
+    """
+    page_count = len(PdfReader(path).pages)
+    workers = _extract_workers()
+    if page_count < settings.extract_parallel_min_pages or workers < 2:
+        return _join_pages(_extract_pdf_pages(path, 0, page_count))
+
+    # A few ranges per worker evens out pages that are slower to parse
+    span = max(1, -(-page_count // (workers * 4)))
+    ranges = [(start, min(start + span, page_count)) for start in range(0, page_count, span)]
+    pool = _get_pool()
+    futures = [pool.submit(_extract_pdf_pages, path, start, stop) for start, stop in ranges]
+    pages = []
+    for fut in futures:
+        pages.extend(fut.result())
+    return _join_pages(pages)
+
+
+# ---------------------------------------------------------------------------
+# DOCX
+# ---------------------------------------------------------------------------
+
+def extract_docx(path: str) -> str:
+    """
+    Text of a DOCX, read by streaming word/document.xml instead of loading
+    the whole tree. Paragraphs become lines; each table row becomes one line
+    with its cells separated by " | ", in document order.
+    """
+    lines = []
+    runs: List[str] = []
+    # One entry per open table: finished cells of the current row, paragraphs of the current cell
+    tables: List[dict] = []
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+        for event, elem in iterparse(xml, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == f"{_W}tbl":
+                    tables.append({"cells": [], "paragraphs": []})
+                continue
+            if tag == f"{_W}t":
+                runs.append(elem.text or "")
+            elif tag == f"{_W}tab":
+                runs.append("\t")
+            elif tag in (f"{_W}br", f"{_W}cr"):
+                runs.append("\n")
+            elif tag == f"{_W}p":
+                paragraph = "".join(runs)
+                runs = []
+                (tables[-1]["paragraphs"] if tables else lines).append(paragraph)
+                elem.clear()
+            elif tag == f"{_W}tc":
+                table = tables[-1]
+                table["cells"].append(" ".join(p for p in table["paragraphs"] if p))
+                table["paragraphs"] = []
+                elem.clear()
+            elif tag == f"{_W}tr":
+                table = tables[-1]
+                if any(table["cells"]):
+                    # A nested table's rows stay inside the enclosing cell
+                    (tables[-2]["paragraphs"] if len(tables) > 1 else lines).append(" | ".join(table["cells"]))
+                table["cells"] = []
+                elem.clear()
+            elif tag == f"{_W}tbl":
+                tables.pop()
+                elem.clear()
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# Normalization
+# ---------------------------------------------------------------------------
+
+def _normalize(text: str) -> str:
+    # NFKC folds the ligatures and full-width forms PDFs are full of ("ﬁ" -> "fi")
+    text = unicodedata.normalize("NFKC", text)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _CONTROL.sub("", text)
+    text = _TRAILING_SPACE.sub("", text)
+    return _BLANK_RUNS.sub("\n\n", text)
+
+
+def normalize_text(text: str, page_offsets: Optional[List[int]] = None) -> Tuple[str, Optional[List[int]]]:
+    """
+    Clean extracted text: Unicode NFKC, Unix newlines, no stray control
+    characters, trailing spaces or runs of blank lines. Pages are normalized
+    one at a time so their offsets stay exact.
+    """
+    if not page_offsets:
+        return _normalize(text), page_offsets
+    bounds = list(page_offsets) + [len(text)]
+    return _join_normalized([_normalize(text[bounds[i]:bounds[i + 1]]) for i in range(len(page_offsets))])
+
+
+def _join_normalized(pages: List[str]) -> Tuple[str, List[int]]:
+    offsets, position = [], 0
+    for page in pages:
+        offsets.append(position)
+        position += len(page)
+    return "".join(pages), offsets
+
+
+# ---------------------------------------------------------------------------
+# Cleanup: drop text that costs prompt tokens without carrying content
+# ---------------------------------------------------------------------------
+
+def _line_key(line: str) -> str:
+    """Running headers differ only in page numbers and spacing"""
+    return re.sub(r"\d+", "#", " ".join(line.split()).lower())
+
+
+def _page_number(line: str) -> Optional[int]:
+    if not _PAGE_NUMBER.match(line.strip()):
+        return None
+    return int(re.search(r"\d+", line).group())
+
+
+def _edge_indexes(lines: List[str]) -> List[int]:
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return sorted(set(filled[:_EDGE_LINES] + filled[-_EDGE_LINES:]))
+
+
+def _strip_running_lines(pages: List[str]) -> List[str]:
+    """
+    Remove lines repeated at the top or bottom of most pages, and page
+    numbers: numeric edge lines that follow the page sequence on most pages.
+    Other numbers at a page edge (table cells, years) are content.
+    """
+    page_lines = [page.split("\n") for page in pages]
+    counts, numbering = Counter(), Counter()
+    for index, lines in enumerate(page_lines):
+        counts.update({_line_key(lines[i]) for i in _edge_indexes(lines)})
+        numbers = {_page_number(lines[i]) for i in _edge_indexes(lines)} - {None}
+        # printed number minus page index is constant along a page numbering
+        numbering.update({number - index for number in numbers})
+    # With too few pages a repeated line can't be told apart from content
+    threshold = max(3, len(pages) // 2) if len(pages) >= 3 else len(pages) + 1
+    repeated = {key for key, count in counts.items()
+                if count >= threshold and not _PAGE_NUMBER.match(key.replace("#", "0"))}
+    shifts = {shift for shift, count in numbering.items() if count >= threshold}
+
+    cleaned = []
+    for index, lines in enumerate(page_lines):
+        drop = {i for i in _edge_indexes(lines)
+                if _line_key(lines[i]) in repeated
+                or (_page_number(lines[i]) is not None and _page_number(lines[i]) - index in shifts)}
+        page = "\n".join(line for i, line in enumerate(lines) if i not in drop).strip("\n")
+        cleaned.append(page + "\n" if page else "")
+    return cleaned
+
+
+def _vocabulary(text: str) -> set:
+    """Word forms used in a text outside of line-break hyphenation, lowercased"""
+    return set(_WORD_FORMS.findall(_HYPHEN_BREAK.sub(" ", text).lower()))
+
+
+def _join_hyphen_break(match, vocabulary: set) -> str:
+    """
+    A word split by typesetting ("infor-mation") is joined up; a compound
+    broken at its hyphen ("well-known") keeps it. The document's own spelling
+    decides; without it, the hyphen stays only after a usual compound head.
+    """
+    head, tail = match.group(1), match.group(2)
+    compound, joined = f"{head}-{tail}", head + tail
+    if compound.lower() in vocabulary:
+        return compound
+    if joined.lower() in vocabulary:
+        return joined
+    return compound if head.lower() in _COMPOUND_HEADS else joined
+
+
+def _tidy(text: str, vocabulary: set) -> str:
+    text = _HYPHEN_BREAK.sub(lambda m: _join_hyphen_break(m, vocabulary), text)
+    text = _SPACE_RUNS.sub(" ", text)
+    return _BLANK_RUNS.sub("\n\n", text)
+
+
+def clean_text(text: str, page_offsets: Optional[List[int]] = None,
+               drop_references: bool = False) -> Tuple[str, Optional[List[int]]]:
+    """
+    Cut extraction noise before it reaches prompts: running headers and
+    footers and page numbers (PDFs), words hyphenated across line breaks,
+    runs of spaces and blank lines and, with drop_references, a trailing
+    references/bibliography section. Page offsets are kept exact.
+    """
+    vocabulary = _vocabulary(text)
+    if page_offsets:
+        bounds = list(page_offsets) + [len(text)]
+        pages = _strip_running_lines([text[bounds[i]:bounds[i + 1]] for i in range(len(page_offsets))])
+        text, page_offsets = _join_normalized([_tidy(page, vocabulary) for page in pages])
+    else:
+        text = _tidy(text, vocabulary)
+
+    if drop_references:
+        headings = [m.start() for m in _REFERENCES_HEADING.finditer(text) if m.start() >= len(text) // 2]
+        if headings:
+            text = text[:headings[-1]]
+            if page_offsets:
+                page_offsets = [min(offset, len(text)) for offset in page_offsets]
+    return text, page_offsets
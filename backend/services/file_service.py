@@ -1,20 +1,260 @@
+import hashlib
+import json
 import os
+import threading
+import uuid
+from datetime import datetime
+from typing import BinaryIO, List, Optional, Tuple
 from core.config import settings
-from PyPDF2 import PdfReader
-from docx import Document as DocxDocument
+from services.extraction import extract_pdf, extract_docx, normalize_text, clean_text
+from services.document_text import DocumentText, TEXT_INDEX_STEP, build_char_index
+from services.tokens import estimate_tokens
 
-def get_document_text(user_id: int, stored_filename: str) -> str:
-    path = os.path.join(settings.upload_dir, str(user_id), stored_filename)
-    ext = os.path.splitext(stored_filename)[1].lower()
+# Uploads are copied to disk in pieces of this size
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Version of the stored text layout; text stored under another version is extracted again
+TEXT_FORMAT = 3
+
+# Serializes extraction per stored file so concurrent first reads parse it once
+_extract_locks = {}
+_extract_locks_guard = threading.Lock()
+
+
+def legacy_upload_path(user_id: int, stored_filename: str) -> str:
+    return os.path.join(settings.upload_dir, str(user_id), stored_filename)
+
+
+def blob_path(sha256: str, ext: str) -> str:
+    """Where the content-addressed copy of an upload lives: blobs/<aa>/<sha256><ext>"""
+    return os.path.join(settings.upload_dir, "blobs", sha256[:2], f"{sha256}{ext}")
+
+
+def staging_dir() -> str:
+    """Uploads in flight; on the same filesystem as the blobs so they can be renamed in"""
+    return os.path.join(settings.upload_dir, "blobs", ".incoming")
+
+
+def document_path(user_id: int, doc) -> str:
+    """
+    The file behind a document: its blob, or for documents uploaded before
+    content-addressed storage, the per-user copy named after stored_filename.
+    """
+    if doc.sha256:
+        path = blob_path(doc.sha256, os.path.splitext(doc.stored_filename)[1].lower())
+        if os.path.exists(path):
+            return path
+    return legacy_upload_path(user_id, doc.stored_filename)
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds max_upload_mb."""
+
+
+def max_upload_bytes() -> int:
+    return settings.max_upload_mb * 1024 * 1024
+
+
+def save_upload(source: BinaryIO, ext: str) -> Tuple[str, str, int]:
+    """
+    Stream an upload into the staging area in fixed-size chunks, hashing it
+    on the way. A failed or oversized upload never leaves a partial file
+    behind. Returns (staged_path, sha256, size); the caller hands the staged
+    file to blob_store.store_blob once its document row exists.
+    """
+    os.makedirs(staging_dir(), exist_ok=True)
+    tmp_path = os.path.join(staging_dir(), f"{uuid.uuid4()}{ext}.part")
+    digest, size, limit = hashlib.sha256(), 0, max_upload_bytes()
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > limit:
+                    raise UploadTooLarge(f"File exceeds the {settings.max_upload_mb} MB upload limit")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def _cleanup_settings() -> list:
+    return [settings.text_cleanup, settings.text_cleanup_drop_references]
+
+
+def _text_base(user_id: int, doc) -> str:
+    # Identical uploads share one extraction, keyed by the file's sha256
+    if doc.sha256:
+        return os.path.join(settings.text_dir, "blobs", doc.sha256[:2], doc.sha256)
+    return os.path.join(settings.text_dir, str(user_id), doc.stored_filename)
+
+
+def _text_paths(user_id: int, doc) -> Tuple[str, str]:
+    base = _text_base(user_id, doc)
+    return base + ".txt", base + ".json"
+
+
+def extract_document_text(user_id: int, doc) -> Tuple[str, Optional[List[int]], int]:
+    """
+    Parse an uploaded PDF or DOCX, normalize the text and (with text_cleanup)
+    strip extraction noise. Returns the text, the character offset where
+    each page starts (PDFs only) and the token estimate before cleanup.
+    """
+    path = document_path(user_id, doc)
+    ext = os.path.splitext(doc.stored_filename)[1].lower()
     if ext == ".pdf":
-        reader = PdfReader(path)
-        text = ""
-        for page in reader.pages:
-            content = page.extract_text() or ""
-            text += content + "\n"
-        return text
+        text, page_offsets = normalize_text(*extract_pdf(path))
     elif ext == ".docx":
-        doc = DocxDocument(path)
-        return "\n".join(p.text for p in doc.paragraphs)
+        text, page_offsets = normalize_text(extract_docx(path))
     else:
-        raise ValueError("Unsupported file type")
\ No newline at end of file
+        raise ValueError("Unsupported file type")
+    raw_tokens = estimate_tokens(text)
+    if settings.text_cleanup:
+        text, page_offsets = clean_text(text, page_offsets, settings.text_cleanup_drop_references)
+    return text, page_offsets, raw_tokens
+
+
+def store_document_text(user_id: int, doc) -> Tuple[str, dict]:
+    """Extract a document once and save the text (UTF-8) and its metadata under text_dir"""
+    text, page_offsets, raw_tokens = extract_document_text(user_id, doc)
+    source = document_path(user_id, doc)
+    meta = {
+        "format": TEXT_FORMAT,
+        "cleanup": _cleanup_settings(),
+        "source": os.path.basename(source),
+        "source_mtime": os.path.getmtime(source),
+        "chars": len(text),
+        "tokens": estimate_tokens(text),
+        "raw_tokens": raw_tokens,
+        "sha256": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+        "page_offsets": page_offsets,
+        "char_index_step": TEXT_INDEX_STEP,
+        "byte_offsets": build_char_index(text),
+        "extracted_at": datetime.utcnow().isoformat(),
+    }
+    text_path, meta_path = _text_paths(user_id, doc)
+    os.makedirs(os.path.dirname(text_path), exist_ok=True)
+    # Text first, metadata last: a metadata file means the text next to it is complete.
+    # Temp names are unique so two documents sharing a blob can't trip over each other.
+    tmp_suffix = f".{uuid.uuid4().hex}.tmp"
+    with open(text_path + tmp_suffix, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+    os.replace(text_path + tmp_suffix, text_path)
+    _write_meta(meta_path, meta)
+    print(f"[TEXT] Stored {len(text)} characters extracted from {meta['source']}")
+    return text, meta
+
+
+def _write_meta(meta_path: str, meta: dict):
+    tmp_path = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def _stored_meta(user_id: int, doc) -> Optional[dict]:
+    """Metadata of the stored text, or None when it is missing or older than the upload"""
+    _, meta_path = _text_paths(user_id, doc)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if meta.get("format") != TEXT_FORMAT or meta.get("cleanup") != _cleanup_settings():
+        return None  # stored by an older extraction pipeline or with other cleanup settings
+    source = document_path(user_id, doc)
+    if os.path.exists(source) and os.path.getmtime(source) != meta.get("source_mtime"):
+        return None  # the upload was replaced since extraction
+    return meta
+
+
+class DocumentTextUnavailable(Exception):
+    """The stored text is missing or out of date; only ingestion (re)builds it"""
+
+
+def stored_text_meta(user_id: int, doc) -> Optional[dict]:
+    """Metadata of the document's stored text without extracting it; None when it needs (re)extraction"""
+    return _stored_meta(user_id, doc)
+
+
+def _read_stored(user_id: int, doc) -> Optional[Tuple[str, dict]]:
+    meta = _stored_meta(user_id, doc)
+    if meta is None:
+        return None
+    text_path, _ = _text_paths(user_id, doc)
+    try:
+        with open(text_path, "r", encoding="utf-8", newline="") as f:
+            return f.read(), meta
+    except OSError:
+        return None
+
+
+def load_document_text(user_id: int, doc) -> Tuple[str, dict]:
+    """
+    Text and metadata (page_offsets, chars, tokens, sha256) of a document from the
+    text store, extracting it first when it is missing or out of date. Only
+    ingestion and offline scripts call this; requests and jobs use
+    load_stored_text so a file is never parsed on their behalf.
+    """
+    stored = _read_stored(user_id, doc)
+    if stored is not None:
+        return stored
+    key = _text_base(user_id, doc)
+    with _extract_locks_guard:
+        lock = _extract_locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            stored = _read_stored(user_id, doc)
+            if stored is not None:
+                return stored
+            return store_document_text(user_id, doc)
+    finally:
+        with _extract_locks_guard:
+            _extract_locks.pop(key, None)
+
+
+def load_stored_text(user_id: int, doc) -> Tuple[str, dict]:
+    """Like load_document_text, but raises DocumentTextUnavailable instead of extracting"""
+    stored = _read_stored(user_id, doc)
+    if stored is None:
+        raise DocumentTextUnavailable(f"The text of document {doc.id} needs to be extracted again")
+    return stored
+
+
+def get_document_text(user_id: int, doc) -> str:
+    return load_document_text(user_id, doc)[0]
+
+
+def open_document_text(user_id: int, doc) -> DocumentText:
+    """
+    Random-access view of a document's stored text (page ranges, character
+    slices, lines) that reads only what is asked for. Close it when done.
+    Raises DocumentTextUnavailable when the text has to be extracted again.
+    """
+    meta = _stored_meta(user_id, doc)
+    if meta is None:
+        raise DocumentTextUnavailable(f"The text of document {doc.id} needs to be extracted again")
+    return DocumentText(_text_paths(user_id, doc)[0], meta)
+
+
+def delete_document_text(user_id: int, doc):
+    for path in _text_paths(user_id, doc):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def podcast_master_path(audio_path: str) -> str:
+    """Lossless, unprocessed master kept next to a podcast's MP3 so script edits can splice without re-encoding"""
+    return os.path.splitext(audio_path)[0] + ".flac"
+
+
+def remove_podcast_audio(audio_path: str):
+    """Delete a podcast's MP3 and its master"""
+    for path in (audio_path, podcast_master_path(audio_path)):
+        if path and os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,123 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from core.config import settings
+from models.database import worker_session
+from models.document import (get_document_by_id, get_ready_documents, get_unfinished_documents, restore_document_file,
+                             update_document_status)
+from services import search
+from services.embeddings import index_document
+from services.blob_store import release_blob
+from services.file_service import load_document_text, stored_text_meta
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# Documents queued or being ingested, so a document is never processed twice at once
+_queued = set()
+_queued_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(1, settings.ingest_workers),
+                                               thread_name_prefix="ingest")
+    return _executor
+
+
+def ingest_document(user_id: int, doc, previous=None):
+    """
+    Turn an upload into everything chat and generation read: cleaned-up
+    text with its page index and token counts in the text store, the
+    full-text search entry and, with ingest_embed, the chunk embeddings.
+    Identical uploads reuse each other's text and embeddings. previous is
+    the document as it was before its file was replaced: unchanged chunks
+    keep their embeddings, and the old file is released once the new one
+    is ready. If the new file fails, a ready document goes back to the old one.
+    """
+    with worker_session():
+        try:
+            update_document_status(doc.id, "processing")
+            text, meta = load_document_text(user_id, doc)
+            if get_document_by_id(doc.id) is not None:  # else deleted while extracting
+                if settings.ingest_embed:
+                    index_document(doc.project_id, doc.id, doc.orig_filename, text, content_hash=doc.sha256,
+                                   page_offsets=meta["page_offsets"],
+                                   previous_hash=previous.sha256 if previous else None)
+                search.index_document_text(doc.project_id, doc.id, doc.orig_filename, text)
+                update_document_status(doc.id, "ready", token_count=meta["tokens"], raw_token_count=meta["raw_tokens"])
+                print(f"[INGEST] Document {doc.id} ready: {meta['chars']} characters, "
+                      f"~{meta['tokens']} tokens (~{meta['raw_tokens']} before cleanup)")
+        except Exception as e:
+            print(f"[INGEST] Document {doc.id} failed: {e}")
+            _fail_document(user_id, doc, previous, e)
+            return
+        finally:
+            with _queued_lock:
+                _queued.discard(doc.id)
+        _release_previous(user_id, doc, previous)
+
+
+def _release_previous(user_id: int, doc, previous):
+    if previous is not None and previous.sha256 != doc.sha256:
+        release_blob(user_id, previous)
+
+
+def _fail_document(user_id: int, doc, previous, error: Exception):
+    """Mark a document failed or, if it replaced a ready version, restore that version and drop the new file"""
+    if previous is not None and previous.status == "ready" and previous.sha256 != doc.sha256:
+        restored = restore_document_file(doc.id, doc.version, previous,
+                                         error=f"The new version could not be processed: {error}")
+        if restored is not None:
+            print(f"[INGEST] Document {doc.id} restored to its previous file")
+            release_blob(user_id, doc)
+            return
+    update_document_status(doc.id, "failed", error=str(error))
+    _release_previous(user_id, doc, previous)
+
+
+def enqueue_ingestion(user_id: int, doc, previous=None) -> bool:
+    """Queue a document for ingestion; False if it is already queued"""
+    with _queued_lock:
+        if doc.id in _queued:
+            return False
+        _queued.add(doc.id)
+    try:
+        _get_executor().submit(ingest_document, user_id, doc, previous)
+    except Exception:
+        with _queued_lock:
+            _queued.discard(doc.id)
+        raise
+    return True
+
+
+def reingest_document(user_id: int, doc):
+    """Send a ready document back through ingestion, e.g. because its stored text is out of date"""
+    doc = update_document_status(doc.id, "pending")
+    if doc is not None:
+        enqueue_ingestion(user_id, doc)
+    return doc
+
+
+def resume_ingestion() -> int:
+    """
+    Requeue documents left pending or half-processed by a previous run, and
+    ready documents whose stored text no longer matches the extraction
+    pipeline (TEXT_FORMAT or text_cleanup settings changed since).
+    """
+    count = 0
+    for doc, user_id in get_unfinished_documents():
+        count += enqueue_ingestion(user_id, doc)
+    if count:
+        print(f"[INGEST] Resuming ingestion of {count} documents")
+    stale = 0
+    for doc, user_id in get_ready_documents():
+        if stored_text_meta(user_id, doc) is None:
+            reingest_document(user_id, doc)
+            stale += 1
+    if stale:
+        print(f"[INGEST] Re-ingesting {stale} documents whose text was extracted with other settings")
+    return count + stale
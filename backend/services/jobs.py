@@ -0,0 +1,129 @@
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from services.telemetry import UsageTotals
+
+
+class JobCancelled(Exception):
+    """Raised inside a generation pipeline once its job has been cancelled."""
+
+
+class GenerationJob:
+    """
+    In-memory record of a background podcast generation.
+
+    Pipelines call check_cancelled() between stages so a cancel request takes
+    effect at the next stage boundary instead of after the whole run.
+    """
+
+    def __init__(self, user_id: int, doc_id: int = None, project_id: int = None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.doc_id = doc_id
+        self.project_id = project_id
+        self.status = "queued"  # queued, running, completed, failed, cancelled
+        self.stage = None
+        self.error = None
+        self.podcast_id = None
+        self.created_at = datetime.utcnow()
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.usage = UsageTotals(user_id)
+        # Per-document jobs of a batch generation
+        self.children: List["GenerationJob"] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def set_stage(self, stage: str):
+        self.check_cancelled()
+        self.status = "running"
+        self.stage = stage
+        print(f"[JOBS] Job {self.id} → {stage}")
+
+    def finish(self, status: str, error: str = None):
+        self.status = status
+        self.error = error
+        self.finished_at = datetime.utcnow()
+
+    def cancel(self):
+        self.cancel_event.set()
+        for child in self.children:
+            child.cancel_event.set()
+
+    def to_dict(self) -> dict:
+        data = {
+            "id": self.id,
+            "document_id": self.doc_id,
+            "project_id": self.project_id,
+            "status": self.status,
+            "stage": self.stage,
+            "error": self.error,
+            "podcast_id": self.podcast_id,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+        if self.children:
+            data["documents"] = [child.to_dict() for child in self.children]
+        return data
+
+
+_jobs: Dict[str, GenerationJob] = {}
+_jobs_lock = threading.Lock()
+
+# Finished jobs are kept around this long so clients can still poll their status
+_FINISHED_JOB_TTL = timedelta(hours=6)
+
+
+def _prune_finished_jobs():
+    cutoff = datetime.utcnow() - _FINISHED_JOB_TTL
+    for job_id in [j.id for j in _jobs.values() if j.finished_at and j.finished_at < cutoff]:
+        del _jobs[job_id]
+
+
+def create_job(user_id: int, doc_id: int = None, project_id: int = None, parent: GenerationJob = None) -> GenerationJob:
+    job = GenerationJob(user_id, doc_id=doc_id, project_id=project_id)
+    with _jobs_lock:
+        _prune_finished_jobs()
+        _jobs[job.id] = job
+    if parent is not None:
+        parent.children.append(job)
+    return job
+
+
+def get_job(job_id: str) -> Optional[GenerationJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def get_jobs_for_user(user_id: int) -> List[GenerationJob]:
+    with _jobs_lock:
+        return [job for job in _jobs.values() if job.user_id == user_id]
+
+
+def cancel_job(job_id: str) -> Optional[GenerationJob]:
+    """Signal a job to stop; returns the job, or None if it does not exist"""
+    job = get_job(job_id)
+    if job and job.status in ("queued", "running"):
+        job.cancel()
+        print(f"[JOBS] Cancellation requested for job {job_id}")
+    return job
+
+
+def cancel_jobs_for_document(doc_id: int) -> int:
+    """Cancel every active job generating from the given document"""
+    with _jobs_lock:
+        active = [job for job in _jobs.values()
+                  if job.doc_id == doc_id and job.status in ("queued", "running")]
+    for job in active:
+        job.cancel_event.set()
+    if active:
+        print(f"[JOBS] Cancelled {len(active)} job(s) for document {doc_id}")
+    return len(active)
@@ -0,0 +1,44 @@
+import hashlib
+from typing import Callable
+from models.llm_artifact import get_artifact, store_artifact
+from services.llm_client import get_llm_client
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def lookup(stage: str, text_hash: str, prompt_hash: str, model: str = None):
+    """Cached content for a stage, or None"""
+    return get_artifact(text_hash, model or get_llm_client().model_for_stage(stage), prompt_hash, stage)
+
+
+def get_or_generate(stage: str, text_hash: str, prompt_hash: str, generate: Callable[[], str],
+                    model: str = None, force: bool = False) -> str:
+    """
+    Return the cached artifact for (text_hash, model, prompt_hash, stage), or
+    call generate() and store its result. force skips the lookup but still
+    stores the fresh result, replacing the old entry.
+    """
+    model = model or get_llm_client().model_for_stage(stage)
+    if not force:
+        cached = get_artifact(text_hash, model, prompt_hash, stage)
+        if cached is not None:
+            print(f"[CACHE] {stage} hit for text {text_hash[:12]}")
+            return cached
+    content = generate()
+    _store(stage, text_hash, model, prompt_hash, content)
+    return content
+
+
+def remember(stage: str, text_hash: str, prompt_hash: str, content: str, model: str = None):
+    """Store derived content (not an LLM call) alongside the cached artifacts"""
+    _store(stage, text_hash, model or get_llm_client().model_for_stage(stage), prompt_hash, content)
+
+
+def _store(stage: str, text_hash: str, model: str, prompt_hash: str, content: str):
+    # The content is already in hand; losing the cache entry only costs a later regeneration
+    try:
+        store_artifact(text_hash, model, prompt_hash, stage, content)
+    except Exception as e:
+        print(f"[CACHE] Could not store {stage} for text {text_hash[:12]}: {e}")
@@ -0,0 +1,545 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from core.config import settings
+from services.jobs import JobCancelled
+from services.telemetry import UsageTotals, record_llm_call
+
+# Upstream statuses worth retrying: overloaded or restarting model server
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Raised when the LLM server cannot produce a response after all retries."""
+
+
+class LLMEndpoint:
+    """
+    One Ollama server: its concurrency limit, in-flight count and circuit breaker.
+
+    The breaker opens after llm_breaker_threshold consecutive failures. While
+    open the endpoint gets no traffic; once llm_breaker_cooldown has passed a
+    single trial request is let through, and it (or a successful health
+    probe) closes the breaker again.
+    """
+
+    def __init__(self, url: str, max_concurrency: int = None, stages=None, model: str = None):
+        self.url = url.rstrip("/")
+        self.chat_url = f"{self.url}/api/chat"
+        self.embed_url = f"{self.url}/api/embed"
+        self.max_concurrency = max_concurrency or settings.llm_max_concurrency
+        self.stages = set(stages) if stages else None  # None: serves every stage
+        self.model = model
+
+        self.outstanding = 0
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.max_concurrency)
+        self.async_slots: Optional[asyncio.Semaphore] = None
+
+    def serves(self, stage: str) -> bool:
+        return self.stages is None or stage in self.stages
+
+    def load(self) -> float:
+        return self.outstanding / self.max_concurrency
+
+    def available(self, now: float) -> bool:
+        if self.opened_at is None:
+            return True
+        return now - self.opened_at >= settings.llm_breaker_cooldown and not self.trial_in_flight
+
+    def acquire(self) -> bool:
+        """Count a request against this endpoint; False if its breaker opened since it was picked"""
+        with self._lock:
+            if not self.available(time.monotonic()):
+                return False
+            if self.opened_at is not None:
+                self.trial_in_flight = True
+            self.outstanding += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.outstanding -= 1
+            self.trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"[LLM] Endpoint {self.url} recovered, closing circuit")
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is None and self.failures >= settings.llm_breaker_threshold:
+                print(f"[LLM] Endpoint {self.url} failed {self.failures} times in a row, opening circuit")
+                self.opened_at = time.monotonic()
+            elif self.opened_at is not None:
+                # Failed trial: start another cooldown
+                self.opened_at = time.monotonic()
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "model": self.model,
+            "stages": sorted(self.stages) if self.stages else None,
+            "max_concurrency": self.max_concurrency,
+            "outstanding": self.outstanding,
+            "circuit": "closed" if self.opened_at is None else "open",
+            "consecutive_failures": self.failures,
+        }
+
+
+def configured_endpoints() -> List[LLMEndpoint]:
+    """
+    Endpoints from settings.llm_endpoints, a JSON list such as
+    [{"url": "http://gpu1:11434", "model": "llama3:70b", "stages": ["summary", "script"], "max_concurrency": 2},
+     {"url": "http://gpu2:11434", "model": "llama3:8b", "stages": ["chat"]}].
+    Empty means the single server at settings.ollama_url.
+    """
+    if not settings.llm_endpoints.strip():
+        return [LLMEndpoint(settings.ollama_url)]
+    try:
+        entries = json.loads(settings.llm_endpoints)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"LLM_ENDPOINTS is not valid JSON: {e}") from e
+    return [
+        LLMEndpoint(entry["url"], entry.get("max_concurrency"), entry.get("stages"), entry.get("model"))
+        for entry in entries
+    ]
+
+
+class LLMClient:
+    """
+    Pooled client for the Ollama chat API, routed over one or more servers.
+
+    One instance keeps a keep-alive connection pool for sync callers
+    (requests.Session) and one for async callers (httpx.AsyncClient). Each
+    request goes to the healthy endpoint serving its stage with the fewest
+    outstanding requests relative to its concurrency limit. Transient
+    failures are retried with jittered exponential backoff, on another
+    endpoint where there is one.
+    """
+
+    def __init__(
+        self,
+        base_url: str = None,
+        connect_timeout: float = None,
+        max_retries: int = None,
+        retry_backoff: float = None,
+        max_concurrency: int = None,
+        pool_size: int = None,
+        endpoints: List[LLMEndpoint] = None,
+    ):
+        if endpoints is None:
+            endpoints = [LLMEndpoint(base_url, max_concurrency)] if base_url else configured_endpoints()
+        if not endpoints:
+            raise ValueError("LLMClient needs at least one endpoint")
+        self.endpoints = endpoints
+        self.connect_timeout = connect_timeout if connect_timeout is not None else settings.llm_connect_timeout
+        self.max_retries = max_retries if max_retries is not None else settings.llm_max_retries
+        self.retry_backoff = retry_backoff if retry_backoff is not None else settings.llm_retry_backoff
+        self.pool_size = pool_size or settings.llm_pool_size
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(endpoints), pool_maxsize=self.pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        # Async resources are bound to the event loop that first uses them
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop = None
+
+        self._probe_thread: Optional[threading.Thread] = None
+        self._probe_lock = threading.Lock()
+        self._closed = threading.Event()
+
+    # ------------------------------------------------------------------
+    # helpers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def timeout_for(stage: str) -> float:
+        """Read timeout for a pipeline stage (summary, script, chat)"""
+        return {
+            "summary": settings.llm_summary_timeout,
+            "script": settings.llm_script_timeout,
+            "chat": settings.llm_chat_timeout,
+        }.get(stage, settings.llm_chat_timeout)
+
+    @staticmethod
+    def _model(endpoint: LLMEndpoint, model: str = None) -> str:
+        return model or endpoint.model or settings.ollama_model
+
+    def _payload(self, endpoint: LLMEndpoint, messages: List[dict], model: str, stream: bool,
+                 options: dict = None) -> dict:
+        payload = {"model": self._model(endpoint, model), "messages": messages, "stream": stream}
+        if options:
+            payload["options"] = options
+        return payload
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: spreads retries from concurrent callers apart
+        return random.uniform(0, self.retry_backoff * (2 ** attempt))
+
+    @staticmethod
+    def _merge_stream(chunks: List[dict], parts: List[str]) -> dict:
+        """Fold a streamed response into the shape of a non-streamed one"""
+        final = dict(chunks[-1]) if chunks else {}
+        final["message"] = {"role": "assistant", "content": "".join(parts)}
+        return final
+
+    # ------------------------------------------------------------------
+    # routing and health
+    # ------------------------------------------------------------------
+
+    def _pool(self, stage: str) -> List[LLMEndpoint]:
+        # A stage no endpoint claims explicitly can go anywhere
+        return [ep for ep in self.endpoints if ep.serves(stage)] or self.endpoints
+
+    def model_for_stage(self, stage: str) -> str:
+        """The model a stage runs on when the caller does not name one"""
+        for endpoint in self._pool(stage):
+            if endpoint.model:
+                return endpoint.model
+        return settings.ollama_model
+
+    def capacity(self, stage: str) -> int:
+        """How many requests for a stage the healthy endpoints can serve at once"""
+        now = time.monotonic()
+        return sum(ep.max_concurrency for ep in self._pool(stage) if ep.available(now))
+
+    def _checkout(self, stage: str, tried: List[LLMEndpoint]) -> LLMEndpoint:
+        """
+        Reserve the least-loaded healthy endpoint for the stage, preferring
+        ones this request has not failed on yet. Fails fast when every
+        endpoint's breaker is open.
+        """
+        self._ensure_probing()
+        pool = self._pool(stage)
+        for _ in range(len(pool) + 1):
+            now = time.monotonic()
+            healthy = [ep for ep in pool if ep.available(now)]
+            candidates = [ep for ep in healthy if ep not in tried] or healthy
+            if not candidates:
+                break
+            lowest = min(ep.load() for ep in candidates)
+            endpoint = random.choice([ep for ep in candidates if ep.load() == lowest])
+            if endpoint.acquire():
+                return endpoint
+        raise LLMError(f"No healthy LLM endpoint for stage '{stage}'")
+
+    def _ensure_probing(self):
+        if self._probe_thread is None and settings.llm_health_interval > 0:
+            with self._probe_lock:
+                if self._probe_thread is None:
+                    self._probe_thread = threading.Thread(target=self._probe_loop, daemon=True, name="llm-health")
+                    self._probe_thread.start()
+
+    def _probe_loop(self):
+        """Ping every endpoint periodically so dead ones stop getting traffic and revived ones get it back"""
+        while not self._closed.wait(settings.llm_health_interval):
+            for endpoint in self.endpoints:
+                try:
+                    resp = self._session.get(f"{endpoint.url}/api/version", timeout=self.connect_timeout)
+                    healthy = resp.ok
+                    resp.close()
+                except requests.RequestException:
+                    healthy = False
+                if healthy:
+                    if endpoint.opened_at is not None:
+                        endpoint.record_success()
+                else:
+                    endpoint.record_failure()
+
+    def endpoint_status(self) -> List[dict]:
+        return [endpoint.to_dict() for endpoint in self.endpoints]
+
+    # ------------------------------------------------------------------
+    # sync API
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _release(endpoint: LLMEndpoint):
+        endpoint.slots.release()
+        endpoint.release()
+
+    def _post(self, stage: str, build_payload: Callable[[LLMEndpoint], dict], timeout: float,
+              stream: bool, embed: bool = False) -> Tuple[LLMEndpoint, requests.Response]:
+        """
+        Send a request to an endpoint serving the stage. Returns the endpoint
+        with one of its slots held; the caller must _release() it once done
+        with the response.
+        """
+        last_error, tried = None, []
+        for attempt in range(self.max_retries + 1):
+            endpoint = self._checkout(stage, tried)
+            endpoint.slots.acquire()
+            try:
+                resp = self._session.post(
+                    endpoint.embed_url if embed else endpoint.chat_url,
+                    json=build_payload(endpoint), stream=stream,
+                    timeout=(self.connect_timeout, timeout),
+                )
+                if resp.status_code in RETRY_STATUSES:
+                    resp.close()
+                    last_error = LLMError(f"LLM server {endpoint.url} returned {resp.status_code}")
+                else:
+                    resp.raise_for_status()
+                    endpoint.record_success()
+                    return endpoint, resp
+            except requests.ConnectionError as e:
+                # Includes connect timeouts; a read timeout means the model is busy decoding and is not retried
+                last_error = e
+            except requests.RequestException as e:
+                self._release(endpoint)
+                raise LLMError(f"LLM request failed: {e}") from e
+            endpoint.record_failure()
+            self._release(endpoint)
+            tried.append(endpoint)
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt)
+                print(f"[LLM] Request to {endpoint.url} failed ({last_error}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+        raise LLMError(f"LLM request failed after {self.max_retries + 1} attempts: {last_error}")
+
+    def chat(
+        self,
+        messages: List[dict],
+        model: str = None,
+        stage: str = "chat",
+        timeout: float = None,
+        options: dict = None,
+        cancel_event: threading.Event = None,
+        usage: UsageTotals = None,
+    ) -> dict:
+        """
+        Run a chat completion and return Ollama's response JSON.
+        With a cancel_event the response is streamed, so setting the event
+        closes the connection mid-decode and Ollama stops generating.
+        Token counts and timings are recorded, and added to usage if given.
+        """
+        timeout = timeout or self.timeout_for(stage)
+        if cancel_event is None:
+            started = time.monotonic()
+            endpoint, resp = self._post(
+                stage, lambda ep: self._payload(ep, messages, model, False, options), timeout, stream=False)
+            try:
+                result = resp.json()
+            finally:
+                self._release(endpoint)
+            record_llm_call(stage, self._model(endpoint, model), result, started, time.monotonic(), usage=usage)
+            return result
+
+        chunks, parts = [], []
+        for chunk in self.stream_chat(messages, model=model, stage=stage, timeout=timeout,
+                                      options=options, cancel_event=cancel_event, usage=usage):
+            chunks.append(chunk)
+            parts.append(chunk.get("message", {}).get("content", ""))
+        return self._merge_stream(chunks, parts)
+
+    def stream_chat(
+        self,
+        messages: List[dict],
+        model: str = None,
+        stage: str = "chat",
+        timeout: float = None,
+        options: dict = None,
+        cancel_event: threading.Event = None,
+        usage: UsageTotals = None,
+    ) -> Iterator[dict]:
+        """Yield Ollama's streamed chunks; raises JobCancelled if cancel_event is set"""
+        timeout = timeout or self.timeout_for(stage)
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled("Cancelled before LLM request")
+        started, first_token_at = time.monotonic(), None
+        endpoint, resp = self._post(
+            stage, lambda ep: self._payload(ep, messages, model, True, options), timeout, stream=True)
+        try:
+            with resp:
+                for line in resp.iter_lines():
+                    if cancel_event is not None and cancel_event.is_set():
+                        # Leaving the with-block closes the socket, which aborts the upstream decode
+                        raise JobCancelled("Cancelled during LLM generation")
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if first_token_at is None and chunk.get("message", {}).get("content"):
+                        first_token_at = time.monotonic()
+                    if chunk.get("done"):
+                        record_llm_call(stage, self._model(endpoint, model), chunk, started, time.monotonic(),
+                                        first_token_at, usage)
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+        except requests.RequestException as e:
+            endpoint.record_failure()
+            raise LLMError(f"LLM stream interrupted: {e}") from e
+        finally:
+            self._release(endpoint)
+
+    def embed(self, texts: List[str], model: str, timeout: float = None, batch_size: int = 64) -> List[List[float]]:
+        """Embedding vectors for texts via Ollama's /api/embed, batched"""
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            batch = texts[i:i + batch_size]
+            endpoint, resp = self._post("embed", lambda ep: {"model": model, "input": batch},
+                                        timeout or settings.llm_chat_timeout, stream=False, embed=True)
+            try:
+                vectors.extend(resp.json()["embeddings"])
+            finally:
+                self._release(endpoint)
+        return vectors
+
+    # ------------------------------------------------------------------
+    # async API
+    # ------------------------------------------------------------------
+
+    def _ensure_async(self):
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            for endpoint in self.endpoints:
+                endpoint.async_slots = asyncio.Semaphore(endpoint.max_concurrency)
+            self._async_loop = loop
+
+    @staticmethod
+    def _arelease(endpoint: LLMEndpoint):
+        endpoint.async_slots.release()
+        endpoint.release()
+
+    async def _apost(self, stage: str, build_payload: Callable[[LLMEndpoint], dict],
+                     timeout: float) -> Tuple[LLMEndpoint, httpx.Response]:
+        """
+        Send a request and return the response with its body still unread,
+        and its endpoint with a slot held until _arelease()
+        """
+        self._ensure_async()
+        last_error, tried = None, []
+        for attempt in range(self.max_retries + 1):
+            endpoint = self._checkout(stage, tried)
+            await endpoint.async_slots.acquire()
+            try:
+                request = self._async_client.build_request(
+                    "POST", endpoint.chat_url, json=build_payload(endpoint),
+                    timeout=httpx.Timeout(timeout, connect=self.connect_timeout),
+                )
+                resp = await self._async_client.send(request, stream=True)
+                if resp.status_code in RETRY_STATUSES:
+                    await resp.aclose()
+                    last_error = LLMError(f"LLM server {endpoint.url} returned {resp.status_code}")
+                elif resp.is_error:
+                    await resp.aclose()
+                    self._arelease(endpoint)
+                    raise LLMError(f"LLM request failed with status {resp.status_code}")
+                else:
+                    endpoint.record_success()
+                    return endpoint, resp
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+                last_error = e
+            except LLMError:
+                raise  # the slot was already released above
+            except httpx.HTTPError as e:
+                self._arelease(endpoint)
+                raise LLMError(f"LLM request failed: {e}") from e
+            except BaseException:
+                # Cancelled while waiting on the server
+                self._arelease(endpoint)
+                raise
+            endpoint.record_failure()
+            self._arelease(endpoint)
+            tried.append(endpoint)
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt)
+                print(f"[LLM] Request to {endpoint.url} failed ({last_error}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+        raise LLMError(f"LLM request failed after {self.max_retries + 1} attempts: {last_error}")
+
+    async def achat(
+        self,
+        messages: List[dict],
+        model: str = None,
+        stage: str = "chat",
+        timeout: float = None,
+        options: dict = None,
+        usage: UsageTotals = None,
+    ) -> dict:
+        """Async variant of chat()"""
+        timeout = timeout or self.timeout_for(stage)
+        started = time.monotonic()
+        endpoint, resp = await self._apost(
+            stage, lambda ep: self._payload(ep, messages, model, False, options), timeout)
+        try:
+            await resp.aread()
+            result = resp.json()
+        finally:
+            await resp.aclose()
+            self._arelease(endpoint)
+        record_llm_call(stage, self._model(endpoint, model), result, started, time.monotonic(), usage=usage)
+        return result
+
+    async def astream_chat(
+        self,
+        messages: List[dict],
+        model: str = None,
+        stage: str = "chat",
+        timeout: float = None,
+        options: dict = None,
+        usage: UsageTotals = None,
+    ) -> AsyncIterator[dict]:
+        """Async variant of stream_chat(); closing the iterator aborts the upstream request"""
+        timeout = timeout or self.timeout_for(stage)
+        started, first_token_at = time.monotonic(), None
+        endpoint, resp = await self._apost(
+            stage, lambda ep: self._payload(ep, messages, model, True, options), timeout)
+        try:
+            async for line in resp.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if first_token_at is None and chunk.get("message", {}).get("content"):
+                    first_token_at = time.monotonic()
+                if chunk.get("done"):
+                    record_llm_call(stage, self._model(endpoint, model), chunk, started, time.monotonic(),
+                                    first_token_at, usage)
+                yield chunk
+                if chunk.get("done"):
+                    break
+        except httpx.HTTPError as e:
+            endpoint.record_failure()
+            raise LLMError(f"LLM stream interrupted: {e}") from e
+        finally:
+            await resp.aclose()
+            self._arelease(endpoint)
+
+    def close(self):
+        self._closed.set()
+        self._session.close()
+
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """Process-wide shared client"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+    return _client
@@ -0,0 +1,188 @@
+import html
+import re
+from typing import List
+from sqlalchemy import text
+from models.database import session_scope
+
+# Documents are indexed in blocks of about this many characters so hits carry an offset
+DOCUMENT_BLOCK_CHARS = 2000
+
+_search_index_ready = False
+
+_QUERY_TERM = re.compile(r"\w+", re.UNICODE)
+# snippet() wraps matches in these; they are swapped for <mark> tags after the text is HTML-escaped
+_MARK_OPEN, _MARK_CLOSE = "\x02", "\x03"
+_MARKERS = re.compile("[\x02\x03]")
+
+
+def _indexable(body: str) -> str:
+    """Text as stored in the index: the match markers blanked out, so offsets still line up"""
+    return _MARKERS.sub(" ", body)
+
+
+def _ensure_search_index(db):
+    """Create the FTS5 table on first use"""
+    global _search_index_ready
+    if not _search_index_ready:
+        db.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+                title,
+                body,
+                kind UNINDEXED,
+                project_id UNINDEXED,
+                ref_id UNINDEXED,
+                position UNINDEXED,
+                start_time UNINDEXED,
+                end_time UNINDEXED,
+                tokenize = 'porter unicode61'
+            )
+        """))
+        db.commit()
+        _search_index_ready = True
+
+
+def _document_blocks(body: str):
+    """Split text into non-overlapping blocks, ending on a paragraph or word boundary"""
+    start, length = 0, len(body)
+    while start < length:
+        end = min(start + DOCUMENT_BLOCK_CHARS, length)
+        if end < length:
+            for boundary in ("\n\n", "\n", " "):
+                cut = body.rfind(boundary, start + DOCUMENT_BLOCK_CHARS // 2, end)
+                if cut != -1:
+                    end = cut + len(boundary)
+                    break
+        if body[start:end].strip():
+            yield start, body[start:end]
+        start = end
+
+
+def _delete_rows(db, kind: str, ref_id: int):
+    db.execute(text("DELETE FROM search_index WHERE kind = :kind AND ref_id = :ref_id"),
+               {"kind": kind, "ref_id": ref_id})
+
+
+def index_document_text(project_id: int, doc_id: int, title: str, body: str):
+    """Replace a document's rows in the search index"""
+    with session_scope() as db:
+        try:
+            _ensure_search_index(db)
+            _delete_rows(db, "document", doc_id)
+            rows = [
+                {"title": title, "body": _indexable(block), "kind": "document", "project_id": project_id,
+                 "ref_id": doc_id, "position": offset, "start_time": None, "end_time": None}
+                for offset, block in _document_blocks(body)
+            ]
+            if rows:
+                db.execute(text("""
+                    INSERT INTO search_index (title, body, kind, project_id, ref_id, position, start_time, end_time)
+                    VALUES (:title, :body, :kind, :project_id, :ref_id, :position, :start_time, :end_time)
+                """), rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise
+
+
+def index_podcast_script(project_id: int, podcast_id: int, title: str, script_text: str, segment_timings: list = None):
+    """Replace a podcast's rows in the search index: one row per script line, with its timestamps"""
+    if segment_timings:
+        lines = [(t["index"], t["text"], t.get("start_time"), t.get("end_time")) for t in segment_timings]
+    else:
+        lines = [(i, line, None, None) for i, line in enumerate(l for l in (script_text or "").splitlines() if l.strip())]
+    with session_scope() as db:
+        try:
+            _ensure_search_index(db)
+            _delete_rows(db, "podcast", podcast_id)
+            rows = [
+                {"title": title, "body": _indexable(line), "kind": "podcast", "project_id": project_id,
+                 "ref_id": podcast_id, "position": index, "start_time": start, "end_time": end}
+                for index, line, start, end in lines
+            ]
+            if rows:
+                db.execute(text("""
+                    INSERT INTO search_index (title, body, kind, project_id, ref_id, position, start_time, end_time)
+                    VALUES (:title, :body, :kind, :project_id, :ref_id, :position, :start_time, :end_time)
+                """), rows)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise
+
+
+def _remove(where: str, params: dict):
+    with session_scope() as db:
+        try:
+            _ensure_search_index(db)
+            db.execute(text(f"DELETE FROM search_index WHERE {where}"), params)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise
+
+
+def remove_document(doc_id: int):
+    _remove("kind = 'document' AND ref_id = :ref_id", {"ref_id": doc_id})
+
+
+def remove_podcast(podcast_id: int):
+    _remove("kind = 'podcast' AND ref_id = :ref_id", {"ref_id": podcast_id})
+
+
+def remove_project(project_id: int):
+    _remove("project_id = :project_id", {"project_id": project_id})
+
+
+def _match_expression(query: str) -> str:
+    """
+    Turn free text into a safe FTS5 query: every word must match, and the
+    last word also matches as a prefix so results update while typing.
+    """
+    terms = _QUERY_TERM.findall(query)
+    if not terms:
+        return ""
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _highlight(snippet: str) -> str:
+    """HTML for a snippet: the document's own text escaped, only the match markers turned into <mark>"""
+    return html.escape(snippet or "").replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
+
+
+def search_project(project_id: int, query: str, limit: int = 20) -> List[dict]:
+    """Ranked hits across a project's documents and podcast scripts; snippets are HTML-escaped"""
+    match = _match_expression(query)
+    if not match:
+        return []
+    with session_scope() as db:
+        _ensure_search_index(db)
+        rows = db.execute(text("""
+            SELECT kind, ref_id, position, start_time, end_time, title,
+                   snippet(search_index, 1, :mark_open, :mark_close, '…', 16) AS snippet,
+                   bm25(search_index, 5.0, 1.0) AS rank
+            FROM search_index
+            WHERE search_index MATCH :match AND project_id = :project_id
+            ORDER BY rank
+            LIMIT :limit
+        """), {"match": match, "project_id": project_id, "limit": limit,
+              "mark_open": _MARK_OPEN, "mark_close": _MARK_CLOSE}).fetchall()
+
+    results = []
+    for row in rows:
+        hit = {
+            "kind": row.kind,
+            "id": row.ref_id,
+            "title": row.title,
+            "snippet": _highlight(row.snippet),
+            "score": -row.rank,  # bm25() is lower-is-better
+        }
+        if row.kind == "document":
+            hit["offset"] = row.position
+        else:
+            hit["segment_index"] = row.position
+            hit["start_time"] = row.start_time
+            hit["end_time"] = row.end_time
+        results.append(hit)
+    return results
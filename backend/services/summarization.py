@@ -1,57 +1,402 @@
-import requests
+import hashlib
+import json
+import math
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 from core.config import settings
+from services import llm_cache
+from services.llm_client import get_llm_client
+from services.telemetry import UsageTotals
+from services.tokens import estimate_tokens, tokens_to_chars
 
-OLLAMA_CHAT_URL = f"{settings.ollama_url.rstrip('/')}/api/chat"
+SUMMARY_PROMPT = "Summarize the following document:"
+CHUNK_SUMMARY_PROMPT = (
+    "You are summarizing one part of a longer document. "
+    "Summarize this part thoroughly, keeping every key fact, figure, name and argument, "
+    "so the summaries of all parts can later be combined into one. "
+    "Do not add an introduction or conclusion about the document as a whole."
+)
+REDUCE_SUMMARY_PROMPT = (
+    "You are given summaries of consecutive parts of one document, in order. "
+    "Combine them into a single coherent summary that keeps every key fact, figure, name and argument "
+    "and removes repetition."
+)
 
-def generate_summary(text: str, model: str | None = None) -> str:
+SCRIPT_PROMPT = (
+    "You are an AI assistant that writes clean, symbol-free podcast scripts. "
+    "You are a professional podcast host and you are writing a script for a podcast. "
+    "Create a dialogue between two hosts: Host A (female) and Host B (male). "
+    "The conversation should thoroughly cover the content of the provided summary (make sure to include all the details)"
+    "and last at least fifteen minutes when read aloud. "
+    "Do not use any special symbols or punctuation characters such as #, *, @, $, %, etc. "
+    "Use only plain, natural language. "
+    "Remember that a human will read every single word aloud, so ensure the script flows "
+    "smoothly and makes complete sense without any placeholders or markup. "
+    "You are not commenting on the summary, you are writing a script for a podcast. "
+    "This podcast is for a general audience, so do not use any technical jargon or complex words. "
+    "This podcast should help the user understand the content of the document and learn from it, don't ask any questions, just explain the content in a way that is easy to understand and engaging."
+    "Format each line exactly like this:\n"
+    "Host A: ...\n"
+    "Host B: ...\n"
+)
+
+OUTLINE_PROMPT = (
+    "You are planning a two-host educational podcast about a document. "
+    "Split the content of the provided summary into exactly {sections} consecutive sections that together cover all of it. "
+    "Write one line per section and nothing else, formatted exactly like this:\n"
+    "Section 1: short title | the key points this section must cover\n"
+)
+SECTION_SCRIPT_PROMPT = (
+    "You are a professional podcast host writing one section of a script for a two-host podcast "
+    "between Host A (female) and Host B (male). "
+    "Other sections of the episode are written separately and joined afterwards, "
+    "so cover only the points of your section, thoroughly and with all their details, "
+    "in about {minutes} minutes of dialogue when read aloud. "
+    "{position} "
+    "Do not use any special symbols or punctuation characters such as #, *, @, $, %, etc. "
+    "Use only plain, natural language that a human will read aloud word for word, without placeholders or markup. "
+    "This podcast is for a general audience, so do not use any technical jargon or complex words; "
+    "don't ask the listener questions, just explain the content in a way that is easy to understand and engaging. "
+    "Format each line exactly like this:\n"
+    "Host A: ...\n"
+    "Host B: ...\n"
+)
+# Minutes of dialogue the sections of one episode add up to
+SCRIPT_TARGET_MINUTES = 15
+TRANSITION_PROMPT = (
+    "You are joining two sections of a podcast dialogue between Host A (female) and Host B (male). "
+    "Write one or two short lines that lead naturally from the end of the first section into the topic of the next. "
+    "Do not repeat content and do not use any special symbols. "
+    "Format each line exactly like this:\n"
+    "Host A: ...\n"
+    "Host B: ...\n"
+)
+
+_OUTLINE_LINE = re.compile(r"^\W*section\s*\d+\s*[:.)-]\s*(.+)$", re.IGNORECASE)
+_HOST_LINE = re.compile(r"^[\W_]*(Host [AB])[*_\s]*:[*_\s]*(.+)$")
+
+# Chunk sizes are multiples of this many tokens
+CHUNK_GRID_TOKENS = 512
+
+_SECTION_BREAK = re.compile(r"\n\s*\n")
+
+
+def _summarize(system_prompt: str, text: str, model: str | None, cancel_event: threading.Event | None,
+               usage: UsageTotals | None = None) -> str:
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user",   "content": text}
+    ]
+    resp = get_llm_client().chat(messages, model=model, stage="summary", cancel_event=cancel_event, usage=usage)
+    return resp["message"]["content"]
+
+
+def _split_units(text: str, page_offsets: Optional[List[int]] = None) -> List[str]:
+    """Split text into natural units: pages when offsets are known, else sections"""
+    if page_offsets:
+        bounds = list(page_offsets) + [len(text)]
+        return [text[bounds[i]:bounds[i + 1]] for i in range(len(page_offsets)) if bounds[i] < bounds[i + 1]]
+    if "\f" in text:
+        return [page for page in text.split("\f") if page.strip()]
+    return [section for section in _SECTION_BREAK.split(text) if section.strip()]
+
+
+def _split_oversized(unit: str, max_chars: int) -> List[str]:
+    """Break a unit larger than the budget on paragraph, then line, then hard boundaries"""
+    if len(unit) <= max_chars:
+        return [unit]
+    for separator in ("\n\n", "\n", ". "):
+        pieces = unit.split(separator)
+        if len(pieces) > 1:
+            parts, current = [], ""
+            for piece in pieces:
+                candidate = f"{current}{separator}{piece}" if current else piece
+                if len(candidate) <= max_chars:
+                    current = candidate
+                    continue
+                if current:
+                    parts.append(current)
+                current = piece
+            if current:
+                parts.append(current)
+            return [p for part in parts for p in _split_oversized(part, max_chars)]
+    return [unit[i:i + max_chars] for i in range(0, len(unit), max_chars)]
+
+
+def _unit_hash(unit: str) -> str:
+    return hashlib.sha256(unit.encode("utf-8")).hexdigest()[:16]
+
+
+def _pack_units(units: List[Tuple[int, str]], max_chars: int) -> List[Tuple[str, List[int]]]:
+    """Greedily pack (index, unit) pairs into chunks; returns each chunk with the unit indexes it draws from"""
+    chunks, current, members = [], [], []
+    current_len = 0
+    for index, unit in units:
+        for piece in _split_oversized(unit, max_chars):
+            if current and current_len + len(piece) > max_chars:
+                chunks.append(("\n".join(current), members))
+                current, members, current_len = [], [], 0
+            current.append(piece)
+            current_len += len(piece) + 1
+            if not members or members[-1] != index:
+                members.append(index)
+    if current:
+        chunks.append(("\n".join(current), members))
+    return chunks
+
+
+def _unit_groups(hashes: List[str], previous_layout: Optional[List[List[str]]]) -> List[List[int]]:
+    """
+    Runs of units to pack separately: every group of the previous version's
+    layout that recurs unchanged, and the runs of new or changed units
+    between them. Without a previous layout everything is one run.
+    """
+    starts = {}
+    for group in previous_layout or []:
+        starts.setdefault(group[0], []).append(group)
+    groups, pending, i = [], [], 0
+    while i < len(hashes):
+        match = next((group for group in starts.get(hashes[i], ()) if hashes[i:i + len(group)] == group), None)
+        if match:
+            if pending:
+                groups.append(pending)
+                pending = []
+            groups.append(list(range(i, i + len(match))))
+            i += len(match)
+        else:
+            pending.append(i)
+            i += 1
+    if pending:
+        groups.append(pending)
+    return groups
+
+
+def split_into_chunks(text: str, chunk_tokens: int, page_offsets: Optional[List[int]] = None,
+                      previous_layout: Optional[List[List[str]]] = None) -> Tuple[List[str], List[List[str]]]:
+    """
+    Pack pages (or sections) into chunks of at most chunk_tokens, never
+    splitting a page unless it alone exceeds the budget. Returns the chunks
+    and their layout: the page hashes each chunk was built from. Given the
+    layout of a previous version, pages that did not change are packed
+    exactly as before, so their chunks (and cached chunk summaries) recur.
+    """
+    max_chars = tokens_to_chars(chunk_tokens)
+    units = _split_units(text, page_offsets)
+    hashes = [_unit_hash(unit) for unit in units]
+    chunks, layout = [], []
+    for group in _unit_groups(hashes, previous_layout):
+        for chunk, members in _pack_units([(i, units[i]) for i in group], max_chars):
+            chunks.append(chunk)
+            if layout and layout[-1][-1] == members[0]:
+                # A page too large for one chunk: its pieces form one layout group
+                layout[-1].extend(members[1:])
+            else:
+                layout.append(members)
+    return chunks, [[hashes[i] for i in members] for members in layout]
+
+
+def plan_chunking(total_tokens: int) -> Tuple[int, int]:
+    """
+    Choose (chunk_tokens, chunk_count) from the document's measured size.
+    The chunk count is rounded up to a multiple of the LLM concurrency so the
+    map phase keeps every slot busy, and chunk sizes snap to a coarse grid so
+    small edits to a document keep the same chunk boundaries.
+    """
+    budget = settings.summary_context_tokens
+    concurrency = max(1, settings.llm_max_concurrency)
+    count = math.ceil(total_tokens / budget)
+    count = math.ceil(count / concurrency) * concurrency
+    chunk_tokens = math.ceil(total_tokens / count / CHUNK_GRID_TOKENS) * CHUNK_GRID_TOKENS
+    chunk_tokens = max(settings.summary_min_chunk_tokens, min(budget, chunk_tokens))
+    return chunk_tokens, math.ceil(total_tokens / chunk_tokens)
+
+
+def _reduce_fanout(partials: List[str]) -> int:
+    """How many partial summaries fit in one reduce call, from their measured size"""
+    largest = max(estimate_tokens(p) for p in partials)
+    return max(2, settings.summary_context_tokens // max(1, largest))
+
+
+def _sha256(*parts) -> str:
+    return hashlib.sha256("\x00".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def summary_prompt_hash() -> str:
+    """Version of everything that shapes a summary: prompts and chunking parameters"""
+    return _sha256(SUMMARY_PROMPT, CHUNK_SUMMARY_PROMPT, REDUCE_SUMMARY_PROMPT,
+                   settings.summary_context_tokens, settings.summary_min_chunk_tokens, CHUNK_GRID_TOKENS)
+
+
+def script_prompt_hash() -> str:
+    """Scripts are derived from summaries, so their version includes the summary's"""
+    if settings.script_sections > 1:
+        return _sha256(SCRIPT_PROMPT, OUTLINE_PROMPT, SECTION_SCRIPT_PROMPT, TRANSITION_PROMPT,
+                       settings.script_sections, summary_prompt_hash())
+    return _sha256(SCRIPT_PROMPT, summary_prompt_hash())
+
+
+def generate_summary(text: str, model: str | None = None, cancel_event: threading.Event | None = None,
+                     page_offsets: Optional[List[int]] = None, usage: UsageTotals | None = None,
+                     previous_text_hash: Optional[str] = None) -> str:
     """
     Return a concise summary of the provided document text.
+    Documents larger than summary_context_tokens are summarized map-reduce:
+    page-aligned chunks are summarized concurrently, then the partial
+    summaries are combined level by level until one remains.
+    Chunk summaries are cached by chunk text. previous_text_hash names an
+    earlier version of the document: its unchanged pages are chunked as they
+    were then, so only chunks with changed pages are summarized again.
     """
-    payload = {
-        "model": model or settings.ollama_model,
-        "messages": [
-            {"role": "system", "content": "Summarize the following document:"},
-            {"role": "user",   "content": text}
-        ],
-        "stream": False
-    }
-    resp = requests.post(OLLAMA_CHAT_URL, json=payload, timeout=120)
-    resp.raise_for_status()
-    return resp.json()["message"]["content"]
+    total_tokens = estimate_tokens(text)
+    if total_tokens <= settings.summary_context_tokens:
+        return _summarize(SUMMARY_PROMPT, text, model, cancel_event, usage)
 
+    model = model or get_llm_client().model_for_stage("summary")
+    prompt_hash = summary_prompt_hash()
+    previous_layout = None
+    if previous_text_hash:
+        cached = llm_cache.lookup("chunk_layout", previous_text_hash, prompt_hash, model)
+        previous_layout = json.loads(cached) if cached else None
+    chunk_tokens, _ = plan_chunking(total_tokens)
+    chunks, layout = split_into_chunks(text, chunk_tokens, page_offsets, previous_layout)
+    llm_cache.remember("chunk_layout", llm_cache.text_sha256(text), prompt_hash, json.dumps(layout), model)
+    print(f"[SUMMARY] ~{total_tokens} tokens → {len(chunks)} chunks of ≤{chunk_tokens} tokens")
 
-def generate_podcast_script(summary: str, model: str | None = None) -> str:
+    def summarize_chunk(item) -> str:
+        index, chunk = item
+        return llm_cache.get_or_generate(
+            "chunk_summary", llm_cache.text_sha256(chunk), prompt_hash,
+            lambda: _summarize(CHUNK_SUMMARY_PROMPT, f"Part {index + 1} of {len(chunks)}:\n\n{chunk}", model, cancel_event, usage),
+            model=model,
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, settings.llm_max_concurrency)) as executor:
+        # Map: summarize every chunk concurrently
+        partials = list(executor.map(summarize_chunk, enumerate(chunks)))
+
+        # Reduce: combine neighbouring partial summaries until a single summary remains
+        level = 1
+        while len(partials) > 1:
+            fanout = _reduce_fanout(partials)
+            groups = [partials[i:i + fanout] for i in range(0, len(partials), fanout)]
+            print(f"[SUMMARY] Reduce level {level}: {len(partials)} partial summaries → {len(groups)} (fan-out {fanout})")
+            partials = list(executor.map(
+                lambda group: group[0] if len(group) == 1 else _summarize(
+                    REDUCE_SUMMARY_PROMPT,
+                    "\n\n".join(f"Part {i + 1}:\n{p}" for i, p in enumerate(group)),
+                    model, cancel_event, usage,
+                ),
+                groups,
+            ))
+            level += 1
+    return partials[0]
+
+
+def generate_podcast_script(summary: str, model: str | None = None, cancel_event: threading.Event | None = None,
+                            usage: UsageTotals | None = None) -> str:
     """
     Given a document summary, produce a conversational podcast script with
     two hosts (Host A = female, Host B = male), lasting at least five minutes.
     Each line must be prefixed with "Host A:" or "Host B:".
+    With script_sections > 1 the script is written in sections concurrently.
     """
-    prompt = (
-        "You are an AI assistant that writes clean, symbol-free podcast scripts. "
-        "You are a professional podcast host and you are writing a script for a podcast. "
-        "Create a dialogue between two hosts: Host A (female) and Host B (male). "
-        "The conversation should thoroughly cover the content of the provided summary (make sure to include all the details)"
-        "and last at least fifteen minutes when read aloud. "
-        "Do not use any special symbols or punctuation characters such as #, *, @, $, %, etc. "
-        "Use only plain, natural language. "
-        "Remember that a human will read every single word aloud, so ensure the script flows "
-        "smoothly and makes complete sense without any placeholders or markup. "
-        "You are not commenting on the summary, you are writing a script for a podcast. "
-        "This podcast is for a general audience, so do not use any technical jargon or complex words. "
-        "This podcast should help the user understand the content of the document and learn from it, don't ask any questions, just explain the content in a way that is easy to understand and engaging."
-        "Format each line exactly like this:\n"
-        "Host A: ...\n"
-        "Host B: ...\n"
-    )
+    if settings.script_sections > 1:
+        return generate_sectioned_script(summary, settings.script_sections, model, cancel_event, usage)
     messages = [
-        {"role": "system", "content": prompt},
+        {"role": "system", "content": SCRIPT_PROMPT},
         {"role": "user",   "content": f"Document summary:\n\n{summary}"}
     ]
-    payload = {
-        "model": model or settings.ollama_model,
-        "messages": messages,
-        "stream": False
-    }
-    resp = requests.post(OLLAMA_CHAT_URL, json=payload, timeout=240)
-    resp.raise_for_status()
-    return resp.json()["message"]["content"]
\ No newline at end of file
+    resp = get_llm_client().chat(messages, model=model, stage="script", cancel_event=cancel_event, usage=usage)
+    return resp["message"]["content"]
+
+
+def _script_call(system_prompt: str, user_content: str, model: str | None,
+                 cancel_event: threading.Event | None, usage: UsageTotals | None) -> str:
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user",   "content": user_content}
+    ]
+    resp = get_llm_client().chat(messages, model=model, stage="script", cancel_event=cancel_event, usage=usage)
+    return resp["message"]["content"]
+
+
+def _host_lines(text: str) -> List[str]:
+    """Keep only dialogue lines, normalized to "Host A: ..." so the TTS parser picks them up"""
+    lines = []
+    for raw in text.splitlines():
+        match = _HOST_LINE.match(raw.strip())
+        if match:
+            lines.append(f"{match.group(1)}: {match.group(2).strip()}")
+    return lines
+
+
+def _parse_outline(text: str, sections: int) -> List[str]:
+    outline = []
+    for raw in text.splitlines():
+        match = _OUTLINE_LINE.match(raw.strip())
+        if match:
+            outline.append(match.group(1).strip())
+    return outline[:sections]
+
+
+def generate_sectioned_script(summary: str, sections: int, model: str | None = None,
+                              cancel_event: threading.Event | None = None,
+                              usage: UsageTotals | None = None) -> str:
+    """
+    Write a podcast script as an outline, then the dialogue of every
+    section concurrently across the available LLM capacity, then short
+    generated transitions between neighbouring sections. Decoding many
+    shorter sections in parallel finishes well before one long script.
+    Falls back to a single call if the outline cannot be parsed.
+    """
+    outline_text = _script_call(OUTLINE_PROMPT.format(sections=sections), f"Document summary:\n\n{summary}",
+                                model, cancel_event, usage)
+    outline = _parse_outline(outline_text, sections)
+    if len(outline) < 2:
+        print(f"[SCRIPT] Outline unusable ({len(outline)} sections), writing the script in one call")
+        return _script_call(SCRIPT_PROMPT, f"Document summary:\n\n{summary}", model, cancel_event, usage)
+    print(f"[SCRIPT] Writing {len(outline)} sections concurrently")
+
+    minutes = max(2, math.ceil(SCRIPT_TARGET_MINUTES / len(outline)))
+    outline_listing = "\n".join(f"Section {i + 1}: {entry}" for i, entry in enumerate(outline))
+
+    def write_section(index: int) -> List[str]:
+        if index == 0:
+            position = "This is the first section: open the episode with a brief welcome, but do not wrap it up."
+        elif index == len(outline) - 1:
+            position = "This is the last section: do not welcome listeners again, and close the episode with a short sign-off."
+        else:
+            position = "This is a middle section: do not welcome listeners or say goodbye."
+        content = (
+            f"Document summary:\n\n{summary}\n\n"
+            f"Episode outline:\n{outline_listing}\n\n"
+            f"Write the dialogue for section {index + 1} only: {outline[index]}"
+        )
+        prompt = SECTION_SCRIPT_PROMPT.format(minutes=minutes, position=position)
+        return _host_lines(_script_call(prompt, content, model, cancel_event, usage))
+
+    def write_transition(index: int) -> List[str]:
+        before, after = parts[index], parts[index + 1]
+        if not before or not after:
+            return []
+        content = (
+            "End of the first section:\n" + "\n".join(before[-3:]) +
+            f"\n\nNext section: {outline[index + 1]}\nIt begins:\n" + "\n".join(after[:2])
+        )
+        return _host_lines(_script_call(TRANSITION_PROMPT, content, model, cancel_event, usage))
+
+    workers = max(1, min(len(outline), get_llm_client().capacity("script")))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        parts = list(executor.map(write_section, range(len(outline))))
+        transitions = list(executor.map(write_transition, range(len(outline) - 1)))
+
+    lines = []
+    for index, part in enumerate(parts):
+        lines.extend(part)
+        if index < len(transitions):
+            lines.extend(transitions[index])
+    if not lines:
+        raise ValueError("Sectioned script generation produced no dialogue")
+    return "\n".join(lines)
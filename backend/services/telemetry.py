@@ -0,0 +1,154 @@
+import bisect
+import threading
+from typing import Dict, Optional, Tuple
+
+# Histogram bucket upper bounds; the last bucket counts everything above
+TTFT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+TOKENS_PER_SEC_BUCKETS = (1.0, 2.0, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0)
+
+# Ollama reports durations in nanoseconds
+_NS = 1e9
+
+_USAGE_FIELDS = ("calls", "prompt_tokens", "eval_tokens", "load_seconds",
+                 "prompt_eval_seconds", "eval_seconds", "wall_seconds")
+
+
+class Histogram:
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def to_dict(self) -> dict:
+        labels = [f"<={bound:g}" for bound in self.bounds] + [f">{self.bounds[-1]:g}"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+        }
+
+
+class UsageTotals:
+    """
+    LLM usage accumulated over the calls made for one piece of work (a
+    podcast generation, a chat turn), by stage. Also carries the user the
+    calls are made for, so it doubles as the tag for the global counters.
+    """
+
+    def __init__(self, user_id: int = None):
+        self.user_id = user_id
+        self.stages: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, stage: str, model: str = None) -> dict:
+        entry = self.stages.setdefault(stage, {"model": model, **{field: 0 for field in _USAGE_FIELDS}})
+        if model and not entry["model"]:
+            entry["model"] = model
+        return entry
+
+    def add(self, stage: str, model: str, stats: dict):
+        with self._lock:
+            entry = self._stage(stage, model)
+            entry["calls"] += 1
+            for field in _USAGE_FIELDS[1:]:
+                entry[field] += stats.get(field) or 0
+
+    def add_wall_time(self, stage: str, seconds: float):
+        """Time spent in a non-LLM stage (e.g. TTS), so totals show where generation time goes"""
+        with self._lock:
+            self._stage(stage)["wall_seconds"] += seconds
+
+    def to_dict(self) -> Dict[str, dict]:
+        with self._lock:
+            return {stage: dict(entry) for stage, entry in self.stages.items()}
+
+
+def call_stats(response: dict, started: float, finished: float, first_token_at: Optional[float] = None) -> dict:
+    """
+    Normalize Ollama's response metadata. Time to first token is measured
+    client-side for streamed calls; for non-streamed ones it is estimated as
+    model load plus prompt evaluation.
+    """
+    load = response.get("load_duration", 0) / _NS
+    prompt_eval = response.get("prompt_eval_duration", 0) / _NS
+    eval_seconds = response.get("eval_duration", 0) / _NS
+    eval_tokens = response.get("eval_count", 0)
+    return {
+        "prompt_tokens": response.get("prompt_eval_count", 0),
+        "eval_tokens": eval_tokens,
+        "load_seconds": load,
+        "prompt_eval_seconds": prompt_eval,
+        "eval_seconds": eval_seconds,
+        "wall_seconds": finished - started,
+        "ttft_seconds": (first_token_at - started) if first_token_at is not None else load + prompt_eval,
+        "tokens_per_second": eval_tokens / eval_seconds if eval_seconds > 0 else None,
+    }
+
+
+class _Aggregate:
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.eval_tokens = 0
+        self.wall_seconds = 0.0
+        self.ttft = Histogram(TTFT_BUCKETS)
+        self.tokens_per_second = Histogram(TOKENS_PER_SEC_BUCKETS)
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "eval_tokens": self.eval_tokens,
+            "wall_seconds": self.wall_seconds,
+            "ttft_seconds": self.ttft.to_dict(),
+            "tokens_per_second": self.tokens_per_second.to_dict(),
+        }
+
+
+_by_stage_model: Dict[Tuple[str, str], _Aggregate] = {}
+_by_user: Dict[int, dict] = {}
+_lock = threading.Lock()
+
+
+def record_llm_call(stage: str, model: str, response: dict, started: float, finished: float,
+                    first_token_at: Optional[float] = None, usage: UsageTotals = None) -> dict:
+    """Fold one completed LLM call into the process-wide histograms and the caller's totals"""
+    stats = call_stats(response, started, finished, first_token_at)
+    with _lock:
+        agg = _by_stage_model.setdefault((stage, model), _Aggregate())
+        agg.calls += 1
+        agg.prompt_tokens += stats["prompt_tokens"]
+        agg.eval_tokens += stats["eval_tokens"]
+        agg.wall_seconds += stats["wall_seconds"]
+        agg.ttft.observe(stats["ttft_seconds"])
+        if stats["tokens_per_second"] is not None:
+            agg.tokens_per_second.observe(stats["tokens_per_second"])
+        if usage is not None and usage.user_id is not None:
+            user = _by_user.setdefault(usage.user_id, {"calls": 0, "prompt_tokens": 0, "eval_tokens": 0})
+            user["calls"] += 1
+            user["prompt_tokens"] += stats["prompt_tokens"]
+            user["eval_tokens"] += stats["eval_tokens"]
+    if usage is not None:
+        usage.add(stage, model, stats)
+    rate = f"{stats['tokens_per_second']:.1f} tok/s" if stats["tokens_per_second"] is not None else "n/a tok/s"
+    print(f"[LLM] {stage} on {model}: {stats['prompt_tokens']} prompt + {stats['eval_tokens']} eval tokens, "
+          f"{rate}, first token after {stats['ttft_seconds']:.2f}s, {stats['wall_seconds']:.2f}s total")
+    return stats
+
+
+def usage_snapshot() -> dict:
+    """Aggregates since process start, by stage and model, and token totals by user"""
+    with _lock:
+        return {
+            "by_stage": [
+                {"stage": stage, "model": model, **agg.to_dict()}
+                for (stage, model), agg in sorted(_by_stage_model.items())
+            ],
+            "by_user": {str(user_id): dict(totals) for user_id, totals in _by_user.items()},
+        }
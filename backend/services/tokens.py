@@ -0,0 +1,15 @@
+import math
+
+# Rough characters-per-token ratio for English text with Llama/Gemma style tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for prompt budgeting; no tokenizer round-trip"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def tokens_to_chars(tokens: int) -> int:
+    return tokens * CHARS_PER_TOKEN
@@ -9,12 +9,15 @@ import re
 import numpy as np
 import torch
 from pydub import AudioSegment
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, Future
+from difflib import SequenceMatcher
 import nemo.collections.tts as nemo_tts
 from nemo.collections.tts.models import VitsModel, FastPitchModel, HifiGanModel
 from scipy.io import wavfile
 
 from core.config import settings
+from services.file_service import podcast_master_path
+from services.jobs import JobCancelled
 
 # ---------------------------------------------------------------------------
 # Global TTS instances per GPU device
@@ -442,17 +445,16 @@ def _get_speaker_id_for_voice(voice_preset: str, model) -> int:
 # Public API: generate a podcast MP3 from a script
 # ---------------------------------------------------------------------------
 
-def synthesize_podcast_audio(user_id: int, doc_id: int, script: str) -> Tuple[str, float, List[Dict]]:
+# Pause inserted between consecutive spoken segments
+SEGMENT_PAUSE_MS = 500
+# Bump when the layout of segments (pauses, narrative handling) changes: older timings can't be spliced
+TIMING_FORMAT = 2
+
+def _parse_script_segments(script: str) -> List[Tuple[str, str, str]]:
     """
-    Generate an MP3 podcast using VITS for improved naturalness.
-    Falls back to FastPitch + HiFiGAN if VITS is unavailable.
-    Returns: (filepath, total_duration, segment_timings)
+    Split a "Host A:/Host B:" script into (speaker, text, original_line) segments.
     """
-    print(f"[TTS] Starting synthesis with VITS for improved naturalness (~{len(script)} chars)...")
-    print(f"[TTS] Voice presets - Female: '{settings.tts_voice_female}', Male: '{settings.tts_voice_male}'")
-    
-    # Parse script: extract speaker lines with original text
-    segments: List[Tuple[str, str, str]] = []  # (speaker, text, original_line)
+    segments: List[Tuple[str, str, str]] = []
     for raw in script.splitlines():
         line = raw.strip()
         if line.startswith("Host A:"):
@@ -473,56 +475,85 @@ def synthesize_podcast_audio(user_id: int, doc_id: int, script: str) -> Tuple[st
 
     if not segments:
         raise ValueError("No text segments found to synthesize")
+    return segments
 
-    # Dispatch synthesis using single GPU to ensure consistent voices
+def _submit_segments(executor: ThreadPoolExecutor, segments: List[Tuple[str, str, str]]) -> List[Tuple]:
+    """
+    Queue every spoken segment on the executor.
+    Returns (index, speaker, original_line, future) tuples; narrative lines get no future.
+    """
+    submitted = []
+    for i, (speaker, text, original_line) in enumerate(segments):
+        if speaker == "narrative":
+            # Skip narrative lines for audio but track them for timing
+            submitted.append((i, speaker, original_line, None))
+            continue
+        preset = settings.tts_voice_female if speaker == "female" else settings.tts_voice_male
+        device_str = "cuda:0"  # Use same GPU for all synthesis to ensure consistent voices
+        print(f"[TTS] Segment {i}: {speaker} speaker using preset '{preset}' on {device_str}")
+        # Use VITS for better naturalness
+        submitted.append((i, speaker, original_line, executor.submit(_synthesize_line_vits, preset, text, device_str)))
+    return submitted
+
+def _cancel_pending(submitted: List[Tuple]) -> int:
+    return sum(1 for *_, fut in submitted if fut is not None and fut.cancel())
+
+def _collect_segments(submitted: List[Tuple], cancel_event=None) -> Tuple[List[AudioSegment], List[Dict]]:
+    """
+    Wait for the submitted segments in script order and lay out their timings.
+    If cancel_event is set, pending segments are dropped and JobCancelled is raised.
+    """
     audio_chunks: List[AudioSegment] = []
     segment_timings: List[Dict] = []
     current_time = 0.0
-    
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        futures = []
-        for i, (speaker, text, original_line) in enumerate(segments):
-            if speaker == "narrative":
-                # Skip narrative lines for audio but track them for timing
-                segment_timings.append({
-                    "index": i,
-                    "text": original_line,
-                    "speaker": "narrative",
-                    "start_time": current_time,
-                    "end_time": current_time,  # No duration for narrative
-                    "duration": 0.0
-                })
-                continue
-                
-            preset = settings.tts_voice_female if speaker == "female" else settings.tts_voice_male
-            device_str = "cuda:0"  # Use same GPU for all synthesis to ensure consistent voices
-            print(f"[TTS] Segment {i}: {speaker} speaker using preset '{preset}' on {device_str}")
-            # Use VITS for better naturalness
-            futures.append((i, speaker, text, original_line, executor.submit(_synthesize_line_vits, preset, text, device_str)))
-        
-        for i, speaker, text, original_line, fut in futures:
-            audio_chunk = fut.result()
-            audio_chunks.append(audio_chunk)
-            
-            # Calculate timing for this segment
-            chunk_duration = len(audio_chunk) / 1000.0  # Convert ms to seconds
-            
+    spoken_total = sum(1 for *_, fut in submitted if fut is not None)
+
+    for i, speaker, original_line, fut in submitted:
+        if fut is None:
             segment_timings.append({
                 "index": i,
                 "text": original_line,
-                "speaker": speaker,
+                "speaker": "narrative",
                 "start_time": current_time,
-                "end_time": current_time + chunk_duration,
-                "duration": chunk_duration
+                "end_time": current_time,  # No duration for narrative
+                "duration": 0.0,
+                "timing_format": TIMING_FORMAT
             })
-            
-            current_time += chunk_duration
-            
-            # Add pause between speakers (except for last segment)
-            if i < len([s for s in segments if s[0] != "narrative"]) - 1:
-                pause_duration = 0.5  # 500ms pause
-                current_time += pause_duration
-
+            continue
+        if cancel_event is not None and cancel_event.is_set():
+            # Drop queued segments so the executor only finishes what is already running
+            cancelled = _cancel_pending(submitted)
+            print(f"[TTS] Synthesis cancelled, dropped {cancelled} pending segments")
+            raise JobCancelled("Cancelled during audio synthesis")
+        audio_chunk = fut.result()
+        audio_chunks.append(audio_chunk)
+
+        # Calculate timing for this segment
+        chunk_duration = len(audio_chunk) / 1000.0  # Convert ms to seconds
+
+        segment_timings.append({
+            "index": i,
+            "text": original_line,
+            "speaker": speaker,
+            "start_time": current_time,
+            "end_time": current_time + chunk_duration,
+            "duration": chunk_duration,
+            "timing_format": TIMING_FORMAT
+        })
+
+        current_time += chunk_duration
+
+        # Add pause between speakers (except for last segment)
+        if len(audio_chunks) < spoken_total:
+            current_time += SEGMENT_PAUSE_MS / 1000.0
+
+    return audio_chunks, segment_timings
+
+def _export_podcast(user_id: int, doc_id: int, audio_chunks: List[AudioSegment], segment_timings: List[Dict]) -> Tuple[str, float, List[Dict]]:
+    """
+    Join the synthesized chunks, post-process and write the MP3.
+    Returns: (filepath, total_duration, segment_timings)
+    """
     # Concatenate all chunks with natural transitions
     if not audio_chunks:
         raise RuntimeError("No audio chunks were generated")
@@ -530,17 +561,21 @@ def synthesize_podcast_audio(user_id: int, doc_id: int, script: str) -> Tuple[st
     podcast = audio_chunks[0]
     for chunk in audio_chunks[1:]:
         # Add a brief natural pause between speakers
-        podcast += AudioSegment.silent(duration=500) + chunk
-
-    # Apply post-processing for better quality
-    podcast = _apply_audio_post_processing(podcast)
+        podcast += AudioSegment.silent(duration=SEGMENT_PAUSE_MS) + chunk
 
-    # Save to MP3 with higher quality settings
     user_dir = Path(settings.podcast_dir) / str(user_id)
     user_dir.mkdir(parents=True, exist_ok=True)
     filename = f"{doc_id}_{int(time.time())}.mp3"
     filepath = user_dir / filename
-    
+
+    # Keep the unprocessed mix losslessly: script edits splice segments out of it,
+    # so reused audio is never post-processed or MP3-encoded twice
+    podcast.export(podcast_master_path(str(filepath)), format="flac")
+
+    # Apply post-processing for better quality
+    podcast = _apply_audio_post_processing(podcast)
+
+    # Save to MP3 with higher quality settings
     # Export with higher quality settings
     podcast.export(
         str(filepath), 
@@ -560,6 +595,117 @@ def synthesize_podcast_audio(user_id: int, doc_id: int, script: str) -> Tuple[st
 
     return str(filepath), total_duration, segment_timings
 
+def synthesize_podcast_audio(user_id: int, doc_id: int, script: str, cancel_event=None) -> Tuple[str, float, List[Dict]]:
+    """
+    Generate an MP3 podcast using VITS for improved naturalness.
+    Falls back to FastPitch + HiFiGAN if VITS is unavailable.
+    If cancel_event is set while segments are being synthesized, pending
+    segments are dropped and JobCancelled is raised.
+    Returns: (filepath, total_duration, segment_timings)
+    """
+    print(f"[TTS] Starting synthesis with VITS for improved naturalness (~{len(script)} chars)...")
+    print(f"[TTS] Voice presets - Female: '{settings.tts_voice_female}', Male: '{settings.tts_voice_male}'")
+    
+    segments = _parse_script_segments(script)
+
+    # Dispatch synthesis using single GPU to ensure consistent voices
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        submitted = _submit_segments(executor, segments)
+        audio_chunks, segment_timings = _collect_segments(submitted, cancel_event)
+
+    return _export_podcast(user_id, doc_id, audio_chunks, segment_timings)
+
+def _completed_future(result) -> Future:
+    fut = Future()
+    fut.set_result(result)
+    return fut
+
+def resynthesize_podcast_audio(user_id: int, doc_id: int, audio_path: str, old_timings: List[Dict], new_script: str) -> Tuple[str, float, List[Dict], int]:
+    """
+    Re-render a podcast after its script was edited, synthesizing only the lines
+    that were inserted or changed. Unchanged lines are cut out of the podcast's
+    lossless master at the boundaries recorded in old_timings and spliced back
+    in. Podcasts without a master, or whose timings were laid out by another
+    TIMING_FORMAT, are synthesized in full.
+    Returns: (filepath, total_duration, segment_timings, resynthesized_count)
+    """
+    master_path = podcast_master_path(audio_path)
+    if not os.path.exists(master_path) or any(t.get("timing_format") != TIMING_FORMAT for t in old_timings):
+        print("[TTS] Resynthesis: no master or older timing format, synthesizing the full script")
+        filepath, total_duration, segment_timings = synthesize_podcast_audio(user_id, doc_id, new_script)
+        spoken = len([t for t in segment_timings if t["speaker"] != "narrative"])
+        return filepath, total_duration, segment_timings, spoken
+
+    segments = _parse_script_segments(new_script)
+    old_timings = sorted(old_timings, key=lambda t: t["index"])
+    old_lines = [t["text"] for t in old_timings]
+    new_lines = [original_line for _, _, original_line in segments]
+
+    existing = AudioSegment.from_file(master_path)
+    # new segment index -> reusable audio slice taken from the old podcast
+    reused: Dict[int, AudioSegment] = {}
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            continue
+        for old_i, new_i in zip(range(i1, i2), range(j1, j2)):
+            timing = old_timings[old_i]
+            if timing["speaker"] != "narrative":
+                start_ms = int(round(timing["start_time"] * 1000))
+                end_ms = int(round(timing["end_time"] * 1000))
+                reused[new_i] = existing[start_ms:end_ms]
+
+    changed = [i for i, (speaker, _, _) in enumerate(segments) if speaker != "narrative" and i not in reused]
+    print(f"[TTS] Resynthesis: reusing {len(reused)} segments, synthesizing {len(changed)} new or changed lines")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        submitted = []
+        for i, (speaker, text, original_line) in enumerate(segments):
+            if speaker == "narrative":
+                submitted.append((i, speaker, original_line, None))
+            elif i in reused:
+                submitted.append((i, speaker, original_line, _completed_future(reused[i])))
+            else:
+                preset = settings.tts_voice_female if speaker == "female" else settings.tts_voice_male
+                submitted.append((i, speaker, original_line, executor.submit(_synthesize_line_vits, preset, text, "cuda:0")))
+        audio_chunks, segment_timings = _collect_segments(submitted)
+
+    filepath, total_duration, segment_timings = _export_podcast(user_id, doc_id, audio_chunks, segment_timings)
+    return filepath, total_duration, segment_timings, len(changed)
+
+class BatchSynthesizer:
+    """
+    One synthesis stream shared by several scripts.
+
+    Scripts are queued with submit() as soon as they are ready, so the TTS
+    workers stay busy while later scripts are still being written by the LLM.
+    finish() waits for one script's segments and exports its MP3.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._submitted: Dict[int, List[Tuple]] = {}
+
+    def submit(self, doc_id: int, script: str):
+        print(f"[TTS] Batch: queueing script for document {doc_id} (~{len(script)} chars)")
+        self._submitted[doc_id] = _submit_segments(self._executor, _parse_script_segments(script))
+
+    def finish(self, user_id: int, doc_id: int, cancel_event=None) -> Tuple[str, float, List[Dict]]:
+        submitted = self._submitted.pop(doc_id)
+        audio_chunks, segment_timings = _collect_segments(submitted, cancel_event)
+        return _export_podcast(user_id, doc_id, audio_chunks, segment_timings)
+
+    def discard(self, doc_id: int):
+        """Drop a script's queued segments, e.g. after its job was cancelled"""
+        submitted = self._submitted.pop(doc_id, None)
+        if submitted:
+            _cancel_pending(submitted)
+
+    def close(self):
+        for doc_id in list(self._submitted):
+            self.discard(doc_id)
+        self._executor.shutdown(wait=True)
+
 def _apply_audio_post_processing(audio: AudioSegment) -> AudioSegment:
     """
     Apply minimal post-processing to avoid artifacts while maintaining quality.
@@ -0,0 +1,139 @@
+"""
+Test script for request-scoped database sessions: requests and background
+jobs each use one session, and none of them leak pooled connections under load
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from fastapi import Depends, FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+
+import models.chat_session, models.llm_artifact, models.podcast_usage  # register every table
+from core.security import get_current_user
+from models.database import Base, SessionLocal, WorkerSession, get_db, worker_session
+from models.project import Project, get_projects_with_counts_for_user
+from models.user import User, get_user_by_username
+from routers import projects
+
+
+@contextmanager
+def _temporary_database():
+    """Point the session factory at a fresh SQLite file, counting pool checkouts and checkins"""
+    original_bind = SessionLocal.kw["bind"]
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'test.db')}",
+                               connect_args={"check_same_thread": False}, pool_size=5, max_overflow=10)
+        counts = {"checkout": 0, "checkin": 0, "sessions": set()}
+        lock = threading.Lock()
+
+        def counter(name):
+            def bump(*args):
+                with lock:
+                    counts[name] += 1
+            return bump
+
+        event.listen(engine.pool, "checkout", counter("checkout"))
+        event.listen(engine.pool, "checkin", counter("checkin"))
+        SessionLocal.configure(bind=engine)
+        Base.metadata.create_all(engine)
+        db = SessionLocal()
+        user = User(username="alice", password_hash="x")
+        db.add(user)
+        db.commit()
+        db.add(Project(user_id=user.id, name="Notes", description=""))
+        db.commit()
+        db.close()
+
+        def count_begin(session, transaction, connection):
+            with lock:
+                counts["sessions"].add(session)
+
+        event.listen(SessionLocal, "after_begin", count_begin)
+        try:
+            yield engine, counts
+        finally:
+            event.remove(SessionLocal, "after_begin", count_begin)
+            SessionLocal.configure(bind=original_bind)
+            engine.dispose()
+
+
+def _assert_no_leaks(engine, counts):
+    assert engine.pool.checkedout() == 0
+    assert counts["checkout"] == counts["checkin"]
+
+
+def test_one_session_per_request_under_load():
+    with _temporary_database() as (engine, counts):
+        app = FastAPI(dependencies=[Depends(get_db)])
+        app.include_router(projects.router)
+        app.dependency_overrides[get_current_user] = lambda: get_user_by_username("alice")
+        client = TestClient(app)
+
+        requests = 200
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(lambda _: client.get("/projects"), range(requests)))
+        assert all(r.status_code == 200 and len(r.json()) == 1 for r in responses)
+        # the user lookup and the project listing share the request's session
+        assert len(counts["sessions"]) == requests
+        _assert_no_leaks(engine, counts)
+
+
+def test_streamed_responses_hold_no_connection():
+    with _temporary_database() as (engine, counts):
+        app = FastAPI(dependencies=[Depends(get_db)])
+        checked_out = []
+
+        @app.get("/stream")
+        def stream():
+            user = get_user_by_username("alice")
+            projects_before = get_projects_with_counts_for_user(user.id)
+
+            def body():
+                # stands in for a chat reply streamed while the LLM answers
+                checked_out.append(engine.pool.checkedout())
+                yield f"{user.username}: {len(projects_before)}"
+            return StreamingResponse(body())
+
+        client = TestClient(app)
+        assert client.get("/stream").text == "alice: 1"
+        assert checked_out == [0]
+        _assert_no_leaks(engine, counts)
+
+
+def test_worker_sessions_are_released():
+    with _temporary_database() as (engine, counts):
+        def job(_):
+            with worker_session() as db:
+                user = get_user_by_username("alice")
+                assert user in db
+                assert len(get_projects_with_counts_for_user(user.id)) == 1
+            return not WorkerSession.registry.has()
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            assert all(pool.map(job, range(100)))
+        _assert_no_leaks(engine, counts)
+
+
+def test_helpers_outside_a_request_close_their_sessions():
+    with _temporary_database() as (engine, counts):
+        for _ in range(100):
+            user = get_user_by_username("alice")
+            assert len(get_projects_with_counts_for_user(user.id)) == 1
+        _assert_no_leaks(engine, counts)
+
+
+if __name__ == "__main__":
+    test_one_session_per_request_under_load()
+    test_streamed_responses_hold_no_connection()
+    test_worker_sessions_are_released()
+    test_helpers_outside_a_request_close_their_sessions()
+    print("✅ Database session tests passed")
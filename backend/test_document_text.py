@@ -0,0 +1,59 @@
+"""
+Test script for random-access reads of stored document text
+"""
+
+import sys
+sys.path.append('.')
+
+import os
+import random
+import tempfile
+
+from services.document_text import DocumentText, build_char_index
+
+
+def _store(directory: str, text: str, page_offsets=None, step: int = 7) -> DocumentText:
+    path = os.path.join(directory, "doc.txt")
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+    meta = {"chars": len(text), "page_offsets": page_offsets,
+            "char_index_step": step, "byte_offsets": build_char_index(text, step)}
+    return DocumentText(path, meta)
+
+
+def test_slices_match_str_with_multibyte_text():
+    rng = random.Random(7)
+    alphabet = "abc \n\r" + "é—ß" + "漢字" + "🎙"
+    text = "".join(rng.choice(alphabet) for _ in range(500))
+    with tempfile.TemporaryDirectory() as tmp, _store(tmp, text) as doc_text:
+        assert len(doc_text) == len(text)
+        for _ in range(300):
+            a, b = sorted(rng.randrange(-5, len(text) + 5) for _ in range(2))
+            assert doc_text[a:b] == text[a:b]
+        assert doc_text[:] == text
+        lines = text.split("\n")
+        assert list(doc_text.iter_lines()) == (lines[:-1] if text.endswith("\n") else lines)
+
+
+def test_page_ranges():
+    pages = ["first page\n", "zweite Seite ü\n", "third\n"]
+    offsets = [0, len(pages[0]), len(pages[0]) + len(pages[1])]
+    with tempfile.TemporaryDirectory() as tmp, _store(tmp, "".join(pages), offsets) as doc_text:
+        assert doc_text.page_count == 3
+        assert doc_text.pages(1, 2) == pages[1]
+        assert doc_text.pages(1, 10) == pages[1] + pages[2]
+        assert doc_text.pages(5, 6) == ""
+
+
+def test_empty_text():
+    with tempfile.TemporaryDirectory() as tmp, _store(tmp, "") as doc_text:
+        assert len(doc_text) == 0
+        assert doc_text[0:10] == ""
+        assert list(doc_text.iter_lines()) == []
+
+
+if __name__ == "__main__":
+    test_slices_match_str_with_multibyte_text()
+    test_page_ranges()
+    test_empty_text()
+    print("✅ Document text tests passed")
@@ -0,0 +1,163 @@
+"""
+Test script for the shared LLM client against a local fake Ollama server
+"""
+
+import sys
+sys.path.append('.')
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.config import settings
+from services.llm_client import LLMClient, LLMEndpoint, LLMError
+
+
+class FakeOllama(BaseHTTPRequestHandler):
+    """Answers /api/chat like Ollama; fails the first `fail_first` requests with `fail_status`"""
+
+    fail_first = 0
+    fail_status = 503
+    requests_seen = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        with FakeOllama.lock:
+            FakeOllama.requests_seen += 1
+            seen = FakeOllama.requests_seen
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+        if seen <= FakeOllama.fail_first:
+            self.send_response(FakeOllama.fail_status)
+            self.end_headers()
+            return
+
+        words = ["Hello", " from", " fake", " Ollama"]
+        stats = {"done": True, "prompt_eval_count": 12, "eval_count": len(words)}
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        if body.get("stream"):
+            for word in words:
+                self.wfile.write((json.dumps({"message": {"role": "assistant", "content": word}, "done": False}) + "\n").encode())
+            self.wfile.write((json.dumps({"message": {"role": "assistant", "content": ""}, **stats}) + "\n").encode())
+        else:
+            self.wfile.write(json.dumps({"message": {"role": "assistant", "content": "".join(words)}, **stats}).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_ollama(fail_first: int = 0, fail_status: int = 503):
+    FakeOllama.fail_first = fail_first
+    FakeOllama.fail_status = fail_status
+    FakeOllama.requests_seen = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllama)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_llm_client():
+    """Exercise sync, streaming, async and retry paths of LLMClient"""
+
+    print("🔍 Testing LLM client against fake Ollama...")
+    messages = [{"role": "user", "content": "hi"}]
+
+    server, url = start_fake_ollama()
+    try:
+        client = LLMClient(base_url=url, max_retries=0)
+        resp = client.chat(messages)
+        assert resp["message"]["content"] == "Hello from fake Ollama", resp
+        print("✅ Sync chat")
+
+        resp = client.chat(messages, cancel_event=threading.Event())
+        assert resp["message"]["content"] == "Hello from fake Ollama", resp
+        assert resp["eval_count"] == 4, resp
+        print("✅ Streamed chat with cancel support")
+
+        async def run_async():
+            full = await client.achat(messages)
+            parts = [chunk["message"]["content"] async for chunk in client.astream_chat(messages)]
+            return full, parts
+
+        full, parts = asyncio.run(run_async())
+        assert full["message"]["content"] == "Hello from fake Ollama", full
+        assert "".join(parts) == "Hello from fake Ollama", parts
+        print("✅ Async chat and stream")
+    finally:
+        server.shutdown()
+
+    server, url = start_fake_ollama(fail_first=2)
+    try:
+        client = LLMClient(base_url=url, max_retries=2, retry_backoff=0.01)
+        resp = client.chat(messages)
+        assert resp["message"]["content"] == "Hello from fake Ollama", resp
+        assert FakeOllama.requests_seen == 3, FakeOllama.requests_seen
+        print("✅ Retries on 503")
+    finally:
+        server.shutdown()
+
+    for status in (400, 500):
+        server, url = start_fake_ollama(fail_first=3, fail_status=status)
+        try:
+            endpoint = LLMEndpoint(url, max_concurrency=2)
+            client = LLMClient(endpoints=[endpoint], max_retries=2, retry_backoff=0.01)
+
+            async def run_failing():
+                for _ in range(3):
+                    try:
+                        await client.achat(messages)
+                        assert False, f"expected {status} to fail"
+                    except LLMError:
+                        pass
+                return endpoint.async_slots._value
+
+            free_slots = asyncio.run(run_failing())
+            assert FakeOllama.requests_seen == 3, FakeOllama.requests_seen
+            assert endpoint.outstanding == 0, endpoint.to_dict()
+            assert free_slots == 2, free_slots
+        finally:
+            server.shutdown()
+    print("✅ Non-retryable errors release their endpoint slot once")
+
+    server, url = start_fake_ollama()
+    health_interval = settings.llm_health_interval
+    try:
+        settings.llm_health_interval = 0
+        dead = LLMEndpoint("http://127.0.0.1:9", stages=["chat"])  # nothing listens on the discard port
+        live = LLMEndpoint(url, stages=["chat"])
+        scripts = LLMEndpoint(url, stages=["script"], model="big-model")
+        client = LLMClient(endpoints=[dead, live, scripts], max_retries=1, retry_backoff=0.01)
+        # Ties between idle endpoints break randomly, so keep going until the dead one has been hit enough
+        for _ in range(50):
+            resp = client.chat(messages)
+            assert resp["message"]["content"] == "Hello from fake Ollama", resp
+            if dead.opened_at is not None:
+                break
+        assert dead.opened_at is not None, dead.to_dict()
+        assert live.outstanding == 0 and live.opened_at is None, live.to_dict()
+        assert client.model_for_stage("script") == "big-model"
+        print("✅ Fails over to a healthy endpoint and opens the dead one's circuit")
+
+        client = LLMClient(endpoints=[LLMEndpoint("http://127.0.0.1:9")], max_retries=0)
+        for _ in range(settings.llm_breaker_threshold):
+            try:
+                client.chat(messages)
+            except LLMError:
+                pass
+        try:
+            client.chat(messages)
+            assert False, "expected the open circuit to fail fast"
+        except LLMError as e:
+            assert "No healthy LLM endpoint" in str(e), e
+        print("✅ Fails fast when every circuit is open")
+    finally:
+        settings.llm_health_interval = health_interval
+        server.shutdown()
+
+    print("\n✅ All LLM client tests passed!")
+
+
+if __name__ == "__main__":
+    test_llm_client()
@@ -0,0 +1,86 @@
+"""
+Test script for the text cleanup heuristics: running headers and footers,
+page numbers, line-break hyphenation and trailing references
+"""
+
+import sys
+sys.path.append('.')
+
+from services.extraction import _join_normalized, clean_text
+
+
+def _paged(pages):
+    return _join_normalized(pages)
+
+
+def _pages(text, offsets):
+    bounds = list(offsets) + [len(text)]
+    return [text[bounds[i]:bounds[i + 1]] for i in range(len(offsets))]
+
+
+def test_hyphenation():
+    text, _ = clean_text("A well-\nknown result needs infor-\nmation and so-\ncalled care.")
+    assert text == "A well-known result needs information and so-called care.", text
+
+    # the document's own spelling decides over the compound-head list
+    text, _ = clean_text("Self-\ncontained parts. Co-\noperation and cooperation differ from co-operation.")
+    assert text.startswith("Self-contained parts. Co-operation"), text
+
+    text, _ = clean_text("Use decision-making and decision-\nmaking alike; a docu-\nment stands.")
+    assert "decision-making alike" in text and "a document stands" in text, text
+
+
+def test_running_lines_and_page_numbers():
+    body = ["Intro to the topic.", "More about methods.", "Results and tables.", "Discussion here.", "The end."]
+    pages = [f"Journal of Examples, Vol. 3\n{line}\n{i + 11}\n" for i, line in enumerate(body)]
+    text, offsets = clean_text(*_paged(pages))
+    assert _pages(text, offsets) == [line + "\n" for line in body], _pages(text, offsets)
+
+
+def test_numeric_content_at_page_edges_is_kept():
+    # years and table values at a page edge don't follow the page sequence
+    edges = ["1999", "42", "2001", "7", "1999"]
+    pages = [f"Heading {i}\nbody text {i}\n{value}\n" for i, value in enumerate(edges)]
+    text, offsets = clean_text(*_paged(pages))
+    assert [page.split("\n")[-2] for page in _pages(text, offsets)] == edges, text
+
+
+def test_short_documents_are_left_alone():
+    pages = ["Running title\nFirst page.\n1\n", "Running title\nSecond page.\n2\n"]
+    text, offsets = clean_text(*_paged(pages))
+    assert _pages(text, offsets) == pages, text
+
+
+def test_page_offsets_stay_exact():
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta"]
+    pages = [f"Header line\n{word.title()} has a hyphen-\nated {word}  and   spaces.\n\n\n\nDone with {word}.\n- {i + 1} -\n"
+             for i, word in enumerate(words)]
+    text, offsets = clean_text(*_paged(pages))
+    assert len(offsets) == len(pages) and offsets[0] == 0
+    for word, page in zip(words, _pages(text, offsets)):
+        assert page == f"{word.title()} has a hyphenated {word} and spaces.\n\nDone with {word}.\n", page
+
+
+def test_drop_references():
+    body = "Findings.\n" * 20
+    text, _ = clean_text(body + "References\n[1] A. Author. A paper.\n", drop_references=True)
+    assert text == body, text
+
+    # a "References" heading early on is a section, not the bibliography
+    early = "References\nare discussed below.\n" + body
+    text, _ = clean_text(early, drop_references=True)
+    assert text == early, text
+
+    pages = ["Findings one.\n" * 5, "Findings two.\n" * 5, "Bibliography\n[1] Someone.\n"]
+    text, offsets = clean_text(*_paged(pages), drop_references=True)
+    assert text == pages[0] + pages[1] and offsets[-1] == len(text), (text, offsets)
+
+
+if __name__ == "__main__":
+    test_hyphenation()
+    test_running_lines_and_page_numbers()
+    test_numeric_content_at_page_edges_is_kept()
+    test_short_documents_are_left_alone()
+    test_page_offsets_stay_exact()
+    test_drop_references()
+    print("✅ Text cleanup tests passed")